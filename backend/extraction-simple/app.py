@@ -8,13 +8,15 @@ from extraction_router import router as router_extraction
 from dataset_router import router as router_dataset
 from utils import create_all
 from services import DatasetService
-from utils import get_dataset_service, get_datasets
+from utils import get_dataset_service, get_datasets, extraction_job_runner
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_all()
+    await extraction_job_runner.start()
     yield
+    await extraction_job_runner.stop()
 
 app: FastAPI = FastAPI(
     lifespan=lifespan
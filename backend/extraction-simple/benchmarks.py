@@ -0,0 +1,162 @@
+import os
+
+# Benchmarks never touch the real API; set before extensions builds the client
+os.environ.setdefault("YOUTUBE_CLIENT", "fake")
+
+import argparse
+import asyncio
+import time
+import uuid
+from db import SessionLocal, VideoExtraction
+from extensions import youtube, new_youtube_client, youtube_cache
+from fake_youtube import FakeYouTube
+from models import DatasetCreate, DatasetRead, VideoCreate, ExtractionResponse
+from schemas import VideoExtractionFailure
+from services import DatasetService, VideoService, TimestampsExtractionService
+from utils import create_all
+from parser_corpus import LABELLED_DESCRIPTIONS, build_corpus
+from timestamp_parser import parse_description
+from extraction_utils import extract_timestamps
+
+
+def require_fake_client() -> FakeYouTube:
+    if not isinstance(youtube, FakeYouTube):
+        raise SystemExit("Benchmarks need YOUTUBE_CLIENT=fake")
+    return youtube
+
+
+async def benchmark_playlist(args: argparse.Namespace):
+    fake: FakeYouTube = require_fake_client()
+    fake.latency = args.latency
+    fake.missing_rate = args.missing_rate
+    fake.error_rate = args.error_rate
+    create_all()
+    with SessionLocal() as db:
+        dataset: DatasetRead = await DatasetService(db).create_dataset(
+            DatasetCreate(name=f"benchmark-{uuid.uuid4().hex[:8]}", description="Playlist extraction benchmark")
+        )
+        playlist_id: str | None = None
+        for concurrency in args.concurrency:
+            # A fresh playlist per run, so no run finds the previous run's rows or cache entries
+            playlist_id = f"PL{uuid.uuid4().hex[:12]}-{args.videos}"
+            await run_playlist(db, fake, playlist_id, dataset.id, concurrency, label=f"concurrency={concurrency:<3}")
+        if args.rerun and playlist_id:
+            # Same playlist again through a new request: everything should come from the cache
+            await run_playlist(db, fake, playlist_id, dataset.id, args.concurrency[-1], label="rerun          ")
+    print(f"cache: {youtube_cache.stats()}")
+
+
+async def run_playlist(db, fake: FakeYouTube, playlist_id: str, dataset_id: str, concurrency: int, label: str):
+    service = TimestampsExtractionService(db, new_youtube_client(), VideoService(db))
+    calls_before: int = fake.calls
+    started: float = time.perf_counter()
+    results = await service.extract_playlist_timestamps(playlist_id, dataset_id, concurrency=concurrency)
+    elapsed: float = time.perf_counter() - started
+    failures: int = sum(isinstance(result, VideoExtractionFailure) for result in results)
+    print(
+        f"{label} videos={len(results)} failures={failures} "
+        f"api_calls={fake.calls - calls_before} seconds={elapsed:.2f} videos/s={len(results) / elapsed:.1f}"
+    )
+
+
+async def benchmark_parser(args: argparse.Namespace):
+    expected_segments: int = 0
+    found_segments: int = 0
+    correct_segments: int = 0
+    exact: int = 0
+    for case in LABELLED_DESCRIPTIONS:
+        expected: set[tuple] = set(case["expected"])
+        found: set[tuple] = {(segment.start, segment.end, segment.title) for segment in parse_description(case["description"])}
+        expected_segments += len(expected)
+        found_segments += len(found)
+        correct_segments += len(expected & found)
+        exact += expected == found
+    print(
+        f"accuracy: descriptions={exact}/{len(LABELLED_DESCRIPTIONS)} "
+        f"precision={correct_segments / max(found_segments, 1):.3f} recall={correct_segments / max(expected_segments, 1):.3f}"
+    )
+
+    corpus: list[str] = build_corpus(args.descriptions)
+    started: float = time.perf_counter()
+    for description in corpus:
+        parse_description(description)
+    elapsed: float = time.perf_counter() - started
+    print(f"throughput: descriptions={len(corpus)} seconds={elapsed:.2f} descriptions/s={len(corpus) / elapsed:.0f}")
+
+
+async def benchmark_upsert(args: argparse.Namespace):
+    create_all()
+    corpus: list[str] = build_corpus(args.videos)
+    with SessionLocal() as db:
+        dataset: DatasetRead = await DatasetService(db).create_dataset(
+            DatasetCreate(name=f"benchmark-{uuid.uuid4().hex[:8]}", description="Bulk upsert benchmark")
+        )
+        video_service = VideoService(db)
+
+        def make_rows(prefix: str) -> list[tuple[VideoCreate, ExtractionResponse]]:
+            rows: list[tuple[VideoCreate, ExtractionResponse]] = []
+            for index, description in enumerate(corpus):
+                video_id: str = f"{prefix}-{index}"
+                rows.append((
+                    VideoCreate(id=video_id, title=f"Video {index}", description=description),
+                    ExtractionResponse(video_id=video_id, title=f"Video {index}", timestamps=extract_timestamps(description), thumbnail_url=""),
+                ))
+            return rows
+
+        # Bulk path, committed once per batch the way playlist extraction writes
+        rows = make_rows(f"bulk{uuid.uuid4().hex[:8]}")
+        started: float = time.perf_counter()
+        for start in range(0, len(rows), args.batch_size):
+            batch = rows[start:start + args.batch_size]
+            await video_service.create_many([video for video, _ in batch], commit=False)
+            await video_service.upsert_extractions([extraction for _, extraction in batch], dataset.id, commit=False)
+            db.commit()
+        elapsed: float = time.perf_counter() - started
+        print(f"bulk:    videos={len(rows)} batch_size={args.batch_size} seconds={elapsed:.2f} rows/s={2 * len(rows) / elapsed:.0f}")
+
+        if args.baseline:
+            # The row-at-a-time path: add, commit and refresh per video, then a commit per extraction
+            rows = make_rows(f"row{uuid.uuid4().hex[:8]}")
+            started = time.perf_counter()
+            for video, extraction in rows:
+                await video_service.create(video)
+                db.add(VideoExtraction(
+                    id=extraction.video_id,
+                    video_id=extraction.video_id,
+                    dataset_id=dataset.id,
+                    timestamps={"timestamps": [timestamp.model_dump() for timestamp in extraction.timestamps]},
+                ))
+                db.commit()
+            elapsed = time.perf_counter() - started
+            print(f"per-row: videos={len(rows)} seconds={elapsed:.2f} rows/s={2 * len(rows) / elapsed:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extraction benchmarks against the fake YouTube client")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    playlist_parser = subparsers.add_parser("playlist", help="Extract one playlist at several concurrency limits")
+    playlist_parser.add_argument("--videos", type=int, default=300)
+    playlist_parser.add_argument("--latency", type=float, default=0.2)
+    playlist_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 16])
+    playlist_parser.add_argument("--rerun", action="store_true", help="Extract the last playlist a second time")
+    playlist_parser.add_argument("--missing-rate", type=float, default=0.0, help="Share of videos YouTube does not return")
+    playlist_parser.add_argument("--error-rate", type=float, default=0.0, help="Share of videos.list requests that fail")
+    playlist_parser.set_defaults(handler=benchmark_playlist)
+
+    parser_parser = subparsers.add_parser("parser", help="Timestamp parser accuracy and throughput")
+    parser_parser.add_argument("--descriptions", type=int, default=100_000)
+    parser_parser.set_defaults(handler=benchmark_parser)
+
+    upsert_parser = subparsers.add_parser("upsert", help="Rows per second writing videos and extractions")
+    upsert_parser.add_argument("--videos", type=int, default=5000)
+    upsert_parser.add_argument("--batch-size", type=int, default=50)
+    upsert_parser.add_argument("--baseline", action="store_true", help="Also time the row-at-a-time path")
+    upsert_parser.set_defaults(handler=benchmark_upsert)
+
+    args = parser.parse_args()
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
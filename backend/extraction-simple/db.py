@@ -1,4 +1,4 @@
-from sqlalchemy import String, create_engine, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import String, create_engine, DateTime, Boolean, Text, ForeignKey, Integer
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 from datetime import datetime, timezone
 from sqlalchemy.orm import relationship
@@ -71,4 +71,50 @@ class VideoExtraction(Base):
         # JSONB performance requires a GIN index
         Index("ix_video_extractions_timestamps", "timestamps", postgresql_using="gin"),
     )
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.now(timezone.utc))
\ No newline at end of file
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.now(timezone.utc))
+
+class YouTubeCacheEntry(Base):
+    # Renamed from youtube_cache, which held pickled payloads; that table can be dropped
+    __tablename__ = "youtube_response_cache"
+    # "<resource>:<id>", e.g. "video:dQw4w9WgXcQ" or "playlist_items:PL..."
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    etag: Mapped[str] = mapped_column(String(255), nullable=True)
+    # tubectrl response as JSON, validated back into its model on read
+    payload: Mapped[str] = mapped_column(Text)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+class ExtractionJob(Base):
+    __tablename__ = "extraction_jobs"
+    id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    channel_id: Mapped[str] = mapped_column(String(255))
+    dataset_id: Mapped[str] = mapped_column(String(255), ForeignKey("datasets.id"))
+    # pending -> running -> completed | failed; a running job whose heartbeat (updated_at)
+    # has gone stale belongs to a crashed worker and is picked up again
+    status: Mapped[str] = mapped_column(String(20), default="pending")
+    # Set once every page of the channel's playlists has been recorded below
+    playlists_listed: Mapped[bool] = mapped_column(Boolean, default=False)
+    total_playlists: Mapped[int] = mapped_column(Integer, default=0)
+    done_playlists: Mapped[int] = mapped_column(Integer, default=0)
+    failed_playlists: Mapped[int] = mapped_column(Integer, default=0)
+    total_videos: Mapped[int] = mapped_column(Integer, default=0)
+    failed_videos: Mapped[int] = mapped_column(Integer, default=0)
+    error: Mapped[str] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ix_extraction_jobs_status", "status", "updated_at"),
+    )
+
+class ExtractionJobPlaylist(Base):
+    __tablename__ = "extraction_job_playlists"
+    # One row per playlist of a job: the checkpoint a resumed job continues from
+    job_id: Mapped[str] = mapped_column(String(255), ForeignKey("extraction_jobs.id"), primary_key=True)
+    playlist_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    title: Mapped[str] = mapped_column(Text, nullable=True)
+    status: Mapped[str] = mapped_column(String(20), default="pending")
+    videos: Mapped[int] = mapped_column(Integer, default=0)
+    failed_videos: Mapped[int] = mapped_column(Integer, default=0)
+    results: Mapped[list] = mapped_column(JSONB, default=list, server_default="[]")
+    error: Mapped[str] = mapped_column(Text, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
@@ -1,6 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
 from tubectrl import YouTube
+from fake_youtube import FakeYouTube, FAKE_CACHE_MODELS
+from youtube_client import CachedYouTube, CountingYouTube, YouTubeCache, CACHE_MODELS
+import os
 
 
 credentials_path: str = "/home/lyle/.youtube/credentials.json"
-youtube = YouTube()
-youtube.authenticate_from_credentials(credentials_path=credentials_path)
\ No newline at end of file
+# YOUTUBE_CLIENT=fake swaps in a local client with injected latency for benchmarks and offline runs
+if os.environ.get("YOUTUBE_CLIENT") == "fake":
+    youtube = FakeYouTube(
+        latency=float(os.environ.get("FAKE_YOUTUBE_LATENCY", "0.2")),
+        missing_rate=float(os.environ.get("FAKE_YOUTUBE_MISSING_RATE", "0")),
+        error_rate=float(os.environ.get("FAKE_YOUTUBE_ERROR_RATE", "0")),
+    )
+else:
+    youtube = YouTube()
+    youtube.authenticate_from_credentials(credentials_path=credentials_path)
+
+# tubectrl is blocking, so its calls run here instead of on the event loop
+youtube_executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=int(os.environ.get("YOUTUBE_WORKERS", "16")))
+
+youtube_cache: YouTubeCache = YouTubeCache(models=FAKE_CACHE_MODELS if isinstance(youtube, FakeYouTube) else CACHE_MODELS)
+
+def new_youtube_client() -> CachedYouTube:
+    # One per request or job: its memo and call count must not leak into the next one
+    return CachedYouTube(CountingYouTube(youtube), youtube_cache)
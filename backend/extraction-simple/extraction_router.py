@@ -1,7 +1,12 @@
-from fastapi import APIRouter, Request, Depends
+import json
+from fastapi import APIRouter, Request, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from schemas import VideoExtractionRequest, PlaylistExtractionRequest, ChannelExtractionRequest
-from utils import get_timestamps_extraction_service
-from services import TimestampsExtractionService
+from utils import get_timestamps_extraction_service, get_extraction_job_service, get_youtube
+from services import TimestampsExtractionService, ExtractionJobService, VideoService
+from extensions import youtube_cache
+from youtube_client import CachedYouTube
+from db import SessionLocal
 
 
 router = APIRouter(
@@ -16,16 +21,60 @@ async def extract_playlist_timestamps(
     r = await timestamps_extraction_service.extract_playlist_timestamps(extraction_request.url, extraction_request.dataset)
     return r
 
-@router.post("/extraction/channel")
+@router.post("/extraction/playlist/stream")
+async def stream_playlist_timestamps(
+    extraction_request: PlaylistExtractionRequest,
+    youtube: CachedYouTube = Depends(get_youtube)
+    ):
+    # One JSON line per video as soon as it is extracted. The response outlives the request's
+    # dependencies, so the stream opens its own session.
+    async def stream():
+        with SessionLocal() as db:
+            service = TimestampsExtractionService(db, youtube, VideoService(db))
+            async for result in service.stream_playlist_timestamps(extraction_request.url, extraction_request.dataset):
+                yield result.model_dump_json() + "\n"
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.post("/extraction/channel/stream")
+async def stream_channel_timestamps(
+    extraction_request: ChannelExtractionRequest,
+    youtube: CachedYouTube = Depends(get_youtube)
+    ):
+    async def stream():
+        with SessionLocal() as db:
+            service = TimestampsExtractionService(db, youtube, VideoService(db))
+            async for playlist_id, result in service.stream_channel_timestamps(extraction_request.id, extraction_request.dataset):
+                yield json.dumps({"playlist_id": playlist_id, **result.model_dump()}) + "\n"
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.post("/extraction/channel", status_code=status.HTTP_202_ACCEPTED)
 async def extract_channel_timestamps(extraction_request: ChannelExtractionRequest,
-                                     timestamps_extraction_service: TimestampsExtractionService = Depends(get_timestamps_extraction_service)
+                                     extraction_job_service: ExtractionJobService = Depends(get_extraction_job_service)
         ):
-    r = await timestamps_extraction_service.extract_channel_timestamps(extraction_request.id, extraction_request.dataset)
-    return r
+    # A channel can hold thousands of videos: queue a job and let the client poll it
+    return await extraction_job_service.create_channel_job(extraction_request.id, extraction_request.dataset)
+
+@router.get("/extraction/jobs/{id}")
+async def get_extraction_job(id: str, extraction_job_service: ExtractionJobService = Depends(get_extraction_job_service)):
+    job = await extraction_job_service.get_job(id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+@router.get("/extraction/jobs/{id}/result")
+async def get_extraction_job_result(id: str, extraction_job_service: ExtractionJobService = Depends(get_extraction_job_service)):
+    result = await extraction_job_service.get_job_result(id)
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return result
 
 @router.post("/extraction/video")
 async def find_video(
     extraction_request: VideoExtractionRequest,
     timestamps_extraction_service: TimestampsExtractionService = Depends(get_timestamps_extraction_service)
     ):
-    return await timestamps_extraction_service.find_video(extraction_request.url, extraction_request.dataset)
\ No newline at end of file
+    return await timestamps_extraction_service.find_video(extraction_request.url, extraction_request.dataset)
+
+@router.get("/extraction/cache")
+async def get_youtube_cache_stats():
+    return youtube_cache.stats()
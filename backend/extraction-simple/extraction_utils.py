@@ -1,14 +1,21 @@
-from typing import Iterator
+from typing import AsyncIterator, Iterator
 
 from tubectrl import YouTube
 from tubectrl.models import Video, PlaylistItem
-from tubectrl.models.playlist import Playlist
 from schemas import FindVideoResponse
 from db import Video as VideoInDb
 from models import ExtractionResponse, Timestamp, Timestamps, VideoCreate, PlaylistCreate
-import re
+from pipeline import run_youtube, iterate_in_thread
+from timestamp_parser import parse_description, format_seconds
 import os
 import json
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# videos.list accepts at most 50 ids per request
+VIDEOS_BATCH_SIZE: int = 50
 
 
 def parse_video_id(url: str) -> str:
@@ -30,44 +37,60 @@ def parse_playlist_id(url: str) -> str:
 def preprocess_video(video_url: str, youtube: YouTube) -> VideoCreate:
     video_id: str = parse_video_id(video_url)
     video: Video = find_video(video_id, youtube)
+    return video_create_from_video(video_id, video)
+
+def video_create_from_video(video_id: str, video: Video) -> VideoCreate:
     title: str = video.snippet.title or ''
     description: str = get_video_description(video=video) or ''
     return VideoCreate(id=video_id, title=title, description=description)
 
-def preprocess_playlist(playlist_url: str, youtube: YouTube) -> list[VideoCreate]:
+def preprocess_playlist(playlist_url: str, youtube: YouTube) -> Iterator[VideoCreate]:
+    # Lazy: pages are requested as the caller consumes the items
     playlist_id: str = parse_playlist_id(playlist_url)
-    playlist_items: list[PlaylistItem] = find_playlist_items(playlist_id, youtube)
-    items: list[VideoCreate] = []
-    for l in playlist_items:
+    for l in find_playlist_items(playlist_id, youtube):
         for item in l:
-            items.append(VideoCreate(
-            id=item.snippet.resourceId.videoId,
-            title=item.snippet.title or '',
-            description=item.snippet.description or ''
-        ))
-    return items
+            yield VideoCreate(
+                id=item.snippet.resourceId.videoId,
+                title=item.snippet.title or '',
+                description=item.snippet.description or ''
+            )
+
+async def stream_playlist_video_ids(playlist_url: str, youtube: YouTube) -> AsyncIterator[str]:
+    # Each video once, in playlist order, as soon as its page has arrived
+    playlist_id: str = parse_playlist_id(playlist_url)
+    seen: set[str] = set()
+    async for page in iterate_in_thread(lambda: find_playlist_items(playlist_id, youtube)):
+        for item in page:
+            video_id: str = item.snippet.resourceId.videoId
+            if video_id not in seen:
+                seen.add(video_id)
+                yield video_id
 
 
 def find_video(video_id: str, youtube: YouTube) -> Video:
     video: Video = youtube.find_video_by_id(video_id=video_id)
     return video
 
-def find_playlist_items(playlist_id: str, youtube: YouTube) -> Playlist:
-    playlist_items: list[PlaylistItem] = youtube.get_playlist_items_iterator(playlist_id=playlist_id)
-    return list(playlist_items)
+def find_videos_batch(video_ids: list[str], youtube: YouTube) -> list[Video]:
+    # One videos.list request for up to VIDEOS_BATCH_SIZE ids
+    videos: list[Video] = youtube.find_videos_by_ids(video_ids=video_ids)
+    return list(videos)
 
-async def find_channel_playlists(channel_id: str, youtube: YouTube) -> list[PlaylistCreate]:
-    playlists_lists: Iterator[Playlist] = youtube.get_channel_playlists_iterator(channel_id=channel_id)
-    playlist_creates: list[PlaylistCreate] = []
-    for playlist_list in list(playlists_lists)[:1]:
-        # print(playlist_list)
+def find_playlist_items(playlist_id: str, youtube: YouTube) -> Iterator[list[PlaylistItem]]:
+    playlist_items: Iterator[list[PlaylistItem]] = youtube.get_playlist_items_iterator(playlist_id=playlist_id)
+    return playlist_items
+
+async def stream_channel_playlists(channel_id: str, youtube: YouTube) -> AsyncIterator[PlaylistCreate]:
+    async for playlist_list in iterate_in_thread(lambda: youtube.get_channel_playlists_iterator(channel_id=channel_id)):
         for playlist in playlist_list:
-            playlist_creates.append(PlaylistCreate(
+            yield PlaylistCreate(
                 id=playlist.id,
                 title=playlist.snippet.title or '',
                 description=playlist.snippet.description or ''
-            ))
-    return playlist_creates
+            )
+
+async def find_channel_playlists(channel_id: str, youtube: YouTube) -> list[PlaylistCreate]:
+    return [playlist async for playlist in stream_channel_playlists(channel_id, youtube)]
 
 def parse_video_thumbnails(video: Video) -> str:
     for resolution in ["default", "high", "medium", "standard"]:
@@ -81,28 +104,11 @@ def get_video_description(video: Video) -> str:
     description: str = video.snippet.description
     return description
 
-def post_process_title(title: str) -> str:
-    title: str = re.sub(r"-", "", title)
-    title = title.strip()
-    return title
-
-
-def get_timestamp_and_title(match_group: tuple) -> Timestamp:
-    title: str = match_group[2]
-    title = post_process_title(title=title)
-    timestamp: str = match_group[0] + match_group[1]
-    return Timestamp(title=title, timestamp=timestamp)
-
-
 def extract_timestamps(description: str) -> list[Timestamp]:
-    timestamps: list[Timestamp] = []
-    pattern = r"(\d+:)+(\d+)(.+)"
-    pattern_compiled = re.compile(pattern)
-    matches = re.finditer(pattern_compiled, description)
-    for match in matches:
-        timestamp: Timestamp = get_timestamp_and_title(match.groups())
-        timestamps.append(timestamp)
-    return timestamps
+    return [
+        Timestamp(title=segment.title, timestamp=format_seconds(segment.start), start=segment.start, end=segment.end)
+        for segment in parse_description(description)
+    ]
 
 def save_extraction_response(extraction_response: ExtractionResponse):
     file_name: str = os.path.join("data", f"{extraction_response.video_id}.json")
@@ -133,25 +139,22 @@ def format_extraction_response(extraction_response: ExtractionResponse) -> str:
 
 async def extract_video_timestamps(video_url: str, youtube: YouTube):
     video_id: str = parse_video_id(video_url)
-    video: Video = find_video(video_id=video_id, youtube=youtube)
+    video: Video = await run_youtube(find_video, video_id=video_id, youtube=youtube)
     # print(video)
+    return build_extraction_response(video_id, video)
+
+def build_extraction_response(video_id: str, video: Video) -> ExtractionResponse:
     description: str = get_video_description(video=video)
     try:
         timestamps: list[Timestamps] = extract_timestamps(description=description)
-    except Exception as e:
-        print(f"Error occurred while extracting timestamps: {e}")
+    except Exception:
+        logger.exception("Extracting timestamps failed for video %s", video_id)
         timestamps = []
-    for resolution in ["default", "high", "medium", "standard"]:
-        for thumbnail in video.snippet.thumbnails:
-            if thumbnail.resolution == resolution:
-                thumbnail_url: str = thumbnail.url
-                # print(f"Thumbnail URL for resolution {resolution}: {thumbnail_url}")
-                break
     extraction_response = ExtractionResponse(
         video_id=video_id,
         title=video.snippet.title,
         timestamps=timestamps,
-        thumbnail_url=thumbnail_url,
+        thumbnail_url=parse_video_thumbnails(video),
     )
     save_extraction_response(extraction_response=extraction_response)
     # formatted_response = format_extraction_response(extraction_response)
@@ -159,6 +162,9 @@ async def extract_video_timestamps(video_url: str, youtube: YouTube):
 
 async def find_video_parse_video(video_url: str, youtube: YouTube) -> FindVideoResponse:
     video_id: str = parse_video_id(video_url)
-    video: Video = find_video(video_id, youtube)
+    video: Video = await run_youtube(find_video, video_id, youtube)
+    return parse_find_video_response(video)
+
+def parse_find_video_response(video: Video) -> FindVideoResponse:
     thumbnail: str = parse_video_thumbnails(video)
-    return FindVideoResponse(thumbnail_url=thumbnail, title=video.snippet.title)
\ No newline at end of file
+    return FindVideoResponse(thumbnail_url=thumbnail, title=video.snippet.title)
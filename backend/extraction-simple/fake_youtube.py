@@ -0,0 +1,158 @@
+import random
+import threading
+import time
+import zlib
+from typing import Any, Iterator
+from pydantic import BaseModel
+from tubectrl.exceptions import VideoNotFoundException
+
+
+# Page sizes the Data API uses for videos.list, playlistItems.list and playlists.list
+VIDEOS_PAGE_SIZE: int = 50
+PLAYLIST_ITEMS_PAGE_SIZE: int = 50
+CHANNEL_PLAYLISTS_PAGE_SIZE: int = 50
+THUMBNAIL_RESOLUTIONS: tuple[str, ...] = ("default", "medium", "high", "standard")
+
+
+class FakeThumbnail(BaseModel):
+    resolution: str
+    url: str
+
+class FakeResourceId(BaseModel):
+    videoId: str
+
+class FakeSnippet(BaseModel):
+    title: str
+    description: str
+    thumbnails: list[FakeThumbnail] = []
+    resourceId: FakeResourceId | None = None
+
+class FakeResource(BaseModel):
+    id: str
+    snippet: FakeSnippet
+
+
+# What YouTubeCache validates cached fake responses back into, in place of the tubectrl models
+FAKE_CACHE_MODELS: dict[str, Any] = {
+    "video": FakeResource | None,
+    "playlist_items": list[list[FakeResource]],
+    "channel_playlists": list[list[FakeResource]],
+}
+
+
+class FakeYouTubeError(Exception):
+    # A transient failure of one request: a timeout, a 5xx or a quota error
+    pass
+
+
+def fake_description(video_id: str, chapters: int = 8) -> str:
+    lines: list[str] = [f"Everything about {video_id}.", ""]
+    for chapter in range(chapters):
+        seconds: int = chapter * 95
+        lines.append(f"{seconds // 60}:{seconds % 60:02d} - Chapter {chapter + 1} of {video_id}")
+    return "\n".join(lines)
+
+
+class FakeYouTube:
+    # Stands in for tubectrl.YouTube in benchmarks and local runs. Every method sleeps for
+    # `latency` seconds per call, like a round trip to the Data API, and counts the call.
+    # Ids encode their size: playlist "PL-300" holds 300 videos, channel "UC-12" has 12 playlists.
+    # `missing_rate` of the videos are deleted or private and never come back from videos.list
+    # (the same ids on every call); `error_rate` of the videos.list requests fail outright.
+    def __init__(
+        self,
+        latency: float = 0.2,
+        default_playlist_size: int = 50,
+        default_channel_size: int = 5,
+        missing_rate: float = 0.0,
+        error_rate: float = 0.0,
+    ):
+        self.latency = latency
+        self.default_playlist_size = default_playlist_size
+        self.default_channel_size = default_channel_size
+        self.missing_rate = missing_rate
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._random: random.Random = random.Random(0)
+        self.calls: int = 0
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def _size(resource_id: str, default: int) -> int:
+        try:
+            return int(resource_id.rsplit("-", 1)[1])
+        except (IndexError, ValueError):
+            return default
+
+    def authenticate_from_credentials(self, credentials_path: str):
+        pass
+
+    def _is_missing(self, video_id: str) -> bool:
+        return zlib.crc32(video_id.encode()) / 2**32 < self.missing_rate
+
+    def _fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def find_video_by_id(self, video_id: str) -> FakeResource:
+        self._call()
+        if self._is_missing(video_id):
+            raise VideoNotFoundException(f"Video {video_id} not found")
+        return self._video(video_id)
+
+    def _video(self, video_id: str) -> FakeResource:
+        return FakeResource(
+            id=video_id,
+            snippet=FakeSnippet(
+                title=f"Video {video_id}",
+                description=fake_description(video_id),
+                thumbnails=[
+                    FakeThumbnail(resolution=resolution, url=f"https://i.ytimg.com/vi/{video_id}/{resolution}.jpg")
+                    for resolution in THUMBNAIL_RESOLUTIONS
+                ],
+            ),
+        )
+
+    def find_videos_by_ids(self, video_ids: list[str]) -> list[FakeResource]:
+        if len(video_ids) > VIDEOS_PAGE_SIZE:
+            raise ValueError(f"videos.list accepts at most {VIDEOS_PAGE_SIZE} ids")
+        self._call()
+        if self._fail():
+            raise FakeYouTubeError("videos.list failed")
+        videos: list[FakeResource] = [self._video(video_id) for video_id in video_ids if not self._is_missing(video_id)]
+        if not videos:
+            raise VideoNotFoundException(f"None of {len(video_ids)} videos found")
+        return videos
+
+    def get_playlist_items_iterator(self, playlist_id: str) -> Iterator[list[FakeResource]]:
+        size: int = self._size(playlist_id, self.default_playlist_size)
+        for start in range(0, size, PLAYLIST_ITEMS_PAGE_SIZE):
+            self._call()
+            yield [
+                FakeResource(
+                    id=f"{playlist_id}-item-{index}",
+                    snippet=FakeSnippet(
+                        title=f"Video {playlist_id}-{index}",
+                        description=fake_description(f"{playlist_id}-{index}"),
+                        resourceId=FakeResourceId(videoId=f"{playlist_id}-{index}"),
+                    ),
+                )
+                for index in range(start, min(start + PLAYLIST_ITEMS_PAGE_SIZE, size))
+            ]
+
+    def get_channel_playlists_iterator(self, channel_id: str) -> Iterator[list[FakeResource]]:
+        size: int = self._size(channel_id, self.default_channel_size)
+        for start in range(0, size, CHANNEL_PLAYLISTS_PAGE_SIZE):
+            self._call()
+            yield [
+                FakeResource(
+                    id=f"PL{channel_id}{index}-{self.default_playlist_size}",
+                    snippet=FakeSnippet(title=f"Playlist {index} of {channel_id}", description=""),
+                )
+                for index in range(start, min(start + CHANNEL_PLAYLISTS_PAGE_SIZE, size))
+            ]
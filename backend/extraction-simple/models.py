@@ -1,6 +1,6 @@
 from __future__ import annotations
 from pydantic import BaseModel
-from db import Video, Dataset, VideoExtraction, Playlist
+from db import Video, Dataset, VideoExtraction, Playlist, ExtractionJob, ExtractionJobPlaylist
 from datetime import datetime
 
 
@@ -112,6 +112,9 @@ class PlaylistRead(BaseModel):
 class Timestamp(BaseModel):
     timestamp: str
     title: str
+    # Seconds; absent from extractions saved before segments were parsed
+    start: int | None = None
+    end: int | None = None
 
 class Timestamps(BaseModel):
     timestamps: list[Timestamp]
@@ -121,4 +124,57 @@ class ExtractionResponse(BaseModel):
     video_id: str
     title: str
     timestamps: list[Timestamp]
-    thumbnail_url: str
\ No newline at end of file
+    thumbnail_url: str
+
+
+class ExtractionJobRead(BaseModel):
+    id: str
+    channel_id: str
+    dataset_id: str
+    status: str
+    total_playlists: int
+    done_playlists: int
+    failed_playlists: int
+    total_videos: int
+    failed_videos: int
+    error: str | None
+    created_at: datetime
+    updated_at: datetime
+
+    @classmethod
+    def from_job(cls, job: ExtractionJob) -> ExtractionJobRead:
+        return ExtractionJobRead(
+            id=job.id,
+            channel_id=job.channel_id,
+            dataset_id=job.dataset_id,
+            status=job.status,
+            total_playlists=job.total_playlists,
+            done_playlists=job.done_playlists,
+            failed_playlists=job.failed_playlists,
+            total_videos=job.total_videos,
+            failed_videos=job.failed_videos,
+            error=job.error,
+            created_at=job.created_at,
+            updated_at=job.updated_at,
+        )
+
+class ExtractionJobPlaylistRead(BaseModel):
+    playlist_id: str
+    title: str | None
+    status: str
+    videos: int
+    failed_videos: int
+    results: list[dict]
+    error: str | None
+
+    @classmethod
+    def from_job_playlist(cls, job_playlist: ExtractionJobPlaylist) -> ExtractionJobPlaylistRead:
+        return ExtractionJobPlaylistRead(
+            playlist_id=job_playlist.playlist_id,
+            title=job_playlist.title,
+            status=job_playlist.status,
+            videos=job_playlist.videos,
+            failed_videos=job_playlist.failed_videos,
+            results=job_playlist.results,
+            error=job_playlist.error,
+        )
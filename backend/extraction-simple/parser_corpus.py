@@ -0,0 +1,67 @@
+import random
+
+
+# Hand-labelled descriptions covering the chapter formats seen in the wild. Each expected
+# segment is (start, end, title) in seconds; the last end is None as no duration is given.
+LABELLED_DESCRIPTIONS: list[dict] = [
+    {
+        "description": "In this video we build a REST API.\n\n0:00 Intro\n1:15 Project setup\n4:02 Writing the first endpoint\n10:45 Wrap-up",
+        "expected": [(0, 75, "Intro"), (75, 242, "Project setup"), (242, 645, "Writing the first endpoint"), (645, None, "Wrap-up")],
+    },
+    {
+        "description": "Timestamps:\n00:00 - Introduction\n02:30 - Data loading\n15:10 - Training loop\n1:02:03 - Evaluation\n\nLinks below!",
+        "expected": [(0, 150, "Introduction"), (150, 910, "Data loading"), (910, 3723, "Training loop"), (3723, None, "Evaluation")],
+    },
+    {
+        "description": "[0:00] Cold open\n[0:45] Guest introduction\n[12:20] Main discussion\n[58:10] Listener questions",
+        "expected": [(0, 45, "Cold open"), (45, 740, "Guest introduction"), (740, 3490, "Main discussion"), (3490, None, "Listener questions")],
+    },
+    {
+        "description": "Intro - 0:00\nSetting up the camera - 2:10\nLighting (5:45)\nEditing in post [12:05]",
+        "expected": [(0, 130, "Intro"), (130, 345, "Setting up the camera"), (345, 725, "Lighting"), (725, None, "Editing in post")],
+    },
+    {
+        "description": "1. 0:00 Welcome\n2. 3:30 Self-attention explained\n3. 9:12 Multi-head attention\n4. 20:00 Q&A",
+        "expected": [(0, 210, "Welcome"), (210, 552, "Self-attention explained"), (552, 1200, "Multi-head attention"), (1200, None, "Q&A")],
+    },
+    {
+        "description": "Chapters\n0:00 - 1:30 Warm-up\n1:30 - 6:00 Main set\n6:00 Cool-down\n\nAt 3:45 you can see my form breaking down.",
+        "expected": [(0, 90, "Warm-up"), (90, 360, "Main set"), (360, None, "Cool-down")],
+    },
+    {
+        "description": "- 0:00 Overview\n- 4:20 Part one: the problem\n- 11:05 Part two: a solution\n\nSee 4:20 above for the part everyone asks about.",
+        "expected": [(0, 260, "Overview"), (260, 665, "Part one: the problem"), (665, None, "Part two: a solution")],
+    },
+    {
+        "description": "No chapters in this one, just a long stream.\nStarted at 10:00 and ended around 14:30 local time.",
+        "expected": [],
+    },
+    {
+        "description": "0:00 Start\n75:30 Ninety minute mark recap\n1:40:00 Final thoughts",
+        "expected": [(0, 4530, "Start"), (4530, 6000, "Ninety minute mark recap"), (6000, None, "Final thoughts")],
+    },
+    {
+        "description": "0:00 Intro\n2:00 First topic\n1:00 A typo that jumps back\n5:00 Second topic",
+        "expected": [(0, 120, "Intro"), (120, 300, "First topic"), (300, None, "Second topic")],
+    },
+]
+
+FILLER_LINES: list[str] = [
+    "Subscribe for more videos like this one!",
+    "Follow me on social media: @example",
+    "Thanks to our sponsor for supporting the channel.",
+    "Music: royalty free tracks from the audio library.",
+    "Questions? Leave a comment below.",
+]
+
+
+def build_corpus(size: int, seed: int = 0) -> list[str]:
+    # Throughput corpus: the labelled descriptions padded with filler lines so lengths vary
+    # like real descriptions do. Deterministic for a given seed.
+    generator = random.Random(seed)
+    corpus: list[str] = []
+    for index in range(size):
+        description: str = LABELLED_DESCRIPTIONS[index % len(LABELLED_DESCRIPTIONS)]["description"]
+        filler: list[str] = generator.choices(FILLER_LINES, k=generator.randint(0, 12))
+        corpus.append("\n".join([*filler[:len(filler) // 2], description, *filler[len(filler) // 2:]]))
+    return corpus
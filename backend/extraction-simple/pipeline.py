@@ -0,0 +1,81 @@
+import asyncio
+import functools
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Iterator, TypeVar
+from extensions import youtube_executor
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Sentinel marking the end of a buffered stream
+_DONE = object()
+
+
+async def run_youtube(func: Callable, *args, **kwargs):
+    # Every tubectrl call blocks on HTTP; the bounded executor keeps the event loop free
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(youtube_executor, functools.partial(func, *args, **kwargs))
+
+async def iterate_in_thread(make_iterator: Callable[[], Iterator[T]]) -> AsyncIterator[T]:
+    # Pulls a blocking iterator (a tubectrl paginator) one element at a time on the YouTube
+    # executor, so each page is requested only when the next stage asks for it
+    iterator: Iterator[T] = await run_youtube(make_iterator)
+    while True:
+        item = await run_youtube(next, iterator, _DONE)
+        if item is _DONE:
+            return
+        yield item
+
+async def buffered(source: AsyncIterator[T], maxsize: int) -> AsyncIterator[T]:
+    # Runs `source` ahead of the consumer, but never more than `maxsize` items ahead: a slow
+    # consumer stalls the producer instead of letting it pile everything up in memory
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    async def produce():
+        try:
+            async for item in source:
+                await queue.put((item, None))
+            await queue.put((_DONE, None))
+        except Exception as e:
+            await queue.put((_DONE, e))
+
+    producer: asyncio.Task = asyncio.create_task(produce())
+    try:
+        while True:
+            item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+async def batched(source: AsyncIterator[T], size: int) -> AsyncIterator[list[T]]:
+    batch: list[T] = []
+    async for item in source:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def map_concurrent(
+    source: AsyncIterator[T], func: Callable[[T], Awaitable[R]], concurrency: int
+) -> AsyncIterator[R]:
+    # Applies `func` to up to `concurrency` items at once and yields the results in source order
+    pending: deque[asyncio.Task] = deque()
+    try:
+        async for item in source:
+            pending.append(asyncio.ensure_future(func(item)))
+            if len(pending) >= concurrency:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
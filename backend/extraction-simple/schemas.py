@@ -18,5 +18,11 @@ class FindVideoResponse(BaseModel):
     title: str
 
 class TimestampsExtractionResponse(BaseModel):
+    # One chapter of a video, in whole seconds; end is None for a last chapter of unknown length
     start: int
-    end: int
\ No newline at end of file
+    end: int | None
+    title: str
+
+class VideoExtractionFailure(BaseModel):
+    video_id: str
+    error: str
@@ -1,16 +1,56 @@
+import asyncio
+import logging
+import os
+from contextlib import aclosing
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable
+from sqlalchemy import select, update, or_, and_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
-from models import DatasetCreate, DatasetRead, ExtractionResponse, VideoRead, VideoCreate, PlaylistCreate
-from db import Dataset
+from models import (
+    DatasetCreate, DatasetRead, ExtractionResponse, VideoRead, VideoCreate, PlaylistCreate,
+    ExtractionJobRead, ExtractionJobPlaylistRead
+)
+from db import Dataset, SessionLocal, ExtractionJob, ExtractionJobPlaylist
 import uuid
 from extraction_utils import (
     extract_video_timestamps, find_video_parse_video, parse_video_id, preprocess_video, parse_playlist_id, 
-    preprocess_playlist, find_channel_playlists
+    find_channel_playlists, run_youtube, video_create_from_video, build_extraction_response,
+    parse_find_video_response, stream_playlist_video_ids, stream_channel_playlists, find_videos_batch, VIDEOS_BATCH_SIZE
 )
-from schemas import FindVideoResponse
+from pipeline import buffered, batched, map_concurrent
+from schemas import FindVideoResponse, VideoExtractionFailure
 from tubectrl import YouTube
+from tubectrl.models import Video
+from youtube_client import CachedYouTube
 from db import VideoExtraction, Video as VideoInDb
 
 
+logger = logging.getLogger(__name__)
+
+# videos.list batches of one playlist fetched at the same time
+EXTRACTION_CONCURRENCY: int = int(os.environ.get("EXTRACTION_CONCURRENCY", "8"))
+# Bounded buffers between the pipeline stages: how far listing may run ahead of metadata
+# fetching, and fetching ahead of extraction and the database writes
+PIPELINE_BUFFERED_IDS: int = 2 * VIDEOS_BATCH_SIZE
+PIPELINE_BUFFERED_BATCHES: int = 2
+# Rows per multi-row INSERT ... ON CONFLICT statement of the bulk upserts
+UPSERT_CHUNK_SIZE: int = 1000
+
+JOB_PENDING: str = "pending"
+JOB_RUNNING: str = "running"
+JOB_COMPLETED: str = "completed"
+JOB_FAILED: str = "failed"
+PLAYLIST_DONE: str = "done"
+# Playlists of one channel job extracted at the same time
+JOB_PLAYLIST_CONCURRENCY: int = int(os.environ.get("JOB_PLAYLIST_CONCURRENCY", "4"))
+JOB_POLL_INTERVAL_SECONDS: float = 2.0
+# A running job renews its heartbeat this often for as long as its worker is alive, however
+# long a single playlist takes; one that has been silent for JOB_STALE_AFTER lost its worker
+JOB_HEARTBEAT_INTERVAL_SECONDS: float = 60.0
+JOB_STALE_AFTER: timedelta = timedelta(minutes=15)
+
+
 class DatasetService:
     def __init__(self, db: Session):
         self.db = db
@@ -58,8 +98,53 @@ class VideoService:
         self.db.refresh(db_video)
         return VideoRead.from_video(db_video)
     
+    async def create_many(self, videos: list[VideoCreate], commit: bool = True) -> list[VideoRead]:
+        return self.upsert_videos(videos, commit)
+
+    def upsert_videos(self, videos: list[VideoCreate], commit: bool = True) -> list[VideoRead]:
+        # Multi-row upsert: new videos are inserted, known ones get the current title and
+        # description. The rows are known already, so nothing is refreshed afterwards.
+        # Postgres rejects one statement touching a row twice, so the last copy of an id wins.
+        rows: list[dict] = list({video.id: video.model_dump() for video in videos}.values())
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            statement = insert(VideoInDb).values(rows[start:start + UPSERT_CHUNK_SIZE])
+            self.db.execute(statement.on_conflict_do_update(
+                index_elements=[VideoInDb.id],
+                set_={"title": statement.excluded.title, "description": statement.excluded.description},
+            ))
+        if commit:
+            self.db.commit()
+        return [VideoRead(**row) for row in rows]
+
+    async def upsert_extractions(
+        self, extractions: list[ExtractionResponse], dataset_id: str, commit: bool = True
+    ) -> int:
+        return self.upsert_video_extractions(extractions, dataset_id, commit)
+
+    def upsert_video_extractions(
+        self, extractions: list[ExtractionResponse], dataset_id: str, commit: bool = True
+    ) -> int:
+        # Re-extracting a video replaces its timestamps; the dataset it was first extracted into stays
+        rows: list[dict] = list({
+            extraction.video_id: {
+                "id": extraction.video_id,
+                "video_id": extraction.video_id,
+                "dataset_id": dataset_id,
+                "timestamps": {"timestamps": [timestamp.model_dump() for timestamp in extraction.timestamps]},
+            } for extraction in extractions
+        }.values())
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            statement = insert(VideoExtraction).values(rows[start:start + UPSERT_CHUNK_SIZE])
+            self.db.execute(statement.on_conflict_do_update(
+                index_elements=[VideoExtraction.id],
+                set_={"timestamps": statement.excluded.timestamps},
+            ))
+        if commit:
+            self.db.commit()
+        return len(rows)
+
     async def create_from_url(self, video_url: str, youtube: YouTube) -> VideoRead:
-        video: VideoCreate = preprocess_video(video_url, youtube)
+        video: VideoCreate = await run_youtube(preprocess_video, video_url, youtube)
         return await self.create(video)
     
     async def get(self, id: str) -> VideoRead:
@@ -87,10 +172,11 @@ class VideoService:
     
 
 class TimestampsExtractionService:
-    def __init__(self, db: Session, youtube: YouTube, video_service: VideoService):
+    def __init__(self, db: Session, youtube: CachedYouTube, video_service: VideoService, session_factory=SessionLocal):
         self.db = db
         self.youtube = youtube
         self.video_service = video_service
+        self.session_factory = session_factory
 
     async def extract_video_timestamps(self, video_url: str, dataset_id: str):
         video_id: str = parse_video_id(video_url)
@@ -113,16 +199,97 @@ class TimestampsExtractionService:
         self.db.commit()
         return video_extraction
     
-    async def extract_playlist_timestamps(self, playlist_url: str, dataset_id: str):
-        playlist_id: str = parse_playlist_id(playlist_url)
-        videos_create: list[VideoCreate] = preprocess_playlist(playlist_url, self.youtube)
-        results: list[VideoExtraction] = []
-        for video_create in videos_create:
-            r = await self.extract_video_timestamps(video_create.id, dataset_id)
-            r = await find_video_parse_video(video_create.id, self.youtube)
-            results.append(r)
-        # print(results)
-        return results[0]
+    async def save_fetched_videos(
+        self, video_ids: list[str], fetched: dict[str, Video], dataset_id: str, fetch_error: str | None = None
+    ) -> list[FindVideoResponse | VideoExtractionFailure]:
+        # One videos.list batch in one transaction: a multi-row upsert each for the videos and
+        # their extractions, then a single commit, on a worker thread so the event loop keeps
+        # serving requests meanwhile. Works off the fetched videos; no API calls.
+        # Ids missing from `fetched` fail with `fetch_error` when the whole request failed.
+        results: dict[str, FindVideoResponse | VideoExtractionFailure] = {}
+        prepared: dict[str, tuple[VideoCreate, ExtractionResponse]] = {}
+        for video_id in video_ids:
+            video: Video | None = fetched.get(video_id)
+            if video is None:
+                results[video_id] = VideoExtractionFailure(
+                    video_id=video_id, error=fetch_error or "Video not returned by YouTube"
+                )
+                continue
+            try:
+                prepared[video_id] = (video_create_from_video(video_id, video), build_extraction_response(video_id, video))
+                results[video_id] = parse_find_video_response(video)
+            except Exception as e:
+                logger.warning("Extraction failed for video %s: %s", video_id, e)
+                results[video_id] = VideoExtractionFailure(video_id=video_id, error=str(e))
+        try:
+            await asyncio.to_thread(self.write_extractions, list(prepared.values()), dataset_id)
+        except Exception as e:
+            # Find the offending rows by writing the batch one video at a time
+            logger.warning("Batch write of %d videos failed, retrying one by one: %s", len(prepared), e)
+            for video_id, item in prepared.items():
+                try:
+                    await asyncio.to_thread(self.write_extractions, [item], dataset_id)
+                except Exception as video_error:
+                    logger.warning("Extraction failed for video %s: %s", video_id, video_error)
+                    results[video_id] = VideoExtractionFailure(video_id=video_id, error=str(video_error))
+        return [results[video_id] for video_id in video_ids]
+
+    def write_extractions(self, items: list[tuple[VideoCreate, ExtractionResponse]], dataset_id: str):
+        # Runs on a worker thread: Sessions are not thread-safe, so it opens its own
+        if not items:
+            return
+        with self.session_factory() as db:
+            video_service = VideoService(db)
+            # Videos first: the extractions reference them
+            video_service.upsert_videos([video for video, _ in items], commit=False)
+            video_service.upsert_video_extractions([extraction for _, extraction in items], dataset_id, commit=False)
+            db.commit()
+
+    async def extract_playlist_timestamps(
+        self, playlist_url: str, dataset_id: str, concurrency: int = EXTRACTION_CONCURRENCY
+    ) -> list[FindVideoResponse | VideoExtractionFailure]:
+        return [result async for result in self.stream_playlist_timestamps(playlist_url, dataset_id, concurrency)]
+
+    async def stream_playlist_timestamps(
+        self, playlist_url: str, dataset_id: str, concurrency: int = EXTRACTION_CONCURRENCY
+    ) -> AsyncIterator[FindVideoResponse | VideoExtractionFailure]:
+        # pages -> video ids -> videos.list batches -> extraction and DB writes, each stage
+        # running at most a bounded buffer ahead of the next, so memory stays flat however
+        # large the playlist and the first results come out while later pages are listed
+        youtube = self.youtube
+        calls_before: int = youtube.calls
+        videos: int = 0
+
+        async def fetch(batch: list[str]) -> tuple[list[str], dict[str, Video], str | None]:
+            # A failed videos.list request fails its own batch only, never the whole playlist.
+            # tubectrl raises when none of the ids come back, so that lands here too.
+            try:
+                fetched: list[Video] = await run_youtube(find_videos_batch, batch, youtube)
+            except Exception as e:
+                logger.warning("Fetching %d videos failed: %s", len(batch), e)
+                return batch, {}, str(e) or type(e).__name__
+            return batch, {video.id: video for video in fetched}, None
+
+        video_ids: AsyncIterator[str] = buffered(stream_playlist_video_ids(playlist_url, youtube), PIPELINE_BUFFERED_IDS)
+        batches: AsyncIterator[list[str]] = batched(video_ids, VIDEOS_BATCH_SIZE)
+        # aclosing: a consumer that stops early (a disconnected stream) cancels every stage at once
+        async with aclosing(buffered(map_concurrent(batches, fetch, concurrency), PIPELINE_BUFFERED_BATCHES)) as fetched_batches:
+            async for batch, fetched, fetch_error in fetched_batches:
+                for result in await self.save_fetched_videos(batch, fetched, dataset_id, fetch_error):
+                    videos += 1
+                    yield result
+        logger.info(
+            "Extracted playlist %s: %d videos, %d YouTube API calls",
+            parse_playlist_id(playlist_url), videos, youtube.calls - calls_before
+        )
+
+    async def stream_channel_timestamps(
+        self, channel_id: str, dataset_id: str, concurrency: int = EXTRACTION_CONCURRENCY
+    ) -> AsyncIterator[tuple[str, FindVideoResponse | VideoExtractionFailure]]:
+        # Playlists one after another as their pages arrive; each is itself streamed
+        async for playlist in stream_channel_playlists(channel_id, self.youtube):
+            async for result in self.stream_playlist_timestamps(playlist.id, dataset_id, concurrency):
+                yield playlist.id, result
 
     async def get_timestamps(self, dataset_id: str):
         pass
@@ -133,12 +300,220 @@ class TimestampsExtractionService:
 
     async def find_video(self, video_url: str, dataset_id: str) -> FindVideoResponse:
         await self.extract_video_timestamps(video_url, dataset_id)
-        return await find_video_parse_video(video_url, self.youtube) 
-    
-    async def extract_channel_timestamps(self, channel_id: str, dataset_id: str):
-        playlists: list[PlaylistCreate] = await find_channel_playlists(channel_id, self.youtube)
-        results: list[VideoExtraction] = []
-        for playlist in playlists:
-            r = await self.extract_playlist_timestamps(playlist.id, dataset_id)
-            results.append(r)
-        return results[0]
\ No newline at end of file
+        return await find_video_parse_video(video_url, self.youtube)
+
+
+class ExtractionJobService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    async def create_channel_job(self, channel_id: str, dataset_id: str) -> ExtractionJobRead:
+        job: ExtractionJob = ExtractionJob(
+            id=str(uuid.uuid4()),
+            channel_id=channel_id,
+            dataset_id=dataset_id,
+            status=JOB_PENDING,
+        )
+        self.db.add(job)
+        self.db.commit()
+        return ExtractionJobRead.from_job(job)
+
+    async def get_job(self, id: str) -> ExtractionJobRead:
+        job: ExtractionJob = self.db.get(ExtractionJob, id)
+        if not job:
+            return None
+        return ExtractionJobRead.from_job(job)
+
+    async def get_job_result(self, id: str) -> list[ExtractionJobPlaylistRead]:
+        if not self.db.get(ExtractionJob, id):
+            return None
+        job_playlists: list[ExtractionJobPlaylist] = self.db.query(ExtractionJobPlaylist).filter(
+            ExtractionJobPlaylist.job_id == id
+        ).order_by(ExtractionJobPlaylist.playlist_id).all()
+        return [ExtractionJobPlaylistRead.from_job_playlist(job_playlist) for job_playlist in job_playlists]
+
+
+class ExtractionJobRunner:
+    # Works through channel jobs in the background. A job first records every playlist of the
+    # channel, then extracts them with bounded concurrency, checkpointing each finished
+    # playlist. Jobs are claimed with SKIP LOCKED, so every worker process can run a runner,
+    # and a job left running by a crashed worker resumes at its first unfinished playlist.
+    def __init__(
+            self,
+            youtube_factory: Callable[[], CachedYouTube],
+            session_factory=SessionLocal,
+            playlist_concurrency: int = JOB_PLAYLIST_CONCURRENCY,
+            interval: float = JOB_POLL_INTERVAL_SECONDS,
+            heartbeat_interval: float = JOB_HEARTBEAT_INTERVAL_SECONDS,
+            stale_after: timedelta = JOB_STALE_AFTER):
+        self.youtube_factory = youtube_factory
+        self.session_factory = session_factory
+        self.playlist_concurrency = playlist_concurrency
+        self.interval = interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.task: asyncio.Task | None = None
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self):
+        while True:
+            try:
+                # The runner's own reads and writes are blocking; they run on a thread
+                while job_id := await asyncio.to_thread(self.claim_job):
+                    await self.run_job(job_id)
+            except Exception as e:
+                logger.exception(f"Error running extraction jobs: {e}")
+            await asyncio.sleep(self.interval)
+
+    def claim_job(self) -> str | None:
+        now: datetime = datetime.now(timezone.utc)
+        with self.session_factory() as db:
+            job_id: str | None = db.execute(
+                select(ExtractionJob.id)
+                .where(or_(
+                    ExtractionJob.status == JOB_PENDING,
+                    and_(ExtractionJob.status == JOB_RUNNING, ExtractionJob.updated_at < now - self.stale_after),
+                ))
+                .order_by(ExtractionJob.created_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            ).scalar()
+            if job_id is None:
+                return None
+            db.execute(update(ExtractionJob).where(ExtractionJob.id == job_id).values(status=JOB_RUNNING, updated_at=now))
+            db.commit()
+        return job_id
+
+    async def run_job(self, job_id: str):
+        heartbeat: asyncio.Task = asyncio.create_task(self.heartbeat(job_id))
+        try:
+            dataset_id, playlist_ids = await self.prepare_job(job_id)
+            semaphore = asyncio.Semaphore(self.playlist_concurrency)
+            await asyncio.gather(*(
+                self.run_playlist(job_id, dataset_id, playlist_id, semaphore) for playlist_id in playlist_ids
+            ))
+            status, error = JOB_COMPLETED, None
+        except Exception as e:
+            logger.exception(f"Extraction job {job_id} failed: {e}")
+            status, error = JOB_FAILED, str(e)
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+        await asyncio.to_thread(self.finish_job, job_id, status, error)
+
+    async def heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await asyncio.to_thread(self.touch_job, job_id)
+            except Exception as e:
+                logger.warning("Job %s: heartbeat failed: %s", job_id, e)
+
+    def touch_job(self, job_id: str):
+        with self.session_factory() as db:
+            db.execute(update(ExtractionJob).where(ExtractionJob.id == job_id, ExtractionJob.status == JOB_RUNNING).values(
+                updated_at=datetime.now(timezone.utc)
+            ))
+            db.commit()
+
+    def finish_job(self, job_id: str, status: str, error: str | None):
+        with self.session_factory() as db:
+            db.execute(update(ExtractionJob).where(ExtractionJob.id == job_id).values(
+                status=status, error=error, updated_at=datetime.now(timezone.utc)
+            ))
+            db.commit()
+
+    async def prepare_job(self, job_id: str) -> tuple[str, list[str]]:
+        # Returns the job's dataset and the playlists it still has to extract
+        channel_id, dataset_id, playlists_listed = await asyncio.to_thread(self.load_job, job_id)
+        if not playlists_listed:
+            youtube: CachedYouTube = self.youtube_factory()
+            playlists: list[PlaylistCreate] = await find_channel_playlists(channel_id, youtube)
+            listed: int = await asyncio.to_thread(self.record_playlists, job_id, playlists)
+            logger.info("Job %s: channel %s has %d playlists, %d YouTube API calls", job_id, channel_id, listed, youtube.calls)
+        return dataset_id, await asyncio.to_thread(self.pending_playlists, job_id)
+
+    def load_job(self, job_id: str) -> tuple[str, str, bool]:
+        with self.session_factory() as db:
+            job: ExtractionJob = db.get(ExtractionJob, job_id)
+            return job.channel_id, job.dataset_id, job.playlists_listed
+
+    def record_playlists(self, job_id: str, playlists: list[PlaylistCreate]) -> int:
+        rows: list[dict] = [
+            {"job_id": job_id, "playlist_id": playlist.id, "title": playlist.title}
+            for playlist in {playlist.id: playlist for playlist in playlists}.values()
+        ]
+        with self.session_factory() as db:
+            if rows:
+                db.execute(insert(ExtractionJobPlaylist).values(rows).on_conflict_do_nothing())
+            db.execute(update(ExtractionJob).where(ExtractionJob.id == job_id).values(
+                total_playlists=len(rows), playlists_listed=True, updated_at=datetime.now(timezone.utc)
+            ))
+            db.commit()
+        return len(rows)
+
+    def pending_playlists(self, job_id: str) -> list[str]:
+        with self.session_factory() as db:
+            return list(db.execute(
+                select(ExtractionJobPlaylist.playlist_id)
+                .where(ExtractionJobPlaylist.job_id == job_id, ExtractionJobPlaylist.status == JOB_PENDING)
+                .order_by(ExtractionJobPlaylist.playlist_id)
+            ).scalars().all())
+
+    async def run_playlist(self, job_id: str, dataset_id: str, playlist_id: str, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            # The service writes each batch on a worker thread with a session of its own,
+            # so this one is never used on the event loop
+            with self.session_factory() as db:
+                service = TimestampsExtractionService(
+                    db, self.youtube_factory(), VideoService(db), session_factory=self.session_factory
+                )
+                try:
+                    results: list[FindVideoResponse | VideoExtractionFailure] = await service.extract_playlist_timestamps(
+                        playlist_id, dataset_id
+                    )
+                    failed: int = sum(isinstance(result, VideoExtractionFailure) for result in results)
+                    playlist_values: dict = {
+                        "status": PLAYLIST_DONE,
+                        "videos": len(results),
+                        "failed_videos": failed,
+                        "results": [result.model_dump() for result in results],
+                    }
+                    job_values: dict = {
+                        "total_videos": ExtractionJob.total_videos + len(results),
+                        "failed_videos": ExtractionJob.failed_videos + failed,
+                    }
+                except Exception as e:
+                    logger.exception(f"Job {job_id}: playlist {playlist_id} failed: {e}")
+                    playlist_values = {"status": JOB_FAILED, "error": str(e)}
+                    job_values = {"failed_playlists": ExtractionJob.failed_playlists + 1}
+            if not await asyncio.to_thread(self.checkpoint_playlist, job_id, playlist_id, playlist_values, job_values):
+                logger.warning("Job %s: playlist %s was already checkpointed by another worker", job_id, playlist_id)
+
+    def checkpoint_playlist(self, job_id: str, playlist_id: str, playlist_values: dict, job_values: dict) -> bool:
+        # The playlist's outcome and the job's counters commit together. Only a still pending
+        # playlist is recorded, so a worker that took over a job it wrongly thought stale cannot
+        # count the same playlist twice.
+        now: datetime = datetime.now(timezone.utc)
+        with self.session_factory() as db:
+            result = db.execute(update(ExtractionJobPlaylist).where(
+                ExtractionJobPlaylist.job_id == job_id,
+                ExtractionJobPlaylist.playlist_id == playlist_id,
+                ExtractionJobPlaylist.status == JOB_PENDING,
+            ).values(**playlist_values, updated_at=now))
+            if result.rowcount != 1:
+                db.rollback()
+                return False
+            db.execute(update(ExtractionJob).where(ExtractionJob.id == job_id).values(
+                **job_values, done_playlists=ExtractionJob.done_playlists + 1, updated_at=now
+            ))
+            db.commit()
+        return True
@@ -95,13 +95,45 @@ function findVideo(){
         .then((data) => {
             console.log('Success:', data);
             console.log(data);
-            imageResult.src = data.thumbnail_url;
+            if(type === 'channel'){
+                pollExtractionJob(data.id);
+                return;
+            }
+            showResult(data);
         })
         .catch((error) => {
             console.error('There was a problem with the fetch operation:', error);
         });
 }
 
+function showResult(data){
+    // Playlists and channels answer with one entry per video; failed videos carry an error instead of a thumbnail
+    const result = Array.isArray(data) ? data.find((item) => item.thumbnail_url) : data;
+    if(result){
+        imageResult.src = result.thumbnail_url;
+    }
+}
+
+function pollExtractionJob(jobId){
+    // Channel extraction runs as a background job; check on it until it finishes
+    const jobUrl = `${window.location.origin}/extraction/jobs/${jobId}`;
+    fetch(jobUrl, {headers: {'X-API-KEY': API_KEY}})
+        .then((response) => response.json())
+        .then((job) => {
+            console.log(`Job ${job.id}: ${job.status}, ${job.done_playlists}/${job.total_playlists} playlists`);
+            if(job.status === 'pending' || job.status === 'running'){
+                setTimeout(() => pollExtractionJob(jobId), 2000);
+                return;
+            }
+            return fetch(`${jobUrl}/result`, {headers: {'X-API-KEY': API_KEY}})
+                .then((response) => response.json())
+                .then((playlists) => showResult(playlists.flatMap((playlist) => playlist.results)));
+        })
+        .catch((error) => {
+            console.error('There was a problem polling the extraction job:', error);
+        });
+}
+
 function showDatasetCreationModel(){
     datasetCreationModal.style.display = 'flex';
 }
@@ -0,0 +1,71 @@
+import re
+from schemas import TimestampsExtractionResponse
+
+
+# 1:02:03, 12:34, 0:05 and 75:30 (minutes past the hour without an hours field)
+TIMESTAMP: str = r"(?:(\d{1,2}):)?(\d{1,3}):([0-5]\d)(?!\d)"
+BRACKETED_TIMESTAMP: str = rf"[\[(]?{TIMESTAMP}[\])]?"
+# A chapter line starts with its timestamp, optionally behind a bullet or list number
+# ("- 0:00 Intro", "3. [12:40] Setup"), or ends with it ("Intro - 0:00", "Setup (12:40)")
+LEADING_PATTERN = re.compile(rf"^\s*(?:[-*•·]\s*|\d{{1,3}}[.)]\s+)?{BRACKETED_TIMESTAMP}")
+# "0:00 - 1:30 Intro": the second timestamp is the chapter's explicit end
+RANGE_END_PATTERN = re.compile(rf"\s*(?:-|–|—|~|to)\s*{BRACKETED_TIMESTAMP}")
+TRAILING_PATTERN = re.compile(rf"(?:^|(?<=\s)|(?<=[-–—|:]))\s*{BRACKETED_TIMESTAMP}\s*$")
+# Separators between a timestamp and its title; hyphens inside the title are kept
+TITLE_STRIP: str = " \t-–—:|•·*"
+
+
+def to_seconds(hours: str | None, minutes: str, seconds: str) -> int:
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+
+def format_seconds(seconds: int) -> str:
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+def parse_line(line: str) -> tuple[int, int | None, str] | None:
+    # (start, explicit end, title) of a chapter line, or None for any other line. A timestamp
+    # in the middle of a sentence ("at 3:45 we fix it") is not a chapter.
+    match = LEADING_PATTERN.match(line)
+    if match:
+        start: int = to_seconds(*match.groups())
+        end: int | None = None
+        position: int = match.end()
+        range_end = RANGE_END_PATTERN.match(line, position)
+        if range_end:
+            end = to_seconds(*range_end.groups())
+            position = range_end.end()
+        title: str = line[position:].strip(TITLE_STRIP)
+    else:
+        match = TRAILING_PATTERN.search(line)
+        if not match:
+            return None
+        start, end = to_seconds(*match.groups()), None
+        title = line[:match.start()].strip(TITLE_STRIP)
+    if not title:
+        return None
+    return start, end, title
+
+def parse_description(description: str, duration: int | None = None) -> list[TimestampsExtractionResponse]:
+    # Chapters are kept in description order and must move forward in time; anything that
+    # jumps back (a second list, a quoted time) is dropped. A chapter ends where the next one
+    # starts unless it gave its own end; the last one ends with the video when the duration is known.
+    chapters: list[tuple[int, int | None, str]] = []
+    for line in (description or "").splitlines():
+        chapter = parse_line(line)
+        if chapter is None:
+            continue
+        if chapters and chapter[0] <= chapters[-1][0]:
+            continue
+        if duration is not None and chapter[0] >= duration:
+            continue
+        chapters.append(chapter)
+    segments: list[TimestampsExtractionResponse] = []
+    for index, (start, end, title) in enumerate(chapters):
+        next_start: int | None = chapters[index + 1][0] if index + 1 < len(chapters) else duration
+        if end is None or end <= start or (next_start is not None and end > next_start):
+            end = next_start
+        segments.append(TimestampsExtractionResponse(start=start, end=end, title=title))
+    return segments
@@ -2,9 +2,10 @@ from db import get_db, engine, Base
 from sqlalchemy.orm import Session
 from fastapi import Depends
 from typing import Annotated
-from services import DatasetService, TimestampsExtractionService, VideoService
+from services import DatasetService, TimestampsExtractionService, VideoService, ExtractionJobService, ExtractionJobRunner
 from models import DatasetRead
-from extensions import youtube
+from extensions import new_youtube_client
+from youtube_client import CachedYouTube
 
 
 def get_dataset_service(db: Annotated[Session, Depends(get_db)]):
@@ -26,5 +27,18 @@ async def get_datasets(dataset_service: DatasetService = Depends(get_dataset_ser
 def get_video_service(db: Annotated[Session, Depends(get_db)]):
     return VideoService(db)
 
-def get_timestamps_extraction_service(db: Annotated[Session, Depends(get_db)], video_service: VideoService = Depends(get_video_service)):
-    return TimestampsExtractionService(db, youtube, video_service)
\ No newline at end of file
+def get_youtube() -> CachedYouTube:
+    return new_youtube_client()
+
+def get_timestamps_extraction_service(
+        db: Annotated[Session, Depends(get_db)],
+        video_service: VideoService = Depends(get_video_service),
+        youtube: CachedYouTube = Depends(get_youtube)
+    ):
+    return TimestampsExtractionService(db, youtube, video_service)
+
+def get_extraction_job_service(db: Annotated[Session, Depends(get_db)]):
+    return ExtractionJobService(db)
+
+
+extraction_job_runner: ExtractionJobRunner = ExtractionJobRunner(youtube_factory=new_youtube_client)
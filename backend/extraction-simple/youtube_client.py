@@ -0,0 +1,252 @@
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Iterator
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+from tubectrl.exceptions import VideoNotFoundException
+from tubectrl.models import Video, PlaylistItem
+from tubectrl.models.playlist import Playlist
+from db import SessionLocal, YouTubeCacheEntry
+
+
+logger = logging.getLogger(__name__)
+
+
+# How long a cached response is served without asking YouTube again
+CACHE_TTLS: dict[str, timedelta] = {
+    "video": timedelta(hours=24),
+    "playlist_items": timedelta(hours=1),
+    "channel_playlists": timedelta(hours=6),
+}
+# Videos missing from a videos.list response (deleted or private) are remembered for this
+# long, so re-runs skip them without an API call but soon notice one that comes back
+CACHE_MISSING_TTL: timedelta = timedelta(hours=1)
+# Shape of each cached resource. Payloads are stored as JSON and validated back into these
+# models, so a row in the cache table is only ever data, never code to run on load.
+# A cached video of None records one YouTube did not return.
+CACHE_MODELS: dict[str, Any] = {
+    "video": Video | None,
+    "playlist_items": list[list[PlaylistItem]],
+    "channel_playlists": list[list[Playlist]],
+}
+
+
+class CountingYouTube:
+    # Wraps a YouTube client for the length of one job and counts the API requests it makes.
+    # Paginated iterators are lazy, so each page they yield is counted as it is fetched.
+    def __init__(self, youtube):
+        self._youtube = youtube
+        self._lock = threading.Lock()
+        self.calls: int = 0
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+
+    def _count_pages(self, pages: Iterator) -> Iterator:
+        for page in pages:
+            self._count()
+            yield page
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._youtube, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            if name.endswith("_iterator"):
+                return self._count_pages(attribute(*args, **kwargs))
+            self._count()
+            return attribute(*args, **kwargs)
+
+        return call
+
+
+class YouTubeCache:
+    # Persistent response cache shared by every request, one youtube_cache row per resource.
+    # Expired rows are kept: their ETag tells a refetch whether anything actually changed.
+    def __init__(
+        self,
+        session_factory: Callable = SessionLocal,
+        ttls: dict[str, timedelta] = CACHE_TTLS,
+        models: dict[str, Any] = CACHE_MODELS,
+    ):
+        self.session_factory = session_factory
+        self.ttls = ttls
+        self._adapters: dict[str, TypeAdapter] = {resource: TypeAdapter(model) for resource, model in models.items()}
+        self._lock = threading.Lock()
+        self.counters: Counter = Counter()
+
+    def dump(self, resource: str, value: Any) -> str:
+        # By alias, so models whose fields carry the API's camelCase names validate back
+        return self._adapters[resource].dump_json(value, by_alias=True).decode()
+
+    def load(self, resource: str, payload: str) -> Any:
+        return self._adapters[resource].validate_json(payload)
+
+    def count(self, name: str, value: int = 1):
+        if value:
+            with self._lock:
+                self.counters[name] += value
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters: Counter = self.counters.copy()
+        lookups: int = counters["memo_hits"] + counters["hits"] + counters["misses"]
+        return {
+            "memo_hits": counters["memo_hits"],
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "revalidated": counters["revalidated"],
+            "hit_rate": (counters["memo_hits"] + counters["hits"]) / lookups if lookups else 0.0,
+        }
+
+    def get_many(self, keys: list[str]) -> dict[str, YouTubeCacheEntry]:
+        with self.session_factory() as db:
+            entries = db.execute(select(YouTubeCacheEntry).where(YouTubeCacheEntry.key.in_(keys))).scalars().all()
+        return {entry.key: entry for entry in entries}
+
+    def put_many(self, resource: str, values: dict[str, Any], ttl: timedelta | None = None):
+        expires_at: datetime = datetime.now(timezone.utc) + (ttl or self.ttls[resource])
+        rows: list[dict] = [
+            {"key": key, "etag": getattr(value, "etag", None), "payload": self.dump(resource, value), "expires_at": expires_at}
+            for key, value in values.items()
+        ]
+        statement = insert(YouTubeCacheEntry).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[YouTubeCacheEntry.key],
+            set_={
+                "etag": statement.excluded.etag,
+                "payload": statement.excluded.payload,
+                "expires_at": statement.excluded.expires_at,
+            },
+        )
+        with self.session_factory() as db:
+            db.execute(statement)
+            db.commit()
+
+    def touch_many(self, resource: str, keys: list[str]):
+        # Unchanged on YouTube: the stored payload stays, only its lifetime is renewed
+        expires_at: datetime = datetime.now(timezone.utc) + self.ttls[resource]
+        with self.session_factory() as db:
+            db.execute(update(YouTubeCacheEntry).where(YouTubeCacheEntry.key.in_(keys)).values(expires_at=expires_at))
+            db.commit()
+
+
+class CachedYouTube:
+    # Per-request view of a YouTube client: a memo so one request never asks for the same
+    # resource twice, backed by the persistent YouTubeCache so later requests do not either.
+    # Anything not cached here is passed straight through to the wrapped client.
+    def __init__(self, youtube, cache: YouTubeCache):
+        self._youtube = youtube
+        self._cache = cache
+        self._memo: dict[str, Any] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._youtube, name)
+
+    def _lookup(self, resource: str, ids: list[str]) -> tuple[dict[str, Any], dict[str, str | None]]:
+        # Returns fresh values by id, and the stored ETag of every id that has to be fetched
+        found: dict[str, Any] = {}
+        keys: dict[str, str] = {}
+        for resource_id in ids:
+            key: str = f"{resource}:{resource_id}"
+            if key in self._memo:
+                found[resource_id] = self._memo[key]
+            else:
+                keys[key] = resource_id
+        self._cache.count("memo_hits", len(found))
+        if not keys:
+            return found, {}
+        entries: dict[str, YouTubeCacheEntry] = self._cache.get_many(list(keys))
+        now: datetime = datetime.now(timezone.utc)
+        stale: dict[str, str | None] = {}
+        for key, resource_id in keys.items():
+            entry: YouTubeCacheEntry | None = entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                try:
+                    found[resource_id] = self._memo[key] = self._cache.load(resource, entry.payload)
+                    self._cache.count("hits")
+                    continue
+                except ValidationError as e:
+                    # Written by an older model version: refetch it, without trusting its ETag
+                    logger.warning("Discarding unreadable cache entry %s: %s", key, e)
+                    entry = None
+            stale[resource_id] = entry.etag if entry is not None else None
+            self._cache.count("misses")
+        return found, stale
+
+    def _store(self, resource: str, values: dict[str, Any], stale: dict[str, str | None]):
+        changed: dict[str, Any] = {}
+        unchanged: list[str] = []
+        for resource_id, value in values.items():
+            key: str = f"{resource}:{resource_id}"
+            self._memo[key] = value
+            etag: str | None = getattr(value, "etag", None)
+            if etag is not None and stale.get(resource_id) == etag:
+                unchanged.append(key)
+            else:
+                changed[key] = value
+        self._cache.count("revalidated", len(unchanged))
+        if unchanged:
+            self._cache.touch_many(resource, unchanged)
+        if changed:
+            self._cache.put_many(resource, changed)
+
+    def _pages(self, resource: str, resource_id: str, fetch: Callable[[], Iterator]) -> Iterator:
+        found, stale = self._lookup(resource, [resource_id])
+        if resource_id in found:
+            yield from found[resource_id]
+            return
+        pages: list[list] = []
+        for page in fetch():
+            page = list(page)
+            pages.append(page)
+            yield page
+        # Only a listing that was read to the end is worth caching
+        self._store(resource, {resource_id: pages}, stale)
+
+    def _store_missing(self, resource: str, ids: list[str]):
+        for resource_id in ids:
+            self._memo[f"{resource}:{resource_id}"] = None
+        self._cache.put_many(resource, {f"{resource}:{resource_id}": None for resource_id in ids}, ttl=CACHE_MISSING_TTL)
+
+    def find_video_by_id(self, video_id: str):
+        found, stale = self._lookup("video", [video_id])
+        # A video cached as missing is asked for again, so the caller gets YouTube's own error
+        if found.get(video_id) is not None:
+            return found[video_id]
+        video = self._youtube.find_video_by_id(video_id=video_id)
+        self._store("video", {video_id: video}, stale)
+        return video
+
+    def find_videos_by_ids(self, video_ids: list[str]) -> list:
+        found, stale = self._lookup("video", video_ids)
+        missing: list[str] = [video_id for video_id in video_ids if video_id not in found]
+        if missing:
+            try:
+                videos: list = self._youtube.find_videos_by_ids(video_ids=missing)
+            except VideoNotFoundException:
+                # Raised when none of the ids came back: every one of them is missing
+                videos = []
+            fetched: dict[str, Any] = {video.id: video for video in videos}
+            if fetched:
+                self._store("video", fetched, stale)
+            not_returned: list[str] = [video_id for video_id in missing if video_id not in fetched]
+            if not_returned:
+                self._store_missing("video", not_returned)
+            found.update(fetched)
+        return [found[video_id] for video_id in video_ids if found.get(video_id) is not None]
+
+    def get_playlist_items_iterator(self, playlist_id: str) -> Iterator:
+        return self._pages(
+            "playlist_items", playlist_id, lambda: self._youtube.get_playlist_items_iterator(playlist_id=playlist_id)
+        )
+
+    def get_channel_playlists_iterator(self, channel_id: str) -> Iterator:
+        return self._pages(
+            "channel_playlists", channel_id, lambda: self._youtube.get_channel_playlists_iterator(channel_id=channel_id)
+        )
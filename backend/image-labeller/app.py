@@ -2,23 +2,37 @@ from fastapi import FastAPI, Request, status, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from helpers import get_next_image, get_image_tags
 from schemas import ImageLabelRequest, ImageLabelResponse
 from image_router import router as router_image
 from contextlib import asynccontextmanager
-from helpers import create_all
-from db import get_db
-from helpers import get_image_service, get_tag_service
+from helpers import create_all, harmful_content_detection_service, garbage_collection_service
+from extensions import process_pool
+from db import get_db, engine
+from helpers import get_image_service, get_tag_service, get_annotator, ANNOTATOR_COOKIE
+import uuid
+import os
+import logging
+from query_counter import count_queries, get_query_budget, QueryBudgetExceeded
 from services import ImageService, TagService
 from image_label_router import router as router_image_label
+from tag_router import router as router_tag
+from stats_router import router as router_stats
+from export_router import router as router_export
 
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    create_all()
+    await create_all()
+    await harmful_content_detection_service.start()
+    await garbage_collection_service.start()
     yield
+    await garbage_collection_service.stop()
+    await harmful_content_detection_service.stop()
+    process_pool.shutdown(cancel_futures=True)
+    await engine.dispose()
 
 
 app: FastAPI = FastAPI(
@@ -46,6 +60,28 @@ templates = Jinja2Templates(directory="templates")
 
 app.include_router(router_image)
 app.include_router(router_image_label)
+app.include_router(router_tag)
+app.include_router(router_stats)
+app.include_router(router_export)
+
+# With QUERY_BUDGET_STRICT set, a read endpoint over its statement budget fails the request
+# instead of only logging, so N+1 regressions surface in development and CI runs.
+QUERY_BUDGET_STRICT: bool = os.getenv("QUERY_BUDGET_STRICT", "") not in ("", "0", "false")
+
+@app.middleware("http")
+async def enforce_query_budget(request: Request, call_next):
+    budget: int | None = get_query_budget(request.url.path)
+    if budget is None or request.method != "GET":
+        return await call_next(request)
+    with count_queries() as counter:
+        response = await call_next(request)
+    response.headers["X-Query-Count"] = str(counter.count)
+    if counter.count > budget:
+        error: QueryBudgetExceeded = QueryBudgetExceeded(request.url.path, counter.count, budget)
+        logging.getLogger(__name__).warning(str(error))
+        if QUERY_BUDGET_STRICT:
+            return JSONResponse(status_code=500, content={"detail": str(error)})
+    return response
 
 @app.get("/")
 async def root():
@@ -56,19 +92,32 @@ async def health():
     return {"status": "ok"}
 
 @app.get("/images/label", response_class=HTMLResponse, status_code=status.HTTP_200_OK)
-async def label_image(request: Request, image_service: ImageService = Depends(get_image_service), tag_service: TagService = Depends(get_tag_service)):
-    image_id, image_url = await get_next_image(request, image_service)
-    tags = await get_image_tags(tag_service) + ["None"]
-    print(tags)
-    return templates.TemplateResponse(
+async def label_image(
+    request: Request, 
+    image_service: ImageService = Depends(get_image_service), 
+    tag_service: TagService = Depends(get_tag_service),
+    annotator: str = Depends(get_annotator)):
+    # Each browser gets its own annotator id so leases are not shared behind one address
+    issue_cookie: bool = ANNOTATOR_COOKIE not in request.cookies and "x-annotator-id" not in request.headers
+    if issue_cookie:
+        annotator = str(uuid.uuid4())
+    image_id, image_url, image_fallback_url = await get_next_image(request, image_service, annotator)
+    tags_version, tags = await get_image_tags(tag_service)
+    tags = tags + ["None"]
+    response = templates.TemplateResponse(
         name="label_image.html", 
         request=request,
         context={
             "image_id": image_id,
             "image_src": image_url,
-            "tags": tags
+            "image_fallback_src": image_fallback_url,
+            "tags": tags,
+            "tags_version": tags_version
         }
     )
+    if issue_cookie:
+        response.set_cookie(ANNOTATOR_COOKIE, annotator, httponly=True, samesite="lax")
+    return response
 
 
 if __name__ == "__main__":
@@ -0,0 +1,361 @@
+import argparse
+import asyncio
+import math
+import random
+import statistics
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import httpx
+from sqlalchemy import select, update, insert, func
+from app import app
+from db import AsyncSessionLocal, Image, ImageLabel, ImageLabelTag, engine
+from helpers import create_all
+from perceptual_hash import BKTree, hamming_distance
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, STREAM_BATCH_SIZE
+from query_counter import QUERY_BUDGETS, QueryBudgetExceeded, count_queries, query_budget
+from schemas import ImageRead, ImageLabelBatchItem
+from services import (
+    ImageService, DeduplicationService, DerivativeService, TagService, ImageLabellingService, MAX_DUPLICATE_DISTANCE
+)
+
+# Rows per INSERT when seeding; keeps each statement well under the bind parameter limit
+SEED_BATCH_SIZE: int = 5000
+BENCHMARK_TAGS: tuple[str, ...] = ("smiling", "glasses", "beard", "hat", "outdoor", "blurry", "profile", "group")
+
+
+def require_postgres():
+    # SQLite serialises writers, so concurrency numbers measured there say nothing about production
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("This benchmark needs DATABASE_URL to point at Postgres")
+
+
+def percentiles(samples: list[float]) -> str:
+    if len(samples) < 2:
+        return f"p50={1000 * sum(samples):.1f}ms"
+    cuts: list[float] = statistics.quantiles(samples, n=100)
+    return f"p50={1000 * cuts[49]:.1f}ms p95={1000 * cuts[94]:.1f}ms p99={1000 * cuts[98]:.1f}ms"
+
+
+async def seed_images(prefix: str, start: int, stop: int, labelled: bool = False):
+    # Spread date_created so the queue order is deterministic, as it is for real uploads
+    base: datetime = datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as session:
+        for batch_start in range(start, stop, SEED_BATCH_SIZE):
+            await session.execute(insert(Image), [
+                {
+                    "id": f"{prefix}-{index}",
+                    "date_created": base + timedelta(microseconds=index),
+                    "labelled": labelled,
+                    "extension": "jpg",
+                }
+                for index in range(batch_start, min(batch_start + SEED_BATCH_SIZE, stop))
+            ])
+            await session.commit()
+
+
+async def count_images() -> int:
+    async with AsyncSessionLocal() as session:
+        return await session.scalar(select(func.count()).select_from(Image)) or 0
+
+
+async def benchmark_claim(args: argparse.Namespace):
+    require_postgres()
+    await create_all()
+    prefix: str = f"bench-{uuid.uuid4().hex[:8]}"
+    seeded: int = 0
+    for size in sorted(args.sizes):
+        await seed_images(prefix, seeded, size)
+        seeded = size
+        # Every run starts from a free queue, so later sizes are not starved by earlier leases
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(Image)
+                .where(Image.id.like(f"{prefix}-%"))
+                .values(claimed_by=None, lease_expires_at=None)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        claims: dict[str, list[str]] = {}
+        latencies: list[float] = []
+
+        async def annotate(annotator: str):
+            # Each annotator has its own session, as each request does in the app
+            async with AsyncSessionLocal() as session:
+                image_service = ImageService(session, DeduplicationService(session), DerivativeService(session))
+                claimed: list[str] = []
+                for _ in range(args.rounds):
+                    started: float = time.perf_counter()
+                    images: list[ImageRead] = await image_service.claim_next_images(annotator, args.count)
+                    latencies.append(time.perf_counter() - started)
+                    claimed.extend(image.id for image in images)
+                claims[annotator] = claimed
+
+        started: float = time.perf_counter()
+        await asyncio.gather(*(annotate(f"{prefix}-annotator-{index}") for index in range(args.annotators)))
+        elapsed: float = time.perf_counter() - started
+
+        counts: Counter = Counter(id for claimed in claims.values() for id in claimed)
+        duplicates: list[str] = [id for id, count in counts.items() if count > 1]
+        total_rows: int = await count_images()
+        print(
+            f"rows={total_rows:<9} annotators={args.annotators} claims={len(latencies)} images={len(counts)} "
+            f"seconds={elapsed:.2f} {percentiles(latencies)}"
+        )
+        if duplicates:
+            raise SystemExit(f"{len(duplicates)} images were claimed by more than one annotator, e.g. {duplicates[:5]}")
+
+
+def make_label_items(prefix: str, start: int, stop: int, tags: int) -> list[ImageLabelBatchItem]:
+    return [
+        ImageLabelBatchItem(
+            image_id=f"{prefix}-{index}",
+            gender="female" if index % 2 else "male",
+            description=f"Benchmark label {index}",
+            tags=[BENCHMARK_TAGS[(index + offset) % len(BENCHMARK_TAGS)] for offset in range(tags)],
+        )
+        for index in range(start, stop)
+    ]
+
+
+async def label_per_tag(session, tag_service: TagService, item: ImageLabelBatchItem):
+    # The write path label_images replaced: the label, then every tag and link in its own commit
+    if await session.get(Image, item.image_id) is None:
+        raise SystemExit(f"Image {item.image_id} is missing")
+    id: str = str(uuid.uuid4())
+    session.add(ImageLabel(id=id, image_id=item.image_id, gender=item.gender, description=item.description))
+    await session.commit()
+    for tag_name in item.tags:
+        tag = await tag_service.create_tag(tag_name)
+        if await tag_service.get_image_label_tag(id, tag.id) is None:
+            session.add(ImageLabelTag(id=str(uuid.uuid4()), image_label_id=id, tag_id=tag.id))
+            await session.commit()
+    await session.execute(
+        update(Image)
+        .where(Image.id == item.image_id)
+        .values(labelled=True, claimed_by=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+
+async def benchmark_label(args: argparse.Namespace):
+    await create_all()
+    prefix: str = f"bench-{uuid.uuid4().hex[:8]}"
+    await seed_images(prefix, 0, 2 * args.labels)
+    async with AsyncSessionLocal() as session:
+        tag_service = TagService(session)
+        labelling_service = ImageLabellingService(
+            session, ImageService(session, DeduplicationService(session), DerivativeService(session)), tag_service
+        )
+        items: list[ImageLabelBatchItem] = make_label_items(prefix, 0, args.labels, args.tags)
+        started: float = time.perf_counter()
+        for start in range(0, len(items), args.batch_size):
+            await labelling_service.label_images(items[start:start + args.batch_size])
+        elapsed: float = time.perf_counter() - started
+        print(f"batch:   labels={len(items)} tags/label={args.tags} batch_size={args.batch_size} seconds={elapsed:.2f} labels/s={len(items) / elapsed:.0f}")
+
+        items = make_label_items(prefix, args.labels, 2 * args.labels, args.tags)
+        started = time.perf_counter()
+        for item in items:
+            await label_per_tag(session, tag_service, item)
+        elapsed = time.perf_counter() - started
+        print(f"per-tag: labels={len(items)} tags/label={args.tags} seconds={elapsed:.2f} labels/s={len(items) / elapsed:.0f}")
+
+
+async def check_query_budget(args: argparse.Namespace):
+    # Walks the label read endpoints through the ASGI app and fails if any request issues
+    # more statements than QUERY_BUDGETS allows, whatever the page size or filter.
+    await create_all()
+    prefix: str = f"bench-{uuid.uuid4().hex[:8]}"
+    await seed_images(prefix, 0, args.labels)
+    async with AsyncSessionLocal() as session:
+        tag_service = TagService(session)
+        labelling_service = ImageLabellingService(
+            session, ImageService(session, DeduplicationService(session), DerivativeService(session)), tag_service
+        )
+        items: list[ImageLabelBatchItem] = make_label_items(prefix, 0, args.labels, args.tags)
+        for start in range(0, len(items), 500):
+            await labelling_service.label_images(items[start:start + 500])
+
+    failures: list[str] = []
+
+    async def get(client: httpx.AsyncClient, path: str, params: dict | None = None) -> tuple[httpx.Response, int]:
+        try:
+            with query_budget(path, QUERY_BUDGETS[path]) as counter:
+                response: httpx.Response = await client.get(path, params=params)
+        except QueryBudgetExceeded as e:
+            # Keep walking: one report listing every request over budget is more useful
+            failures.append(f"{e} (params={params})")
+        response.raise_for_status()
+        return response, counter.count
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        for filters in ({}, {"tag": BENCHMARK_TAGS[0]}, {"gender": "female"}):
+            for limit in (10, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE):
+                pages: int = 0
+                most: int = 0
+                cursor: str | None = None
+                while True:
+                    params = {**filters, "limit": limit, **({"cursor": cursor} if cursor else {})}
+                    response, statements = await get(client, "/images/labels", params)
+                    pages += 1
+                    most = max(most, statements)
+                    cursor = response.json()["next_cursor"]
+                    if cursor is None:
+                        break
+                print(f"/images/labels filters={filters} limit={limit:<5} pages={pages:<4} max_statements={most}")
+
+        # A stream costs the page budget once per batch, never once per label
+        with count_queries() as counter:
+            response = await client.get("/images/labels", params={"stream": "true"})
+        response.raise_for_status()
+        rows: int = len(response.text.splitlines())
+        budget: int = QUERY_BUDGETS["/images/labels"] * max(1, math.ceil(rows / STREAM_BATCH_SIZE))
+        print(f"/images/labels stream rows={rows} statements={counter.count} budget={budget}")
+        if counter.count > budget:
+            failures.append(f"/images/labels?stream=true issued {counter.count} statements, budget is {budget}")
+
+        _, statements = await get(client, "/stats")
+        print(f"/stats statements={statements}")
+
+    if failures:
+        raise SystemExit("Query budgets exceeded:\n" + "\n".join(failures))
+
+
+async def benchmark_dedup(args: argparse.Namespace):
+    # In-memory only: BK-tree build and lookup time against the linear scan it replaced
+    generator: random.Random = random.Random(args.seed)
+    for size in args.sizes:
+        hashes: list[int] = [generator.getrandbits(64) for _ in range(size)]
+        # Half the queries are near-copies of stored hashes, so lookups have matches to return
+        queries: list[int] = [
+            hashes[generator.randrange(size)] ^ (1 << generator.randrange(64)) if index % 2 else generator.getrandbits(64)
+            for index in range(args.queries)
+        ]
+        tree: BKTree = BKTree()
+        started: float = time.perf_counter()
+        for index, hash_value in enumerate(hashes):
+            tree.add(hash_value, str(index))
+        build: float = time.perf_counter() - started
+
+        started = time.perf_counter()
+        tree_matches: list[int] = [len(tree.search(query, args.max_distance)) for query in queries]
+        tree_seconds: float = (time.perf_counter() - started) / len(queries)
+
+        linear_queries: list[int] = queries[:args.linear_queries]
+        started = time.perf_counter()
+        linear_matches: list[int] = [
+            sum(hamming_distance(query, hash_value) <= args.max_distance for hash_value in hashes) for query in linear_queries
+        ]
+        linear_seconds: float = (time.perf_counter() - started) / max(len(linear_queries), 1)
+        if linear_matches != tree_matches[:len(linear_matches)]:
+            raise SystemExit("BK-tree and linear scan disagree")
+        print(
+            f"hashes={size:<8} build={build:.2f}s tree={1000 * tree_seconds:.2f}ms/query "
+            f"linear={1000 * linear_seconds:.2f}ms/query speedup={linear_seconds / tree_seconds:.0f}x"
+        )
+
+
+async def benchmark_load(args: argparse.Namespace):
+    # Requests per second through the ASGI app at several concurrency levels. With the async
+    # engine, requests waiting on the database let the others run, so throughput should rise
+    # with concurrency until the connection pool is saturated instead of staying flat.
+    await create_all()
+    prefix: str = f"bench-{uuid.uuid4().hex[:8]}"
+    await seed_images(prefix, 0, args.images)
+    async with AsyncSessionLocal() as session:
+        labelling_service = ImageLabellingService(
+            session, ImageService(session, DeduplicationService(session), DerivativeService(session)), TagService(session)
+        )
+        items: list[ImageLabelBatchItem] = make_label_items(prefix, 0, args.images // 2, 4)
+        for start in range(0, len(items), 500):
+            await labelling_service.label_images(items[start:start + 500])
+
+    def make_request(index: int) -> tuple[str, str, dict]:
+        kind: int = index % 4
+        if kind == 0:
+            return "GET", "/images/labels", {"params": {"limit": 20}}
+        if kind == 1:
+            return "GET", "/get_image", {"params": {"id": f"{prefix}-{index % args.images}"}}
+        if kind == 2:
+            return "GET", "/stats", {}
+        return "POST", "/images/claim", {"headers": {"X-Annotator-Id": f"{prefix}-annotator-{index % 50}"}}
+
+    baseline: float | None = None
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        for concurrency in args.concurrency:
+            next_request: int = 0
+            latencies: list[float] = []
+
+            async def worker():
+                nonlocal next_request
+                while next_request < args.requests:
+                    method, path, options = make_request(next_request)
+                    next_request += 1
+                    started: float = time.perf_counter()
+                    response: httpx.Response = await client.request(method, path, **options)
+                    latencies.append(time.perf_counter() - started)
+                    response.raise_for_status()
+
+            started: float = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed: float = time.perf_counter() - started
+            throughput: float = len(latencies) / elapsed
+            baseline = baseline or throughput
+            print(
+                f"concurrency={concurrency:<4} requests={len(latencies)} seconds={elapsed:.2f} "
+                f"requests/s={throughput:.0f} scaling={throughput / baseline:.1f}x {percentiles(latencies)}"
+            )
+
+
+async def run(args: argparse.Namespace):
+    try:
+        await args.handler(args)
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image labeller benchmarks; run them against a scratch database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    claim_parser = subparsers.add_parser("claim", help="Concurrent annotators claiming from the queue as the table grows")
+    claim_parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    claim_parser.add_argument("--annotators", type=int, default=50)
+    claim_parser.add_argument("--rounds", type=int, default=20)
+    claim_parser.add_argument("--count", type=int, default=1, help="Images per claim")
+    claim_parser.set_defaults(handler=benchmark_claim)
+
+    label_parser = subparsers.add_parser("label", help="Labels per second, batch write path against the per-tag path")
+    label_parser.add_argument("--labels", type=int, default=2000)
+    label_parser.add_argument("--tags", type=int, default=4, help="Tags per label")
+    label_parser.add_argument("--batch-size", type=int, default=50)
+    label_parser.set_defaults(handler=benchmark_label)
+
+    dedup_parser = subparsers.add_parser("dedup", help="Near-duplicate lookups, BK-tree against a linear scan")
+    dedup_parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    dedup_parser.add_argument("--queries", type=int, default=1000)
+    dedup_parser.add_argument("--linear-queries", type=int, default=20)
+    dedup_parser.add_argument("--max-distance", type=int, default=MAX_DUPLICATE_DISTANCE)
+    dedup_parser.add_argument("--seed", type=int, default=0)
+    dedup_parser.set_defaults(handler=benchmark_dedup)
+
+    load_parser = subparsers.add_parser("load", help="Request throughput through the app as concurrency grows")
+    load_parser.add_argument("--images", type=int, default=10_000)
+    load_parser.add_argument("--requests", type=int, default=2000, help="Requests per concurrency level")
+    load_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    load_parser.set_defaults(handler=benchmark_load)
+
+    query_budget_parser = subparsers.add_parser("query-budget", help="Check label read endpoints stay within their statement budgets")
+    query_budget_parser.add_argument("--labels", type=int, default=2500)
+    query_budget_parser.add_argument("--tags", type=int, default=4, help="Tags per label")
+    query_budget_parser.set_defaults(handler=check_query_budget)
+
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
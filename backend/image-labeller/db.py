@@ -1,8 +1,11 @@
-from sqlalchemy import String, create_engine, DateTime, Boolean, Text, ForeignKey
-from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy import String, DateTime, Boolean, Text, ForeignKey, Index, Integer, BigInteger, Float, JSON, text
+from sqlalchemy.orm import DeclarativeBase
 from datetime import datetime, timezone
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.dialects import postgresql, sqlite
+import os
 
 
 POSTGRES_USER: str = "lyle"
@@ -10,18 +13,31 @@ POSTGRES_PASSWORD: str = "lyle"
 POSTGRES_DB: str = "faces"
 POSTGRES_HOST: str = "0.0.0.0"
 POSTGRES_PORT: int = 5432
+DB_POOL_SIZE: int = 20
+DB_MAX_OVERFLOW: int = 10
 
-db_url = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+# Override with e.g. sqlite+aiosqlite:///faces.db for local runs
+db_url = os.getenv(
+    "DATABASE_URL", 
+    f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+)
 
-engine = create_engine(db_url)
-SessionLocal = sessionmaker(bind=engine)
+engine = create_async_engine(
+    db_url, 
+    **({"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_pre_ping": True} if db_url.startswith("postgresql") else {})
+)
+# Loaded attributes stay readable after commit; lazy loads are not possible on an AsyncSession anyway
+AsyncSessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+def dialect_insert(session: AsyncSession):
+    # INSERT ... ON CONFLICT is dialect specific; both supported backends share the same API
+    if session.bind.dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
 
 class Base(DeclarativeBase):
     pass
@@ -29,14 +45,56 @@ class Base(DeclarativeBase):
 class Image(Base):
     __tablename__ = "images"
     id: Mapped[str] = mapped_column(String(255), primary_key=True)
-    date_created: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.now(timezone.utc))
+    date_created: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     labelled: Mapped[bool] = mapped_column(Boolean, default=False)
     extension: Mapped[str] = mapped_column(String(255), default="jpg")
+    sha256: Mapped[str] = mapped_column(String(64), nullable=True, index=True)
+    # Content-addressed location (ab/cd/<sha256>.<ext>); NULL for files still in the flat legacy layout
+    storage_key: Mapped[str] = mapped_column(String(255), nullable=True)
+    size_bytes: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    # 64-bit difference hash as hex, used for near-duplicate lookups
+    dhash: Mapped[str] = mapped_column(String(16), nullable=True, index=True)
+    # When dhash was written (upload, ingest or backfill); the duplicate index catches up on this
+    hashed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+    # Header metadata with EXIF orientation applied, so width x height is the displayed shape
+    width: Mapped[int] = mapped_column(Integer, nullable=True, index=True)
+    height: Mapped[int] = mapped_column(Integer, nullable=True, index=True)
+    format: Mapped[str] = mapped_column(String(16), nullable=True)
+    mode: Mapped[str] = mapped_column(String(16), nullable=True)
+    orientation: Mapped[int] = mapped_column(Integer, nullable=True)
+    # Row of this image's vector in the memory-mapped embedding matrix
+    embedding_row: Mapped[int] = mapped_column(Integer, nullable=True, index=True)
+    # Filled in asynchronously by the screening pipeline; flagged images never reach annotators
+    harm_score: Mapped[float] = mapped_column(Float, nullable=True)
+    flagged: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Resized derivatives on disk: variant name -> {"width", "height", "format"}
+    variants: Mapped[dict] = mapped_column(JSON(none_as_null=True), nullable=True)
+    # Work queue lease: an unlabelled image is handed to one annotator at a time
+    # and comes back to the queue once the lease expires.
+    claimed_by: Mapped[str] = mapped_column(String(255), nullable=True, index=True)
+    lease_expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Soft delete: hidden from every read path at once, files and row are purged later by the GC
+    deleted_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Keyset pagination walks (date_created, id)
+        Index("ix_images_date_created_id", "date_created", "id"),
+        Index(
+            "ix_images_queue", "date_created", "id",
+            postgresql_where=text("labelled = false AND deleted_at IS NULL"),
+            sqlite_where=text("labelled = 0 AND deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_images_deleted_at", "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+            sqlite_where=text("deleted_at IS NOT NULL"),
+        ),
+    )
 
 class Tag(Base):
     __tablename__ = "tags"
     id: Mapped[str] = mapped_column(String(255), primary_key=True)
-    name: Mapped[str] = mapped_column(String(255))
+    name: Mapped[str] = mapped_column(String(255), unique=True)
 
     image_label_tags: Mapped[list['ImageLabelTag']] = relationship("ImageLabelTag", back_populates="tag")
 
@@ -44,17 +102,43 @@ class ImageLabel(Base):
     __tablename__ = "image_labels"
     
     id: Mapped[str] = mapped_column(String(255), primary_key=True)
-    image_id: Mapped[str] = mapped_column(String(255))
+    image_id: Mapped[str] = mapped_column(String(255), index=True)
     gender: Mapped[str] = mapped_column(String(255))
     description: Mapped[str] = mapped_column(Text)
+    date_created: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ix_image_labels_date_created_id", "date_created", "id"),
+    )
 
     image_label_tags: Mapped[list['ImageLabelTag']] = relationship("ImageLabelTag", back_populates="image_label")
 
 class ImageLabelTag(Base):
     __tablename__ = "image_label_tags"
     id: Mapped[str] = mapped_column(String(255), primary_key=True)
-    image_label_id: Mapped[str] = mapped_column(String(255), ForeignKey("image_labels.id"))
-    tag_id: Mapped[str] = mapped_column(String(255), ForeignKey("tags.id"))
+    image_label_id: Mapped[str] = mapped_column(String(255), ForeignKey("image_labels.id"), index=True)
+    tag_id: Mapped[str] = mapped_column(String(255), ForeignKey("tags.id"), index=True)
 
     image_label: Mapped['ImageLabel'] = relationship("ImageLabel", back_populates="image_label_tags")
-    tag: Mapped['Tag'] = relationship("Tag", back_populates="image_label_tags")
\ No newline at end of file
+    tag: Mapped['Tag'] = relationship("Tag", back_populates="image_label_tags")
+
+class Blob(Base):
+    # Number of images pointing at a stored file; the file is removed when it drops to zero
+    __tablename__ = "blobs"
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    ref_count: Mapped[int] = mapped_column(Integer, default=0)
+
+class CatalogueVersion(Base):
+    # One row per cached catalogue; bumped in the same transaction as every write so
+    # each worker process can tell its in-memory copy is stale with a single-row read.
+    __tablename__ = "catalogue_versions"
+    name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+
+class LabellingStat(Base):
+    # Running counters kept up to date inside the writing transactions, keyed by
+    # (scope, key), e.g. ("tag", "smiling") or ("day", "2024-05-01")
+    __tablename__ = "labelling_stats"
+    scope: Mapped[str] = mapped_column(String(32), primary_key=True)
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    count: Mapped[int] = mapped_column(BigInteger, default=0)
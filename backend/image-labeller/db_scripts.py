@@ -0,0 +1,351 @@
+import argparse
+import asyncio
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select, update, insert, delete, func, inspect, text
+from db import AsyncSessionLocal, Base, Image, ImageLabel, ImageLabelTag, Tag, LabellingStat, engine
+from services import (
+    ImageService, DeduplicationService, DerivativeService, StatsService, ExportService, EmbeddingService, get_image_path,
+    UPLOAD_CHUNK_SIZE, GarbageCollectionService, MetadataService,
+    EXPORT_WORKERS, STATS_IMAGES
+)
+from export import EXPORT_FORMATS, DEFAULT_MAX_SHARD_BYTES
+from extensions import storage, process_pool
+from ingest import find_images, batched, inspect_image, stage_copy
+from storage import make_key
+
+
+async def backfill_dhash(args: argparse.Namespace):
+    async with AsyncSessionLocal() as session:
+        hashed: int = await DeduplicationService(session).backfill(batch_size=args.batch_size)
+    print(f"Hashed {hashed} images")
+
+
+async def backfill_derivatives(args: argparse.Namespace):
+    async with AsyncSessionLocal() as session:
+        generated: int = await DerivativeService(session).backfill(batch_size=args.batch_size)
+    print(f"Generated derivatives for {generated} images")
+
+
+async def backfill_embeddings(args: argparse.Namespace):
+    async with AsyncSessionLocal() as session:
+        embedded: int = await EmbeddingService(session).backfill(batch_size=args.batch_size)
+    print(f"Embedded {embedded} images")
+
+
+async def collect_garbage(args: argparse.Namespace):
+    garbage_collection_service: GarbageCollectionService = GarbageCollectionService(
+        batch_size=args.batch_size, workers=args.workers, grace_period=timedelta(minutes=args.grace_minutes)
+    )
+    try:
+        collected: int = await garbage_collection_service.collect()
+    finally:
+        await garbage_collection_service.stop()
+    print(f"Purged {collected} deleted images")
+
+
+async def backfill_metadata(args: argparse.Namespace):
+    async with AsyncSessionLocal() as session:
+        extracted: int = await MetadataService(session).backfill(batch_size=args.batch_size)
+    print(f"Extracted metadata for {extracted} images")
+
+
+async def rebuild_stats(args: argparse.Namespace):
+    async with AsyncSessionLocal() as session:
+        drifted: dict[tuple[str, str], tuple[int, int]] = await StatsService(session).rebuild()
+    for (scope, key), (stored, computed) in drifted.items():
+        print(f"{scope}/{key}: stored {stored}, recomputed {computed}")
+    print(f"Rebuilt stats, {len(drifted)} counters had drifted")
+
+
+async def export_dataset(args: argparse.Namespace):
+    export_service: ExportService = ExportService(max_shard_bytes=args.max_shard_mb * 1024 * 1024, workers=args.workers)
+    shards_before: int = len((export_service.get_manifest(args.name) or {"shards": []})["shards"])
+    manifest: dict = await export_service.export(args.name, args.format)
+    print(f"Wrote {len(manifest['shards']) - shards_before} shards, {manifest['rows']} rows in total, {manifest['skipped']} skipped")
+
+
+def stage_legacy_file(id: str, extension: str) -> dict | None:
+    # Hard-links (or copies) the flat file into staging so the original stays in place
+    # until the new location is committed; an interrupted run can simply be repeated.
+    legacy_path: str = get_image_path(id, extension)
+    if not os.path.exists(legacy_path):
+        return None
+    sha256 = hashlib.sha256()
+    with open(legacy_path, "rb") as legacy_file:
+        while chunk := legacy_file.read(UPLOAD_CHUNK_SIZE):
+            sha256.update(chunk)
+    staged_path: str = storage.staging_path(extension)
+    try:
+        os.link(legacy_path, staged_path)
+    except OSError:
+        shutil.copyfile(legacy_path, staged_path)
+    return {
+        "id": id,
+        "sha256": sha256.hexdigest(),
+        "storage_key": make_key(sha256.hexdigest(), extension),
+        "size_bytes": os.path.getsize(legacy_path),
+        "staged_path": staged_path,
+        "legacy_path": legacy_path,
+    }
+
+async def migrate_storage(args: argparse.Namespace):
+    migrated: int = 0
+    last_id: str = ""
+    async with AsyncSessionLocal() as session:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            image_service: ImageService = ImageService(session, DeduplicationService(session), DerivativeService(session))
+            loop = asyncio.get_running_loop()
+            while True:
+                images: list[tuple[str, str]] = list((await session.execute(
+                    select(Image.id, Image.extension)
+                    .where(Image.storage_key.is_(None), Image.id > last_id)
+                    .order_by(Image.id)
+                    .limit(args.batch_size)
+                )).all())
+                if not images:
+                    break
+                last_id = images[-1][0]
+                staged: list[dict | None] = await asyncio.gather(
+                    *(loop.run_in_executor(executor, stage_legacy_file, id, extension) for id, extension in images)
+                )
+                rows: list[dict] = [row for row in staged if row is not None]
+                if not rows:
+                    continue
+                await image_service.acquire_blobs([row["storage_key"] for row in rows])
+                for row in rows:
+                    await storage.put(row["staged_path"], row["storage_key"])
+                await session.execute(update(Image), [
+                    {key: row[key] for key in ("id", "sha256", "storage_key", "size_bytes")} for row in rows
+                ])
+                await session.commit()
+                image_service.remove_files([row["legacy_path"] for row in rows])
+                migrated += len(rows)
+                print(f"Migrated {migrated} images")
+    print(f"Done: migrated {migrated} images")
+
+
+def upgrade_schema(connection) -> list[str]:
+    # create_all only creates missing tables, so columns and indexes added to existing ones
+    # are added here. Every step checks first; running it twice changes nothing.
+    changes: list[str] = []
+    inspector = inspect(connection)
+    existing_tables: set[str] = set(inspector.get_table_names())
+    quote = connection.dialect.identifier_preparer.quote
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns: set[str] = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                connection.execute(text(
+                    f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=connection.dialect)}"
+                ))
+                changes.append(f"added {table.name}.{column.name}")
+
+    # Labels from before date_created existed all sort first, in id order
+    backfilled = connection.execute(
+        update(ImageLabel).where(ImageLabel.date_created.is_(None)).values(date_created=datetime(1970, 1, 1, tzinfo=timezone.utc))
+    )
+    if backfilled.rowcount:
+        changes.append(f"backfilled date_created of {backfilled.rowcount} labels")
+
+    if "tags" in existing_tables:
+        unique_names: bool = any(
+            constraint["column_names"] == ["name"] for constraint in inspector.get_unique_constraints("tags")
+        ) or any(index["unique"] and index["column_names"] == ["name"] for index in inspector.get_indexes("tags"))
+        if not unique_names:
+            # Tags were created per label without a lookup, so a name can have many rows:
+            # keep the oldest id and point every label tag at it before the index goes on
+            duplicates: list[tuple[str, str]] = list(connection.execute(
+                select(Tag.name, func.min(Tag.id)).group_by(Tag.name).having(func.count() > 1)
+            ).all())
+            for name, kept_id in duplicates:
+                dropped_ids = select(Tag.id).where(Tag.name == name, Tag.id != kept_id).scalar_subquery()
+                connection.execute(update(ImageLabelTag).where(ImageLabelTag.tag_id.in_(dropped_ids)).values(tag_id=kept_id))
+                connection.execute(delete(Tag).where(Tag.name == name, Tag.id != kept_id))
+            if duplicates:
+                changes.append(f"merged duplicate rows of {len(duplicates)} tag names")
+            connection.execute(text("CREATE UNIQUE INDEX uq_tags_name ON tags (name)"))
+            changes.append("added unique index on tags.name")
+
+    existing_indexes: dict[str, set[str]] = {
+        table: {index["name"] for index in inspector.get_indexes(table)} for table in existing_tables
+    }
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if table.name in existing_tables and index.name not in existing_indexes[table.name]:
+                index.create(connection)
+                changes.append(f"added index {index.name}")
+
+    Base.metadata.create_all(connection)
+    return changes
+
+
+async def migrate_schema(args: argparse.Namespace):
+    async with engine.begin() as connection:
+        had_stats: bool = await connection.run_sync(
+            lambda sync_connection: inspect(sync_connection).has_table(LabellingStat.__tablename__)
+        )
+        changes: list[str] = await connection.run_sync(upgrade_schema)
+    for change in changes:
+        print(change)
+    if not had_stats:
+        # The counters start empty on a database that already has labels
+        async with AsyncSessionLocal() as session:
+            await StatsService(session).rebuild()
+        changes.append("seeded labelling stats")
+        print("seeded labelling stats")
+    print(f"Schema is up to date, {len(changes)} changes")
+
+
+async def ingest(args: argparse.Namespace):
+    # Files are hashed and decoded in the process pool, copied into the store by threads and
+    # registered with one multi-row insert and one commit per batch. Content already in the
+    # images table is skipped, so re-running over the same tree only picks up new files.
+    started: float = time.monotonic()
+    counts: Counter = Counter()
+    async with AsyncSessionLocal() as session:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            image_service: ImageService = ImageService(session, DeduplicationService(session), DerivativeService(session))
+            loop = asyncio.get_running_loop()
+            for paths in batched(find_images(args.directory), args.batch_size):
+                inspected: list[dict] = await asyncio.gather(
+                    *(loop.run_in_executor(process_pool, inspect_image, path) for path in paths)
+                )
+                images_by_hash: dict[str, dict] = {}
+                for image in inspected:
+                    if "error" in image:
+                        print(f"Skipping {image['path']}: {image['error']}")
+                        counts["invalid"] += 1
+                    elif image["sha256"] in images_by_hash:
+                        counts["duplicates"] += 1
+                    else:
+                        images_by_hash[image["sha256"]] = image
+                if images_by_hash:
+                    existing: set[str] = set((await session.scalars(
+                        select(Image.sha256).where(Image.sha256.in_(images_by_hash.keys()), Image.deleted_at.is_(None))
+                    )).all())
+                    counts["duplicates"] += len(existing)
+                    new_images: list[dict] = [image for sha256, image in images_by_hash.items() if sha256 not in existing]
+                else:
+                    new_images = []
+                counts["files"] += len(paths)
+                if new_images:
+                    staged_paths: list[str] = [storage.staging_path(image["extension"]) for image in new_images]
+                    date_created: datetime = datetime.now(timezone.utc)
+                    rows: list[dict] = [
+                        {
+                            "id": str(uuid.uuid4()),
+                            "extension": image["extension"],
+                            "sha256": image["sha256"],
+                            "storage_key": make_key(image["sha256"], image["extension"]),
+                            "size_bytes": image["size_bytes"],
+                            "dhash": image["dhash"],
+                            "hashed_at": date_created if image["dhash"] is not None else None,
+                            "date_created": date_created,
+                            "labelled": False,
+                            **image["metadata"]
+                        }
+                        for image in new_images
+                    ]
+                    try:
+                        await asyncio.gather(*(
+                            loop.run_in_executor(executor, stage_copy, image["path"], staged_path) 
+                            for image, staged_path in zip(new_images, staged_paths)
+                        ))
+                        embedding_rows: list[int | None] = await image_service.embedding_service.add(
+                            [image["embedding"] for image in new_images]
+                        )
+                        for row, embedding_row in zip(rows, embedding_rows):
+                            row["embedding_row"] = embedding_row
+                        await image_service.acquire_blobs([row["storage_key"] for row in rows])
+                        for staged_path, row in zip(staged_paths, rows):
+                            await storage.put(staged_path, row["storage_key"])
+                        await session.execute(insert(Image), rows)
+                        await image_service.stats_service.increment(Counter({(STATS_IMAGES, "total"): len(rows)}))
+                        await session.commit()
+                    except Exception:
+                        await session.rollback()
+                        image_service.remove_files([path for path in staged_paths if os.path.exists(path)])
+                        raise
+                    counts["ingested"] += len(rows)
+                    counts["bytes"] += sum(row["size_bytes"] for row in rows)
+                elapsed: float = time.monotonic() - started
+                print(
+                    f"{counts['files']} files: {counts['ingested']} ingested, {counts['duplicates']} already ingested, "
+                    f"{counts['invalid']} invalid | {counts['files'] / elapsed:.0f} files/s, "
+                    f"{counts['bytes'] / elapsed / (1024 * 1024):.1f} MB/s ingested"
+                )
+    print(f"Done: ingested {counts['ingested']} of {counts['files']} files in {time.monotonic() - started:.1f}s")
+
+
+async def run(args: argparse.Namespace):
+    try:
+        await args.handler(args)
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image labeller maintenance scripts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill_dhash_parser = subparsers.add_parser("backfill-dhash", help="Compute perceptual hashes for existing images")
+    backfill_dhash_parser.add_argument("--batch-size", type=int, default=1000)
+    backfill_dhash_parser.set_defaults(handler=backfill_dhash)
+
+    backfill_derivatives_parser = subparsers.add_parser("backfill-derivatives", help="Generate resized variants for existing images")
+    backfill_derivatives_parser.add_argument("--batch-size", type=int, default=200)
+    backfill_derivatives_parser.set_defaults(handler=backfill_derivatives)
+
+    backfill_embeddings_parser = subparsers.add_parser("backfill-embeddings", help="Add existing images to the embedding index")
+    backfill_embeddings_parser.add_argument("--batch-size", type=int, default=500)
+    backfill_embeddings_parser.set_defaults(handler=backfill_embeddings)
+
+    backfill_metadata_parser = subparsers.add_parser("backfill-metadata", help="Record width, height, format and mode for existing images")
+    backfill_metadata_parser.add_argument("--batch-size", type=int, default=1000)
+    backfill_metadata_parser.set_defaults(handler=backfill_metadata)
+
+    migrate_schema_parser = subparsers.add_parser("migrate-schema", help="Add the columns, indexes and tables an existing database is missing")
+    migrate_schema_parser.set_defaults(handler=migrate_schema)
+
+    migrate_storage_parser = subparsers.add_parser("migrate-storage", help="Move flat data/ files into content-addressed storage")
+    migrate_storage_parser.add_argument("--batch-size", type=int, default=500)
+    migrate_storage_parser.add_argument("--workers", type=int, default=8)
+    migrate_storage_parser.set_defaults(handler=migrate_storage)
+
+    gc_parser = subparsers.add_parser("gc", help="Purge files and rows of soft-deleted images")
+    gc_parser.add_argument("--batch-size", type=int, default=500)
+    gc_parser.add_argument("--workers", type=int, default=8)
+    gc_parser.add_argument("--grace-minutes", type=int, default=5)
+    gc_parser.set_defaults(handler=collect_garbage)
+
+    rebuild_stats_parser = subparsers.add_parser("rebuild-stats", help="Recompute labelling statistics from scratch")
+    rebuild_stats_parser.set_defaults(handler=rebuild_stats)
+
+    export_parser = subparsers.add_parser("export", help="Export labelled images as Parquet or WebDataset shards")
+    export_parser.add_argument("name")
+    export_parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="parquet")
+    export_parser.add_argument("--max-shard-mb", type=int, default=DEFAULT_MAX_SHARD_BYTES // (1024 * 1024))
+    export_parser.add_argument("--workers", type=int, default=EXPORT_WORKERS)
+    export_parser.set_defaults(handler=export_dataset)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Register every image under a directory tree")
+    ingest_parser.add_argument("directory")
+    ingest_parser.add_argument("--batch-size", type=int, default=1000)
+    ingest_parser.add_argument("--workers", type=int, default=8)
+    ingest_parser.set_defaults(handler=ingest)
+
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
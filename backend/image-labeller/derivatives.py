@@ -0,0 +1,46 @@
+import os
+from PIL import Image as PILImage, ImageOps
+
+
+DERIVATIVES_DIR: str = os.path.join("data", "derivatives")
+# name -> (longest side in pixels, output format)
+VARIANTS: dict[str, tuple[int, str]] = {
+    "thumbnail": (256, "webp"),
+    "display": (1280, "webp"),
+    "display_jpeg": (1280, "jpeg"),
+}
+DEFAULT_VARIANT: str = "display"
+
+
+def get_derivative_path(id: str, variant: str) -> str:
+    _, format = VARIANTS[variant]
+    return os.path.join(DERIVATIVES_DIR, variant, f"{id}.{format}")
+
+def get_derivative_paths(id: str) -> list[str]:
+    return [get_derivative_path(id, variant) for variant in VARIANTS]
+
+def generate_derivative(source_path: str, id: str, variant: str) -> dict:
+    # Runs in the process pool. Output is written to a temporary name and renamed into
+    # place, so a reader (or another worker racing on the same file) never sees a partial image.
+    target_path: str = get_derivative_path(id, variant)
+    max_side, format = VARIANTS[variant]
+    if os.path.exists(target_path):
+        with PILImage.open(target_path) as derivative:
+            return {"width": derivative.width, "height": derivative.height, "format": format}
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    with PILImage.open(source_path) as image:
+        image.draft("RGB", (max_side, max_side))
+        derivative = ImageOps.exif_transpose(image)
+        derivative.thumbnail((max_side, max_side), PILImage.Resampling.LANCZOS)
+        if format == "jpeg" and derivative.mode != "RGB":
+            derivative = derivative.convert("RGB")
+        temporary_path: str = f"{target_path}.{os.getpid()}.tmp"
+        derivative.save(temporary_path, format=format, quality=85)
+        os.replace(temporary_path, target_path)
+        return {"width": derivative.width, "height": derivative.height, "format": format}
+
+def generate_derivatives(source_path: str, id: str) -> dict | None:
+    try:
+        return {variant: generate_derivative(source_path, id, variant) for variant in VARIANTS}
+    except Exception:
+        return None
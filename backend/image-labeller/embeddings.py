@@ -0,0 +1,126 @@
+import fcntl
+import os
+import threading
+import numpy as np
+from PIL import Image as PILImage
+
+
+EMBEDDINGS_PATH: str = os.path.join("data", "embeddings", "vectors.f32")
+EMBEDDING_SIZE: int = 64
+COLOUR_BINS: int = 4
+ORIENTATION_BINS: int = 9
+CELLS: int = 4
+EMBEDDING_DIM: int = COLOUR_BINS ** 3 + ORIENTATION_BINS * CELLS * CELLS
+# Rows scored per matrix product; bounds the temporary score array at any index size
+SEARCH_BATCH_ROWS: int = 65536
+
+
+def normalise(vector: np.ndarray) -> np.ndarray:
+    norm: float = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+def compute_embedding(file_path: str) -> list[float] | None:
+    # Runs in the process pool. A joint RGB colour histogram plus a HOG-style grid of gradient
+    # orientation histograms: crude, but cheap on a CPU and good enough to bring faces with
+    # similar lighting, framing and hair together. Unit length, so a dot product is cosine.
+    try:
+        with PILImage.open(file_path) as image:
+            image.draft("RGB", (EMBEDDING_SIZE * 2, EMBEDDING_SIZE * 2))
+            pixels: np.ndarray = np.asarray(
+                image.convert("RGB").resize((EMBEDDING_SIZE, EMBEDDING_SIZE), PILImage.Resampling.BILINEAR),
+                dtype=np.float32
+            )
+    except Exception:
+        return None
+    quantised: np.ndarray = (pixels * COLOUR_BINS / 256).astype(np.int64)
+    colour_index: np.ndarray = (quantised[..., 0] * COLOUR_BINS + quantised[..., 1]) * COLOUR_BINS + quantised[..., 2]
+    colour: np.ndarray = np.bincount(colour_index.ravel(), minlength=COLOUR_BINS ** 3).astype(np.float32)
+
+    grey: np.ndarray = pixels.mean(axis=2)
+    gradient_y, gradient_x = np.gradient(grey)
+    magnitude: np.ndarray = np.hypot(gradient_x, gradient_y)
+    orientation: np.ndarray = (np.arctan2(gradient_y, gradient_x) % np.pi) / np.pi * ORIENTATION_BINS
+    orientation_index: np.ndarray = np.minimum(orientation.astype(np.int64), ORIENTATION_BINS - 1)
+    cell_size: int = EMBEDDING_SIZE // CELLS
+    cell_index: np.ndarray = (np.arange(EMBEDDING_SIZE) // cell_size)
+    bins: np.ndarray = (cell_index[:, None] * CELLS + cell_index[None, :]) * ORIENTATION_BINS + orientation_index
+    gradients: np.ndarray = np.bincount(
+        bins.ravel(), weights=magnitude.ravel(), minlength=ORIENTATION_BINS * CELLS * CELLS
+    ).astype(np.float32)
+    return normalise(np.concatenate([normalise(colour), normalise(gradients)])).tolist()
+
+
+class EmbeddingIndex:
+    # Append-only float32 matrix on disk, one row per image, mapped read-only into each
+    # process. Row numbers are handed out under an exclusive file lock so several worker
+    # processes can append; readers remap whenever the file has grown.
+    def __init__(self, path: str = EMBEDDINGS_PATH, dim: int = EMBEDDING_DIM):
+        self.path = path
+        self.dim = dim
+        self.row_bytes: int = dim * np.dtype(np.float32).itemsize
+        self.lock = threading.Lock()
+        self._matrix: np.ndarray = np.empty((0, dim), dtype=np.float32)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        rows: int = os.path.getsize(self.path) // self.row_bytes if os.path.exists(self.path) else 0
+        if rows != len(self._matrix):
+            with self.lock:
+                if rows != len(self._matrix):
+                    self._matrix = (
+                        np.memmap(self.path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+                        if rows else np.empty((0, self.dim), dtype=np.float32)
+                    )
+        return self._matrix
+
+    def append(self, vectors: list[list[float]]) -> int:
+        # Returns the row number of the first appended vector
+        data: bytes = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim).tobytes()
+        with open(self.path, "ab") as index_file:
+            fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                index_file.seek(0, os.SEEK_END)
+                # A torn write from a crashed process is padded out rather than shifting every later row
+                partial: int = index_file.tell() % self.row_bytes
+                if partial:
+                    index_file.write(b"\0" * (self.row_bytes - partial))
+                first_row: int = index_file.tell() // self.row_bytes
+                index_file.write(data)
+                index_file.flush()
+            finally:
+                fcntl.flock(index_file, fcntl.LOCK_UN)
+        return first_row
+
+    def get(self, row: int) -> np.ndarray | None:
+        matrix: np.ndarray = self.matrix
+        if row >= len(matrix):
+            return None
+        return np.array(matrix[row])
+
+    def search(self, vector: np.ndarray, k: int) -> list[tuple[int, float]]:
+        # Exact top-k by cosine similarity: one matrix product per block of rows, with
+        # argpartition keeping only each block's k best before the final sort.
+        matrix: np.ndarray = self.matrix
+        if k <= 0 or not len(matrix):
+            return []
+        best_rows: list[np.ndarray] = []
+        best_scores: list[np.ndarray] = []
+        for start in range(0, len(matrix), SEARCH_BATCH_ROWS):
+            scores: np.ndarray = matrix[start:start + SEARCH_BATCH_ROWS] @ vector
+            if len(scores) > k:
+                top: np.ndarray = np.argpartition(scores, -k)[-k:]
+            else:
+                top = np.arange(len(scores))
+            best_rows.append(top + start)
+            best_scores.append(scores[top])
+        rows: np.ndarray = np.concatenate(best_rows)
+        scores = np.concatenate(best_scores)
+        order: np.ndarray = np.argsort(-scores)[:k]
+        return [(int(rows[index]), float(scores[index])) for index in order]
+
+
+embedding_index: EmbeddingIndex = EmbeddingIndex()
@@ -0,0 +1,97 @@
+import io
+import json
+import os
+import tarfile
+
+
+EXPORTS_DIR: str = os.path.join("data", "exports")
+EXPORT_FORMATS: dict[str, str] = {
+    "parquet": "parquet",
+    "webdataset": "tar",
+}
+DEFAULT_MAX_SHARD_BYTES: int = 512 * 1024 * 1024
+MANIFEST_NAME: str = "manifest.json"
+
+
+def get_export_dir(name: str) -> str:
+    return os.path.join(EXPORTS_DIR, name)
+
+def get_shard_name(index: int, format: str) -> str:
+    return f"shard-{index:05d}.{EXPORT_FORMATS[format]}"
+
+def new_manifest(format: str, max_shard_bytes: int) -> dict:
+    return {"format": format, "max_shard_bytes": max_shard_bytes, "watermark": None, "rows": 0, "skipped": 0, "shards": []}
+
+def load_manifest(name: str) -> dict | None:
+    manifest_path: str = os.path.join(get_export_dir(name), MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+def save_manifest(name: str, manifest: dict):
+    # The manifest is the resume point, so it is replaced atomically and only ever
+    # lists shards that are completely on disk.
+    manifest_path: str = os.path.join(get_export_dir(name), MANIFEST_NAME)
+    temporary_path: str = f"{manifest_path}.tmp"
+    with open(temporary_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(temporary_path, manifest_path)
+
+def remove_partial_shards(name: str):
+    # Leftovers of an interrupted run; their rows are after the watermark and get rewritten
+    export_dir: str = get_export_dir(name)
+    for file_name in os.listdir(export_dir):
+        if file_name.endswith(".tmp"):
+            os.remove(os.path.join(export_dir, file_name))
+
+def write_parquet_shard(path: str, records: list[dict]):
+    # Imported here so the API process does not pay for pyarrow unless it exports
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    table = pa.Table.from_pylist(records, schema=pa.schema([
+        ("id", pa.string()),
+        ("image_id", pa.string()),
+        ("gender", pa.string()),
+        ("description", pa.string()),
+        ("tags", pa.list_(pa.string())),
+        ("date_created", pa.string()),
+        ("extension", pa.string()),
+        ("width", pa.int32()),
+        ("height", pa.int32()),
+        ("format", pa.string()),
+        ("mode", pa.string()),
+        ("image", pa.binary()),
+    ]))
+    pq.write_table(table, path)
+
+def write_webdataset_shard(path: str, records: list[dict]):
+    # One sample per label: <id>.<extension> holds the image, <id>.json everything else
+    with tarfile.open(path, "w") as tar:
+        for record in records:
+            metadata: bytes = json.dumps({key: value for key, value in record.items() if key != "image"}).encode()
+            for member_name, payload in ((f"{record['id']}.{record['extension']}", record["image"]), (f"{record['id']}.json", metadata)):
+                member: tarfile.TarInfo = tarfile.TarInfo(member_name)
+                member.size = len(payload)
+                tar.addfile(member, io.BytesIO(payload))
+
+SHARD_WRITERS = {
+    "parquet": write_parquet_shard,
+    "webdataset": write_webdataset_shard,
+}
+
+def write_shard(name: str, index: int, format: str, records: list[dict]) -> dict:
+    # Runs in a worker thread; the shard only appears under its final name once complete
+    shard_name: str = get_shard_name(index, format)
+    shard_path: str = os.path.join(get_export_dir(name), shard_name)
+    temporary_path: str = f"{shard_path}.tmp"
+    SHARD_WRITERS[format](temporary_path, records)
+    os.replace(temporary_path, shard_path)
+    return {"name": shard_name, "rows": len(records), "bytes": os.path.getsize(shard_path)}
+
+def read_image_bytes(path: str) -> bytes | None:
+    try:
+        with open(path, "rb") as image_file:
+            return image_file.read()
+    except FileNotFoundError:
+        return None
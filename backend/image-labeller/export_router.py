@@ -0,0 +1,33 @@
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Path, status
+from services import ExportService
+from fastapi import Depends
+from helpers import get_export_service
+
+router = APIRouter(
+    tags=["Dataset Export"],
+)
+
+EXPORT_NAME_PATTERN: str = r"^[A-Za-z0-9_-]+$"
+
+@router.post("/exports/{name}", status_code=status.HTTP_202_ACCEPTED)
+async def start_export(
+    background_tasks: BackgroundTasks,
+    name: str = Path(pattern=EXPORT_NAME_PATTERN), 
+    format: str = "parquet",
+    export_service: ExportService = Depends(get_export_service)):
+    # Exports run after the response; poll GET /exports/{name} for the manifest
+    export_service.check_format(name, format)
+    if export_service.is_running(name):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Export {name} is already running")
+    background_tasks.add_task(export_service.export, name, format)
+    return {"name": name, "format": format, "running": True}
+
+@router.get("/exports/{name}")
+async def get_export(
+    name: str = Path(pattern=EXPORT_NAME_PATTERN), 
+    export_service: ExportService = Depends(get_export_service)):
+    manifest: dict | None = export_service.get_manifest(name)
+    running: bool = export_service.is_running(name)
+    if manifest is None and not running:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Export not found")
+    return {"name": name, "running": running, "manifest": manifest}
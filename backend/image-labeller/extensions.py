@@ -0,0 +1,9 @@
+from concurrent.futures import ProcessPoolExecutor
+from storage import StorageBackend, LocalDiskStorage
+import os
+
+
+# Shared pool for CPU-bound image work (hashing, decoding) so it never runs on the event loop
+process_pool: ProcessPoolExecutor = ProcessPoolExecutor(max_workers=os.cpu_count())
+
+storage: StorageBackend = LocalDiskStorage("data")
@@ -1,29 +1,76 @@
-from fastapi import Request
+from fastapi import Request, Header, Cookie
 from db import Base, engine
-from services import ImageService, TagService, ImageLabellingService
+from services import (
+    ImageService, TagService, ImageLabellingService, DeduplicationService, HarmfulContentDetectionService, DerivativeService,
+    StatsService, ExportService, EmbeddingService, GarbageCollectionService
+)
+from derivatives import DEFAULT_VARIANT
+from extensions import storage
 from fastapi import Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from db import get_db
 from schemas import NextImageResponse, ImageRead
 from typing import Annotated
 
-async def get_image_tags(tag_service: TagService) -> list[str]:
-    return [tag.name for tag in tag_service.get_tags()]
+async def get_image_tags(tag_service: TagService) -> tuple[int, list[str]]:
+    version, tags = await tag_service.get_catalogue()
+    return version, [tag.name for tag in tags]
 
-def create_all():
-    Base.metadata.create_all(bind=engine)
+async def create_all():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
 
-def get_image_service(db: Annotated[Session, Depends(get_db)]):
-    return ImageService(db)
+harmful_content_detection_service: HarmfulContentDetectionService = HarmfulContentDetectionService()
+garbage_collection_service: GarbageCollectionService = GarbageCollectionService()
 
-async def get_next_image(request: Request, image_service: ImageService = Depends(get_image_service)):
-    image: ImageRead = await image_service.get_next_image()
-    image_path: str = f"{image.id}.{image.extension}"
-    image_url: str = request.url_for("data", path=image_path).__str__()
-    return image.id, image_url
+def get_harmful_content_detection_service() -> HarmfulContentDetectionService:
+    return harmful_content_detection_service
 
-def get_tag_service(db: Annotated[Session, Depends(get_db)]):
+def get_deduplication_service(db: Annotated[AsyncSession, Depends(get_db)]):
+    return DeduplicationService(db)
+
+def get_derivative_service(db: Annotated[AsyncSession, Depends(get_db)]):
+    return DerivativeService(db)
+
+def get_image_service(db: Annotated[AsyncSession, Depends(get_db)]):
+    return ImageService(db, get_deduplication_service(db), get_derivative_service(db), harmful_content_detection_service)
+
+ANNOTATOR_COOKIE: str = "annotator_id"
+
+def get_annotator(
+    request: Request, 
+    x_annotator_id: Annotated[str | None, Header()] = None, 
+    annotator_id: Annotated[str | None, Cookie()] = None) -> str:
+    if x_annotator_id:
+        return x_annotator_id
+    if annotator_id:
+        return annotator_id
+    return request.client.host if request.client else "anonymous"
+
+def get_image_url(request: Request, image: ImageRead) -> str:
+    image_path: str = storage.url_path(image.storage_key) if image.storage_key else f"{image.id}.{image.extension}"
+    return request.url_for("data", path=image_path).__str__()
+
+def get_variant_url(request: Request, image: ImageRead, variant: str = DEFAULT_VARIANT) -> str:
+    return request.url_for("get_image_variant", id=image.id, variant=variant).__str__()
+
+async def get_next_image(request: Request, image_service: ImageService = Depends(get_image_service), annotator: str = Depends(get_annotator)):
+    image: ImageRead | None = await image_service.get_next_image(annotator)
+    if image is None:
+        return None, None, None
+    return image.id, get_variant_url(request, image), get_variant_url(request, image, "display_jpeg")
+
+def get_tag_service(db: Annotated[AsyncSession, Depends(get_db)]):
     return TagService(db)
 
-def get_image_labelling_service(db: Annotated[Session, Depends(get_db)]):
-    return ImageLabellingService(db, get_image_service(db), get_tag_service(db))
\ No newline at end of file
+def get_image_labelling_service(db: Annotated[AsyncSession, Depends(get_db)]):
+    return ImageLabellingService(db, get_image_service(db), get_tag_service(db))
+
+def get_stats_service(db: Annotated[AsyncSession, Depends(get_db)]):
+    return StatsService(db)
+
+def get_export_service() -> ExportService:
+    return ExportService()
+
+def get_embedding_service(db: Annotated[AsyncSession, Depends(get_db)]):
+    return EmbeddingService(db)
\ No newline at end of file
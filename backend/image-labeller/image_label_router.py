@@ -1,20 +1,51 @@
-from fastapi import APIRouter, UploadFile, Request, status
+from fastapi import APIRouter, UploadFile, Request, status, Query
+from fastapi.responses import StreamingResponse
 from services import ImageLabellingService
 from fastapi import Depends
 from typing import Annotated
 from db import get_db
-from sqlalchemy.orm import Session
-from schemas import NextImageResponse, ImageRead, ImageLabelRequest, ImageLabelResponse
-from helpers import get_image_labelling_service
+from sqlalchemy.ext.asyncio import AsyncSession
+from schemas import (
+    NextImageResponse, ImageRead, ImageLabelRequest, ImageLabelResponse, ImageLabelBatchRequest, ImageLabelBatchResponse,
+    ImageLabelFilters, ImageLabelPage
+)
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from helpers import get_image_labelling_service, get_annotator
 
 router = APIRouter(
     tags=["Image Labelling"],
 )
 
+# Declared before /images/label/{image_id} so "batch" is not captured as an image id
+@router.post("/images/label/batch", response_model=ImageLabelBatchResponse, status_code=status.HTTP_201_CREATED)
+async def label_images(
+    batch_request: ImageLabelBatchRequest,
+    image_labelling_service: ImageLabellingService = Depends(get_image_labelling_service),
+    annotator: str = Depends(get_annotator)):
+    image_labels = await image_labelling_service.label_images(batch_request.labels, annotator)
+    return ImageLabelBatchResponse(labels=image_labels)
+
 @router.post("/images/label/{image_id}", response_model=ImageLabelResponse, status_code=status.HTTP_201_CREATED)
 async def label_image(
     image_id: str, 
     label_request: ImageLabelRequest, 
+    image_labelling_service: ImageLabellingService = Depends(get_image_labelling_service),
+    annotator: str = Depends(get_annotator)):
+    image_label = await image_labelling_service.label_image(image_id, label_request, annotator) 
+    return image_label
+
+@router.get("/images/labels", response_model=ImageLabelPage)
+async def get_image_labels(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), 
+    cursor: str | None = None, 
+    stream: bool = False,
+    filters: ImageLabelFilters = Depends(),
+    image_labelling_service: ImageLabellingService = Depends(get_image_labelling_service)):
+    if stream:
+        return StreamingResponse(image_labelling_service.stream_image_labels(filters), media_type="application/x-ndjson")
+    return await image_labelling_service.get_image_labels(filters, limit, cursor)
+
+@router.get("/labelling/metrics")
+async def get_labelling_metrics(
     image_labelling_service: ImageLabellingService = Depends(get_image_labelling_service)):
-    image_label = await image_labelling_service.label_image(image_id, label_request) 
-    return image_label
\ No newline at end of file
+    return image_labelling_service.get_metrics()
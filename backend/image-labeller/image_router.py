@@ -1,11 +1,20 @@
-from fastapi import APIRouter, UploadFile, Request
-from services import ImageService
+from fastapi import APIRouter, UploadFile, Request, HTTPException, status, Query
+from fastapi.responses import StreamingResponse, FileResponse
+from services import ImageService, TagService, EmbeddingService, PREFETCH_COUNT, MAX_CLAIM_BATCH, SUGGESTION_NEIGHBOURS
 from fastapi import Depends
 from typing import Annotated
 from db import get_db
-from sqlalchemy.orm import Session
-from schemas import NextImageResponse, ImageRead
-from helpers import get_image_service
+from sqlalchemy.ext.asyncio import AsyncSession
+from schemas import (
+    NextImageResponse, ImageRead, ClaimedImagesResponse, ImageFilters, ImagePage, PrefetchedImage, PrefetchResponse,
+    SuggestedTagsResponse, ImageDeleteRequest, ImageDeleteResponse
+)
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from helpers import (
+    get_image_service, get_annotator, get_image_url, get_deduplication_service, get_harmful_content_detection_service,
+    get_derivative_service, get_tag_service, get_variant_url, get_image_tags, get_embedding_service
+)
+from services import DeduplicationService, HarmfulContentDetectionService, DerivativeService
 
 router = APIRouter(
     tags=["Image Operations"],
@@ -15,21 +24,115 @@ router = APIRouter(
 async def upload(file: UploadFile, image_service: ImageService = Depends(get_image_service)):
     return await image_service.upload(file)
 
+@router.post("/upload/bulk")
+async def upload_bulk(files: list[UploadFile], image_service: ImageService = Depends(get_image_service)):
+    return await image_service.upload_many(files)
+
 @router.get("/get_next_image")
-async def get_next_image(request: Request, image_service: ImageService = Depends(get_image_service)):
-    image: ImageRead = await image_service.get_next_image()
-    image_path: str = f"{image.id}.{image.extension}"
-    image_url: str = request.url_for("data", path=image_path).__str__()
-    return NextImageResponse(**image.model_dump(), image_url=image_url)
+async def get_next_image(
+    request: Request, 
+    image_service: ImageService = Depends(get_image_service), 
+    annotator: str = Depends(get_annotator)):
+    image: ImageRead | None = await image_service.get_next_image(annotator)
+    if image is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No unlabelled images available")
+    return NextImageResponse(**image.model_dump(), image_url=get_image_url(request, image))
+
+@router.post("/images/claim", response_model=ClaimedImagesResponse)
+async def claim_images(
+    request: Request, 
+    count: int = Query(1, ge=1, le=MAX_CLAIM_BATCH), 
+    image_service: ImageService = Depends(get_image_service), 
+    annotator: str = Depends(get_annotator)):
+    images: list[ImageRead] = await image_service.claim_next_images(annotator, count)
+    return ClaimedImagesResponse(
+        images=[NextImageResponse(**image.model_dump(), image_url=get_image_url(request, image)) for image in images]
+    )
+
+@router.post("/images/prefetch", response_model=PrefetchResponse)
+async def prefetch_images(
+    request: Request, 
+    count: int = Query(PREFETCH_COUNT, ge=1, le=MAX_CLAIM_BATCH), 
+    image_service: ImageService = Depends(get_image_service), 
+    tag_service: TagService = Depends(get_tag_service),
+    annotator: str = Depends(get_annotator)):
+    # Everything the label page needs for its next images in one round trip
+    images: list[ImageRead] = await image_service.prefetch_images(annotator, count)
+    tags_version, tags = await get_image_tags(tag_service)
+    return PrefetchResponse(
+        images=[
+            PrefetchedImage(
+                id=image.id, 
+                image_url=get_variant_url(request, image), 
+                fallback_url=get_variant_url(request, image, "display_jpeg")
+            ) 
+            for image in images
+        ],
+        tags_version=tags_version,
+        tags=tags
+    )
+
+@router.post("/images/{id}/release", status_code=status.HTTP_204_NO_CONTENT)
+async def release_image(
+    id: str, 
+    image_service: ImageService = Depends(get_image_service), 
+    annotator: str = Depends(get_annotator)):
+    await image_service.release_image(id, annotator)
 
 @router.get("/get_image")
 async def get_image(id: str, image_service: ImageService = Depends(get_image_service)):
     return await image_service.get_image(id)
 
+@router.get("/images/{id}/duplicates")
+async def get_duplicates(
+    id: str, 
+    image_service: ImageService = Depends(get_image_service), 
+    deduplication_service: DeduplicationService = Depends(get_deduplication_service)):
+    image: ImageRead | None = await image_service.get_image(id)
+    if image is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    return {"id": id, "possible_duplicates": await deduplication_service.find_duplicates(image.dhash, exclude_id=id)}
+
+@router.get("/images/{id}/suggested_tags", response_model=SuggestedTagsResponse)
+async def get_suggested_tags(
+    id: str, 
+    k: int = Query(SUGGESTION_NEIGHBOURS, ge=1, le=100), 
+    embedding_service: EmbeddingService = Depends(get_embedding_service)):
+    return await embedding_service.suggest_tags(id, k)
+
+@router.get("/images/{id}/variants/{variant}", name="get_image_variant")
+async def get_image_variant(
+    id: str, 
+    variant: str, 
+    image_service: ImageService = Depends(get_image_service), 
+    derivative_service: DerivativeService = Depends(get_derivative_service)):
+    image: ImageRead | None = await image_service.get_image(id)
+    if image is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    variant_path: str = await derivative_service.get_variant_path(image, variant)
+    # Derivatives never change once written, so browsers can keep them indefinitely
+    return FileResponse(variant_path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
 @router.delete("/delete_image")
 async def delete_image(id: str, image_service: ImageService = Depends(get_image_service)):
     return await image_service.delete_image(id)
 
-@router.get("/list_images")
-async def list_images(image_service: ImageService = Depends(get_image_service)):
-    return await image_service.list_images()
\ No newline at end of file
+@router.post("/images/delete", response_model=ImageDeleteResponse)
+async def delete_images(delete_request: ImageDeleteRequest, image_service: ImageService = Depends(get_image_service)):
+    return ImageDeleteResponse(deleted=await image_service.delete_images(delete_request))
+
+@router.get("/list_images", response_model=ImagePage)
+async def list_images(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), 
+    cursor: str | None = None, 
+    stream: bool = False,
+    filters: ImageFilters = Depends(),
+    image_service: ImageService = Depends(get_image_service)):
+    if stream:
+        return StreamingResponse(image_service.stream_images(filters), media_type="application/x-ndjson")
+    return await image_service.list_images(filters, limit, cursor)
+
+@router.get("/screening/metrics")
+async def get_screening_metrics(
+    screening_service: HarmfulContentDetectionService = Depends(get_harmful_content_detection_service)):
+    return screening_service.get_metrics()
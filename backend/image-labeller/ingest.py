@@ -0,0 +1,69 @@
+import hashlib
+import os
+import shutil
+from itertools import islice
+from typing import Iterable, Iterator
+from PIL import Image as PILImage
+from perceptual_hash import compute_dhash
+from embeddings import compute_embedding
+from metadata import read_metadata
+
+
+INGEST_CHUNK_SIZE: int = 1024 * 1024
+INGEST_SUFFIXES: set[str] = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+# The stored extension follows the decoded format, not whatever the file happened to be called
+FORMAT_EXTENSIONS: dict[str, str] = {
+    "JPEG": "jpg",
+    "PNG": "png",
+    "WEBP": "webp",
+    "GIF": "gif",
+    "BMP": "bmp",
+    "TIFF": "tiff",
+}
+
+
+def find_images(root: str) -> Iterator[str]:
+    # Sorted so an interrupted ingest revisits files in the same order
+    for directory, subdirectories, file_names in os.walk(root):
+        subdirectories.sort()
+        for file_name in sorted(file_names):
+            if os.path.splitext(file_name)[1].lower() in INGEST_SUFFIXES:
+                yield os.path.join(directory, file_name)
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def inspect_image(path: str) -> dict:
+    # Runs in the process pool: hashes the file and fully decodes it, so truncated or
+    # mislabelled files are rejected before anything is copied or registered.
+    sha256 = hashlib.sha256()
+    size_bytes: int = 0
+    try:
+        with open(path, "rb") as image_file:
+            while chunk := image_file.read(INGEST_CHUNK_SIZE):
+                size_bytes += len(chunk)
+                sha256.update(chunk)
+        with PILImage.open(path) as image:
+            metadata: dict = read_metadata(image)
+            image.load()
+    except Exception as e:
+        return {"path": path, "error": str(e)}
+    if metadata["format"] not in FORMAT_EXTENSIONS:
+        return {"path": path, "error": f"Unsupported format {metadata['format']}"}
+    if metadata["width"] == 0 or metadata["height"] == 0:
+        return {"path": path, "error": "Empty image"}
+    return {
+        "path": path,
+        "sha256": sha256.hexdigest(),
+        "size_bytes": size_bytes,
+        "extension": FORMAT_EXTENSIONS[metadata["format"]],
+        "metadata": metadata,
+        "dhash": compute_dhash(path),
+        "embedding": compute_embedding(path),
+    }
+
+def stage_copy(path: str, staged_path: str):
+    # The source tree is left untouched; only the staged copy is moved into the store
+    shutil.copyfile(path, staged_path)
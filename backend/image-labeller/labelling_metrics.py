@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import deque
+
+
+LABEL_INTERVAL_WINDOW: int = 1000
+# Gaps longer than a lease are breaks, not labelling time, and would swamp the averages
+LABEL_IDLE_CUTOFF_SECONDS: float = 600.0
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class LabellingMetrics:
+    # Time between consecutive label submits per annotator, over a rolling window. This is
+    # what the annotator experiences as "waiting for the next image" plus their own work.
+    def __init__(self, window: int = LABEL_INTERVAL_WINDOW, idle_cutoff: float = LABEL_IDLE_CUTOFF_SECONDS):
+        self._lock = threading.Lock()
+        self.idle_cutoff = idle_cutoff
+        self.last_label_at: dict[str, float] = {}
+        self.intervals: deque[float] = deque(maxlen=window)
+        self.labels: int = 0
+        self.idle_gaps: int = 0
+
+    def record_labels(self, annotator: str, count: int = 1):
+        if count <= 0:
+            return
+        now: float = time.monotonic()
+        with self._lock:
+            self.labels += count
+            last_label_at: float | None = self.last_label_at.get(annotator)
+            self.last_label_at[annotator] = now
+            if last_label_at is None:
+                return
+            elapsed: float = now - last_label_at
+            if elapsed > self.idle_cutoff:
+                self.idle_gaps += 1
+                return
+            # A batch submit spreads the elapsed time over the labels it carries
+            self.intervals.append(elapsed / count)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            intervals: list[float] = sorted(self.intervals)
+            return {
+                "labels": self.labels,
+                "annotators": len(self.last_label_at),
+                "idle_gaps": self.idle_gaps,
+                "sampled_intervals": len(intervals),
+                "mean_seconds_between_labels": sum(intervals) / len(intervals) if intervals else 0.0,
+                "p50_seconds_between_labels": percentile(intervals, 0.5),
+                "p95_seconds_between_labels": percentile(intervals, 0.95),
+            }
+
+
+labelling_metrics: LabellingMetrics = LabellingMetrics()
@@ -0,0 +1,39 @@
+import os
+from PIL import Image as PILImage
+
+
+EXIF_ORIENTATION_TAG: int = 0x0112
+# EXIF orientations 5-8 rotate by 90 degrees, so the displayed image is height x width
+TRANSPOSED_ORIENTATIONS: set[int] = {5, 6, 7, 8}
+METADATA_COLUMNS: tuple[str, ...] = ("width", "height", "format", "mode", "orientation")
+
+
+def read_metadata(image: PILImage.Image) -> dict:
+    # Header fields only; nothing here forces the pixel data to be decoded
+    orientation: int = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+    width, height = image.size
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    return {
+        "width": width,
+        "height": height,
+        "format": image.format,
+        "mode": image.mode,
+        "orientation": orientation,
+    }
+
+def empty_metadata() -> dict:
+    # Same keys as read_metadata, so rows without metadata still batch into one insert
+    return dict.fromkeys(METADATA_COLUMNS)
+
+def extract_metadata(file_path: str, include_size: bool = False) -> dict | None:
+    # Runs in the process pool: must stay a module-level function so it can be pickled.
+    # Uploads already know their size; backfills of legacy rows ask for it too.
+    try:
+        with PILImage.open(file_path) as image:
+            metadata: dict = read_metadata(image)
+        if include_size:
+            metadata["size_bytes"] = os.path.getsize(file_path)
+        return metadata
+    except Exception:
+        return None
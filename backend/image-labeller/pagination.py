@@ -0,0 +1,35 @@
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+
+DEFAULT_PAGE_SIZE: int = 100
+MAX_PAGE_SIZE: int = 1000
+STREAM_BATCH_SIZE: int = 500
+
+
+def encode_cursor(value: datetime | int, id: str) -> str:
+    # Timestamps keep their original key so cursors handed out earlier stay valid
+    if isinstance(value, datetime):
+        payload: str = json.dumps({"date_created": value.isoformat(), "id": id})
+    else:
+        payload = json.dumps({"value": value, "id": id})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple[datetime | int, str]:
+    try:
+        payload: dict = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if "date_created" in payload:
+            return datetime.fromisoformat(payload["date_created"]), payload["id"]
+        return int(payload["value"]), payload["id"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def after_cursor(sort_column, id_column, cursor: str):
+    # Row-value comparison lets the (sort column, id) index seek straight to the page start
+    value, id = decode_cursor(cursor)
+    if isinstance(value, datetime) != (sort_column.type.python_type is datetime):
+        raise HTTPException(status_code=400, detail="Cursor does not match the sort order")
+    return tuple_(sort_column, id_column) > tuple_(value, id)
@@ -0,0 +1,90 @@
+import asyncio
+from PIL import Image as PILImage
+
+
+HASH_SIZE: int = 8
+
+
+def compute_dhash(file_path: str, hash_size: int = HASH_SIZE) -> str | None:
+    # Runs in the process pool: must stay a module-level function so it can be pickled
+    try:
+        with PILImage.open(file_path) as image:
+            image.draft("L", (hash_size * 8, hash_size * 8))
+            pixels: list[int] = list(
+                image.convert("L").resize((hash_size + 1, hash_size), PILImage.Resampling.LANCZOS).getdata()
+            )
+    except Exception:
+        return None
+    value: int = 0
+    for row in range(hash_size):
+        offset: int = row * (hash_size + 1)
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column] < pixels[offset + column + 1])
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    # Burkhard-Keller tree over Hamming distance. The triangle inequality lets a radius-k
+    # query skip every subtree whose edge distance lies outside [d - k, d + k].
+    def __init__(self):
+        self._hashes: list[int] = []
+        self._ids: list[list[str]] = []
+        self._children: list[dict[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, hash_value: int, id: str):
+        if not self._hashes:
+            self._append(hash_value, id)
+            return
+        node: int = 0
+        while True:
+            distance: int = hamming_distance(hash_value, self._hashes[node])
+            if distance == 0:
+                self._ids[node].append(id)
+                return
+            child: int | None = self._children[node].get(distance)
+            if child is None:
+                self._children[node][distance] = self._append(hash_value, id)
+                return
+            node = child
+
+    def search(self, hash_value: int, max_distance: int) -> list[tuple[str, int]]:
+        if not self._hashes:
+            return []
+        matches: list[tuple[str, int]] = []
+        stack: list[int] = [0]
+        while stack:
+            node: int = stack.pop()
+            distance: int = hamming_distance(hash_value, self._hashes[node])
+            if distance <= max_distance:
+                matches.extend((id, distance) for id in self._ids[node])
+            for edge, child in self._children[node].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda match: match[1])
+        return matches
+
+    def _append(self, hash_value: int, id: str) -> int:
+        self._hashes.append(hash_value)
+        self._ids.append([id])
+        self._children.append({})
+        return len(self._hashes) - 1
+
+
+class DuplicateIndex:
+    # Process-wide BK-tree plus the newest hashed_at it has seen, so each worker process
+    # catches up on hashes registered elsewhere with one incremental query. `ids` lets the
+    # catch-up re-read a window of rows without adding any of them twice.
+    def __init__(self):
+        self.tree: BKTree = BKTree()
+        self.ids: set[str] = set()
+        self.watermark = None
+        self.lock = asyncio.Lock()
+
+
+duplicate_index: DuplicateIndex = DuplicateIndex()
@@ -0,0 +1,59 @@
+import contextvars
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Statement budgets per read endpoint; a request above its budget points at an N+1 regression
+QUERY_BUDGETS: dict[str, int] = {
+    "/images/labels": 4,
+    "/stats": 1,
+}
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count: int = 0
+
+
+class QueryBudgetExceeded(Exception):
+    def __init__(self, path: str, count: int, budget: int):
+        super().__init__(f"{path} issued {count} statements, budget is {budget}")
+        self.path = path
+        self.count = count
+        self.budget = budget
+
+
+# The counter objects are shared, not copied, when the context is copied into tasks and
+# threadpool workers, so statements issued anywhere within the request are counted.
+# Counters nest: a statement counts towards every enclosing count_queries() block, so a
+# caller's budget still sees the statements of a request the middleware is also counting.
+_current_counters: contextvars.ContextVar[tuple[QueryCounter, ...]] = contextvars.ContextVar("query_counters", default=())
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for counter in _current_counters.get():
+        counter.count += 1
+
+
+@contextmanager
+def count_queries():
+    counter: QueryCounter = QueryCounter()
+    token = _current_counters.set(_current_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _current_counters.reset(token)
+
+
+@contextmanager
+def query_budget(path: str, budget: int):
+    with count_queries() as counter:
+        yield counter
+    if counter.count > budget:
+        raise QueryBudgetExceeded(path, counter.count, budget)
+
+
+def get_query_budget(path: str) -> int | None:
+    return QUERY_BUDGETS.get(path.rstrip("/"))
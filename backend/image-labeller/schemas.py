@@ -10,21 +10,133 @@ class ImageRead(BaseModel):
     extension: str
     date_created: datetime
     labelled: bool
+    sha256: str | None = None
+    storage_key: str | None = None
+    size_bytes: int | None = None
+    width: int | None = None
+    height: int | None = None
+    format: str | None = None
+    mode: str | None = None
+    orientation: int | None = None
+    dhash: str | None = None
+    harm_score: float | None = None
+    flagged: bool | None = None
+    variants: dict | None = None
+    claimed_by: str | None = None
+    lease_expires_at: datetime | None = None
 
     @classmethod
     def from_image(cls, image: Image) -> ImageRead:
-        return cls(id=image.id, date_created=image.date_created, labelled=image.labelled, extension=image.extension)
+        return cls(
+            id=image.id, 
+            date_created=image.date_created, 
+            labelled=image.labelled, 
+            extension=image.extension,
+            sha256=image.sha256,
+            storage_key=image.storage_key,
+            size_bytes=image.size_bytes,
+            width=image.width,
+            height=image.height,
+            format=image.format,
+            mode=image.mode,
+            orientation=image.orientation,
+            dhash=image.dhash,
+            harm_score=image.harm_score,
+            flagged=image.flagged,
+            variants=image.variants,
+            claimed_by=image.claimed_by,
+            lease_expires_at=image.lease_expires_at
+        )
     
 
+class ImageUploadResponse(ImageRead):
+    possible_duplicates: list[str] = []
+
+
+class SavedFile(BaseModel):
+    id: str
+    extension: str
+    path: str
+    sha256: str
+    size_bytes: int
+
+
+class ImageFilters(BaseModel):
+    labelled: bool | None = None
+    tag: str | None = None
+    gender: Literal["male", "female"] | None = None
+    min_width: int | None = None
+    min_height: int | None = None
+    format: str | None = None
+    mode: str | None = None
+    # Sorting by a metadata column only lists images whose metadata is known
+    sort: Literal["date_created", "width", "height", "size_bytes"] = "date_created"
+
+class ImageDeleteRequest(BaseModel):
+    ids: list[str] = []
+    filters: ImageFilters | None = None
+
+
+class ImageDeleteResponse(BaseModel):
+    deleted: int
+
+
+class ImagePage(BaseModel):
+    items: list[ImageRead]
+    next_cursor: str | None = None
+
+
 class NextImageResponse(ImageRead):
     image_url: str
 
 
+class ClaimedImagesResponse(BaseModel):
+    images: list[NextImageResponse]
+
+
+class PrefetchedImage(BaseModel):
+    id: str
+    image_url: str
+    fallback_url: str
+
+
+class PrefetchResponse(BaseModel):
+    images: list[PrefetchedImage]
+    tags_version: int
+    tags: list[str]
+
+
+class TagRead(BaseModel):
+    id: str
+    name: str
+
+class SuggestedTag(BaseModel):
+    name: str
+    score: float
+
+
+class SuggestedTagsResponse(BaseModel):
+    image_id: str
+    neighbours: list[str]
+    tags: list[SuggestedTag]
+
+
+class TagCatalogueResponse(BaseModel):
+    version: int
+    tags: list[TagRead]
+
+
 class ImageLabelRequest(BaseModel):
     tags: list[str] = []
     description: str
     gender: Literal["male", "female"]
 
+class ImageLabelBatchItem(ImageLabelRequest):
+    image_id: str
+
+class ImageLabelBatchRequest(BaseModel):
+    labels: list[ImageLabelBatchItem]
+
 class ImageLabelResponse(BaseModel):
     id: str
     image_id: str
@@ -41,3 +153,27 @@ class ImageLabelResponse(BaseModel):
             description=image_label.description, 
             tags=[tag.tag.name for tag in image_label.image_label_tags]
         )
+
+
+class ImageLabelBatchResponse(BaseModel):
+    labels: list[ImageLabelResponse]
+
+
+class ImageLabelFilters(BaseModel):
+    image_id: str | None = None
+    tag: str | None = None
+    gender: Literal["male", "female"] | None = None
+
+class ImageLabelPage(BaseModel):
+    items: list[ImageLabelResponse]
+    next_cursor: str | None = None
+
+
+class StatsResponse(BaseModel):
+    images: int
+    labelled: int
+    unlabelled: int
+    labels: int
+    by_tag: dict[str, int]
+    by_gender: dict[str, int]
+    by_day: dict[str, int]
@@ -0,0 +1,76 @@
+import importlib
+import os
+import threading
+from typing import Callable
+from PIL import Image as PILImage
+
+
+HARMFUL_CONTENT_CLASSIFIER: str = os.getenv("HARMFUL_CONTENT_CLASSIFIER", "screening.null_classifier")
+HARMFUL_CONTENT_THRESHOLD: float = float(os.getenv("HARMFUL_CONTENT_THRESHOLD", "0.8"))
+
+# Loaded once per pool process; the classifier is named by dotted path so it can be swapped
+# without touching the pipeline and so nothing unpicklable crosses the process boundary.
+_classifiers: dict[str, Callable[[list[str]], list[float]]] = {}
+
+
+def null_classifier(file_paths: list[str]) -> list[float]:
+    # Placeholder until a real model is configured: flags only files that fail to decode
+    scores: list[float] = []
+    for file_path in file_paths:
+        try:
+            with PILImage.open(file_path) as image:
+                image.verify()
+            scores.append(0.0)
+        except Exception:
+            scores.append(1.0)
+    return scores
+
+def load_classifier(classifier_path: str) -> Callable[[list[str]], list[float]]:
+    classifier = _classifiers.get(classifier_path)
+    if classifier is None:
+        module_name, _, attribute = classifier_path.rpartition(".")
+        classifier = getattr(importlib.import_module(module_name), attribute)
+        _classifiers[classifier_path] = classifier
+    return classifier
+
+def score_images(classifier_path: str, file_paths: list[str]) -> list[float]:
+    return list(load_classifier(classifier_path)(file_paths))
+
+
+class ScreeningMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches: int = 0
+        self.images: int = 0
+        self.flagged: int = 0
+        self.failed_batches: int = 0
+        self.last_batch_size: int = 0
+        self.total_latency: float = 0.0
+        self.max_latency: float = 0.0
+
+    def record_batch(self, latencies: list[float], flagged: int):
+        with self._lock:
+            self.batches += 1
+            self.images += len(latencies)
+            self.flagged += flagged
+            self.last_batch_size = len(latencies)
+            self.total_latency += sum(latencies)
+            self.max_latency = max([self.max_latency, *latencies])
+
+    def record_failure(self):
+        with self._lock:
+            self.failed_batches += 1
+
+    def snapshot(self, queue_depth: int) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": queue_depth,
+                "batches": self.batches,
+                "images": self.images,
+                "flagged": self.flagged,
+                "failed_batches": self.failed_batches,
+                "last_batch_size": self.last_batch_size,
+                "mean_batch_size": self.images / self.batches if self.batches else 0.0,
+                "mean_latency_seconds": self.total_latency / self.images if self.images else 0.0,
+                "max_latency_seconds": self.max_latency,
+            }
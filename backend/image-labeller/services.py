@@ -1,188 +1,1400 @@
-from schemas import ImageLabelRequest, ImageLabelResponse, ImageRead
-from sqlalchemy.orm import Session
+from schemas import (
+    ImageLabelRequest, ImageLabelResponse, ImageRead, ImageLabelBatchItem, TagRead, 
+    ImageFilters, ImagePage, ImageLabelFilters, ImageLabelPage, SavedFile, ImageUploadResponse, StatsResponse,
+    SuggestedTag, SuggestedTagsResponse, ImageDeleteRequest
+)
+from pagination import DEFAULT_PAGE_SIZE, STREAM_BATCH_SIZE, encode_cursor, after_cursor
+from typing import AsyncIterator
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Request, UploadFile, HTTPException
 import os
 import uuid
+import asyncio
+import hashlib
 import aiofiles
-from db import Image, ImageLabel, Tag, ImageLabelTag
+from db import Image, ImageLabel, Tag, ImageLabelTag, Blob, LabellingStat, dialect_insert
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update, insert, delete, or_, func
+from sqlalchemy.orm import selectinload
+from tag_catalogue import TagCatalogue, tag_catalogue
+from perceptual_hash import DuplicateIndex, duplicate_index, compute_dhash
+from embeddings import EmbeddingIndex, embedding_index, compute_embedding
+from metadata import extract_metadata, empty_metadata
+from extensions import process_pool, storage
+from storage import StorageBackend, make_key
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from screening import ScreeningMetrics, score_images, HARMFUL_CONTENT_CLASSIFIER, HARMFUL_CONTENT_THRESHOLD
+from db import AsyncSessionLocal
+from labelling_metrics import LabellingMetrics, labelling_metrics
+from derivatives import VARIANTS, generate_derivative, generate_derivatives, get_derivative_path, get_derivative_paths
+import time
+import logging
+import numpy as np
+from export import (
+    EXPORT_FORMATS, DEFAULT_MAX_SHARD_BYTES, get_export_dir, new_manifest, load_manifest, save_manifest, 
+    remove_partial_shards, write_shard, read_image_bytes
+)
+
+
+LEASE_DURATION: timedelta = timedelta(minutes=10)
+MAX_CLAIM_BATCH: int = 50
+PREFETCH_COUNT: int = 5
+UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+MAX_UPLOAD_BYTES: int = 50 * 1024 * 1024
+MAX_CONCURRENT_WRITES: int = 8
+MAX_DUPLICATE_DISTANCE: int = 6
+DEDUPLICATION_BATCH_SIZE: int = 1000
+EMBEDDINGS_BATCH_SIZE: int = 500
+METADATA_BATCH_SIZE: int = 1000
+SUGGESTION_NEIGHBOURS: int = 10
+MAX_SUGGESTED_TAGS: int = 10
+# Nearest rows fetched per wanted neighbour; most neighbours are unlabelled early on
+SUGGESTION_OVERSAMPLE: int = 5
+GC_BATCH_SIZE: int = 500
+GC_WORKERS: int = 8
+GC_INTERVAL_SECONDS: float = 60.0
+# Requests already holding a path to a just-deleted file get this long to finish with it
+GC_GRACE_PERIOD: timedelta = timedelta(minutes=5)
+DERIVATIVES_BATCH_SIZE: int = 200
+SCREENING_BATCH_SIZE: int = 32
+SCREENING_BATCH_WINDOW_SECONDS: float = 0.5
+# ImageLabelResponse walks image_label_tags -> tag; loading both relationships up front keeps
+# label reads at three statements per page instead of one per label and one per tag.
+LABEL_TAGS_LOADER = (selectinload(ImageLabel.image_label_tags).selectinload(ImageLabelTag.tag),)
+# labelling_stats scopes; images and labels use a single "total"/"labelled" key each
+STATS_IMAGES: str = "images"
+STATS_LABELS: str = "labels"
+STATS_TAG: str = "tag"
+STATS_GENDER: str = "gender"
+STATS_DAY: str = "day"
+STATS_REBUILD_BATCH_SIZE: int = 5000
+EXPORT_WORKERS: int = 4
+# Labels younger than this may still belong to an uncommitted transaction with an earlier
+# date_created, so incremental exports leave them for the next run instead of skipping them.
+EXPORT_SETTLE_DELAY: timedelta = timedelta(minutes=1)
+# Likewise a hash committed late can carry an older hashed_at than rows the duplicate index
+# already holds, so every catch-up re-reads this much behind its watermark.
+DEDUPLICATION_SETTLE_DELAY: timedelta = timedelta(minutes=1)
+
+logger = logging.getLogger(__name__)
+
+
+def get_image_path(id: str, extension: str, storage_key: str | None = None) -> str:
+    if storage_key is not None:
+        return storage.local_path(storage_key)
+    return os.path.join("data", f"{id}.{extension}")
+
+
+def day_key(moment: datetime) -> str:
+    # SQLite hands back naive datetimes; everything is stored in UTC
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).date().isoformat()
+
+
+class StatsService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def increment(self, counts: Counter):
+        # Does not commit: counters move in the same transaction as the rows they count.
+        # Keys are applied in a fixed order so concurrent writers lock them in the same order.
+        rows: list[dict] = [
+            {"scope": scope, "key": key, "count": count} 
+            for (scope, key), count in sorted(counts.items()) if count != 0
+        ]
+        if not rows:
+            return
+        upsert = dialect_insert(self.session)
+        statement = upsert(LabellingStat).values(rows)
+        await self.session.execute(statement.on_conflict_do_update(
+            index_elements=["scope", "key"], set_={"count": LabellingStat.count + statement.excluded.count}
+        ))
+
+    async def get_counts(self) -> Counter:
+        return Counter({
+            (scope, key): count 
+            for scope, key, count in await self.session.execute(
+                select(LabellingStat.scope, LabellingStat.key, LabellingStat.count)
+            )
+        })
+
+    async def get_stats(self) -> StatsResponse:
+        counts: Counter = await self.get_counts()
+        by_scope: dict[str, dict[str, int]] = {STATS_TAG: {}, STATS_GENDER: {}, STATS_DAY: {}}
+        for (scope, key), count in counts.items():
+            if scope in by_scope and count > 0:
+                by_scope[scope][key] = count
+        images: int = counts[(STATS_IMAGES, "total")]
+        labelled: int = counts[(STATS_IMAGES, "labelled")]
+        return StatsResponse(
+            images=images,
+            labelled=labelled,
+            unlabelled=images - labelled,
+            labels=counts[(STATS_LABELS, "total")],
+            by_tag=by_scope[STATS_TAG],
+            by_gender=by_scope[STATS_GENDER],
+            by_day=dict(sorted(by_scope[STATS_DAY].items()))
+        )
+
+    async def compute(self, batch_size: int = STATS_REBUILD_BATCH_SIZE) -> Counter:
+        # Full recount from the source tables, used to seed and to verify the running counters
+        counts: Counter = Counter()
+        counts[(STATS_IMAGES, "total")] = await self.session.scalar(
+            select(func.count()).select_from(Image).where(Image.deleted_at.is_(None))
+        ) or 0
+        counts[(STATS_IMAGES, "labelled")] = await self.session.scalar(
+            select(func.count()).select_from(Image).where(Image.labelled == True, Image.deleted_at.is_(None))
+        ) or 0
+        for gender, count in await self.session.execute(
+            select(ImageLabel.gender, func.count()).group_by(ImageLabel.gender)
+        ):
+            counts[(STATS_GENDER, gender)] = count
+            counts[(STATS_LABELS, "total")] += count
+        for name, count in await self.session.execute(
+            select(Tag.name, func.count()).join(ImageLabelTag, ImageLabelTag.tag_id == Tag.id).group_by(Tag.name)
+        ):
+            counts[(STATS_TAG, name)] = count
+        # Days are bucketed in Python so the UTC cut-off matches the incremental path on every dialect
+        async for date_created in await self.session.stream_scalars(
+            select(ImageLabel.date_created).execution_options(yield_per=batch_size)
+        ):
+            counts[(STATS_DAY, day_key(date_created))] += 1
+        return counts
+
+    async def rebuild(self) -> dict[tuple[str, str], tuple[int, int]]:
+        # Returns every counter that had drifted as key -> (stored, recomputed)
+        try:
+            stored: Counter = await self.get_counts()
+            computed: Counter = await self.compute()
+            await self.session.execute(delete(LabellingStat))
+            await self.increment(computed)
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            raise HTTPException(status_code=500, detail=f"Error rebuilding stats: {e}")
+        return {
+            key: (stored[key], computed[key]) 
+            for key in sorted(stored.keys() | computed.keys()) if stored[key] != computed[key]
+        }
 
 
 class ImageService:
-    def __init__(self, session: Session):
+    def __init__(
+            self, 
+            session: AsyncSession, 
+            deduplication_service: 'DeduplicationService', 
+            derivative_service: 'DerivativeService',
+            screening_service: 'HarmfulContentDetectionService | None' = None,
+            storage: StorageBackend = storage,
+            stats_service: StatsService | None = None,
+            embedding_service: 'EmbeddingService | None' = None,
+            metadata_service: 'MetadataService | None' = None):
         self.session = session
+        self.deduplication_service = deduplication_service
+        self.derivative_service = derivative_service
+        self.screening_service = screening_service
+        self.storage = storage
+        self.stats_service = stats_service or StatsService(session)
+        self.embedding_service = embedding_service or EmbeddingService(session)
+        self.metadata_service = metadata_service or MetadataService(session)
 
-    async def upload(self, file: UploadFile) -> ImageRead:
+    async def upload(self, file: UploadFile) -> ImageUploadResponse:
+        saved_file: SavedFile = await self.save_file(file)
+        dhash, variants, embedding, metadata = await asyncio.gather(
+            self.deduplication_service.compute_hash(saved_file.path),
+            self.derivative_service.generate(saved_file.id, saved_file.path),
+            self.embedding_service.compute_embedding(saved_file.path),
+            self.metadata_service.compute_metadata(saved_file.path)
+        )
+        storage_key: str = make_key(saved_file.sha256, saved_file.extension)
         try:
-            self.session.begin()
-            file_path = await self.save_file(file)
-            id: str = file_path.split("/")[-1].split(".")[0]
-            extension: str = file_path.split("/")[-1].split(".")[1]
-            image_in_db: Image = Image(id=id, extension=extension)
+            # The blob row is claimed before the file is published so a concurrent delete of
+            # the same content cannot remove it between the two steps.
+            await self.acquire_blobs([storage_key])
+            await self.storage.put(saved_file.path, storage_key)
+            embedding_rows: list[int | None] = await self.embedding_service.add([embedding])
+            image_in_db: Image = Image(
+                id=saved_file.id, 
+                extension=saved_file.extension, 
+                sha256=saved_file.sha256, 
+                storage_key=storage_key,
+                size_bytes=saved_file.size_bytes,
+                dhash=dhash,
+                hashed_at=datetime.now(timezone.utc) if dhash is not None else None,
+                embedding_row=embedding_rows[0],
+                variants=variants,
+                **(metadata or empty_metadata())
+            )
             self.session.add(image_in_db)
-            self.session.commit()
+            await self.stats_service.increment(Counter({(STATS_IMAGES, "total"): 1}))
+            await self.session.commit()
         except Exception as e:
-            self.session.rollback()
+            await self.session.rollback()
+            self.remove_files([saved_file.path])
             raise HTTPException(status_code=500, detail=f"Error saving file: {e}")
-        else:
-            image_in_db = self.session.query(Image).filter(Image.id == id).first()
-            return ImageRead.from_image(image_in_db)
+        if self.screening_service is not None:
+            self.screening_service.enqueue(saved_file.id, self.storage.local_path(storage_key))
+        return ImageUploadResponse(
+            **ImageRead.from_image(image_in_db).model_dump(),
+            possible_duplicates=await self.deduplication_service.find_duplicates(dhash, exclude_id=saved_file.id)
+        )
+    
+    async def upload_many(self, files: list[UploadFile]) -> list[ImageUploadResponse]:
+        semaphore: asyncio.Semaphore = asyncio.Semaphore(MAX_CONCURRENT_WRITES)
+
+        async def save(file: UploadFile) -> SavedFile:
+            async with semaphore:
+                return await self.save_file(file)
+
+        results: list = await asyncio.gather(*(save(file) for file in files), return_exceptions=True)
+        saved_files: list[SavedFile] = [result for result in results if isinstance(result, SavedFile)]
+        errors: list[BaseException] = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            self.remove_files([saved_file.path for saved_file in saved_files])
+            if isinstance(errors[0], HTTPException):
+                raise errors[0]
+            raise HTTPException(status_code=500, detail=f"Error saving files: {errors[0]}")
+
+        dhashes, variants, embeddings, metadatas = await asyncio.gather(
+            self.deduplication_service.compute_hashes([saved_file.path for saved_file in saved_files]),
+            asyncio.gather(*(
+                self.derivative_service.generate(saved_file.id, saved_file.path) for saved_file in saved_files
+            )),
+            self.embedding_service.compute_embeddings([saved_file.path for saved_file in saved_files]),
+            self.metadata_service.compute_metadatas([saved_file.path for saved_file in saved_files])
+        )
+        date_created: datetime = datetime.now(timezone.utc)
+        rows: list[dict] = [
+            {
+                "id": saved_file.id, 
+                "extension": saved_file.extension, 
+                "sha256": saved_file.sha256, 
+                "storage_key": make_key(saved_file.sha256, saved_file.extension),
+                "size_bytes": saved_file.size_bytes, 
+                "dhash": dhash,
+                "hashed_at": date_created if dhash is not None else None,
+                "variants": image_variants,
+                "date_created": date_created, 
+                "labelled": False,
+                **(metadata or empty_metadata())
+            } 
+            for saved_file, dhash, image_variants, metadata in zip(saved_files, dhashes, variants, metadatas)
+        ]
+        try:
+            if rows:
+                await self.acquire_blobs([row["storage_key"] for row in rows])
+                for saved_file, row in zip(saved_files, rows):
+                    await self.storage.put(saved_file.path, row["storage_key"])
+                for row, embedding_row in zip(rows, await self.embedding_service.add(embeddings)):
+                    row["embedding_row"] = embedding_row
+                await self.session.execute(insert(Image), rows)
+                await self.stats_service.increment(Counter({(STATS_IMAGES, "total"): len(rows)}))
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            self.remove_files([saved_file.path for saved_file in saved_files])
+            raise HTTPException(status_code=500, detail=f"Error saving files: {e}")
+        if self.screening_service is not None:
+            for row in rows:
+                self.screening_service.enqueue(row["id"], self.storage.local_path(row["storage_key"]))
+        duplicates: list[list[str]] = await self.deduplication_service.find_duplicates_many(
+            [(row["dhash"], row["id"]) for row in rows]
+        )
+        return [
+            ImageUploadResponse(**row, possible_duplicates=possible_duplicates) 
+            for row, possible_duplicates in zip(rows, duplicates)
+        ]
         
-    async def get_next_image(self) -> ImageRead | None:
+    async def get_next_image(self, annotator: str) -> ImageRead | None:
         try:
-            image_in_db: Image = self.session.query(Image).filter(Image.labelled == False).first()
+            # An annotator reloading the page gets back the image they already hold
+            image_in_db: Image | None = (await self.session.scalars(
+                select(Image)
+                .where(
+                    Image.claimed_by == annotator, 
+                    Image.labelled == False, 
+                    Image.flagged.is_not(True),
+                    Image.deleted_at.is_(None),
+                    Image.lease_expires_at > datetime.now(timezone.utc)
+                )
+                .order_by(Image.date_created, Image.id)
+                .limit(1)
+            )).first()
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error getting next image: {e}")
-        else:
-            if image_in_db is None:
-                return None
+        if image_in_db is not None:
             return ImageRead.from_image(image_in_db)
-        
+        images: list[ImageRead] = await self.claim_next_images(annotator, 1)
+        if not images:
+            return None
+        return images[0]
+    
+    async def claim_next_images(self, annotator: str, count: int = 1) -> list[ImageRead]:
+        count = max(1, min(count, MAX_CLAIM_BATCH))
+        now: datetime = datetime.now(timezone.utc)
+        lease_expires_at: datetime = now + LEASE_DURATION
+        # FOR UPDATE SKIP LOCKED lets concurrent claims on Postgres pass each other instead
+        # of queueing on the same rows. SQLite renders no locking clause, but it serialises
+        # writers, so the single UPDATE below is still atomic there.
+        candidates = (
+            select(Image.id)
+            .where(
+                Image.labelled == False,
+                Image.flagged.is_not(True),
+                Image.deleted_at.is_(None),
+                or_(Image.lease_expires_at.is_(None), Image.lease_expires_at < now),
+            )
+            .order_by(Image.date_created, Image.id)
+            .limit(count)
+            .with_for_update(skip_locked=True)
+        )
+        statement = (
+            update(Image)
+            .where(Image.id.in_(candidates.scalar_subquery()))
+            .values(claimed_by=annotator, lease_expires_at=lease_expires_at)
+            .execution_options(synchronize_session=False)
+        )
+        try:
+            if self.session.bind.dialect.update_returning:
+                images_in_db: list[Image] = list((await self.session.scalars(statement.returning(Image))).all())
+            else:
+                await self.session.execute(statement)
+                images_in_db = list((await self.session.scalars(
+                    select(Image).where(Image.claimed_by == annotator, Image.lease_expires_at == lease_expires_at)
+                )).all())
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            raise HTTPException(status_code=500, detail=f"Error claiming images: {e}")
+        images_in_db.sort(key=lambda image: (image.date_created, image.id))
+        return [ImageRead.from_image(image) for image in images_in_db]
+    
+    async def prefetch_images(self, annotator: str, count: int = PREFETCH_COUNT) -> list[ImageRead]:
+        # The label page queues these in the browser, so images already held are renewed
+        # rather than left to expire while the annotator works through the queue.
+        count = max(1, min(count, MAX_CLAIM_BATCH))
+        now: datetime = datetime.now(timezone.utc)
+        held = (
+            Image.claimed_by == annotator, 
+            Image.labelled == False, 
+            Image.flagged.is_not(True), 
+            Image.deleted_at.is_(None),
+            Image.lease_expires_at > now
+        )
+        try:
+            await self.session.execute(
+                update(Image)
+                .where(*held)
+                .values(lease_expires_at=now + LEASE_DURATION)
+                .execution_options(synchronize_session=False)
+            )
+            images_in_db: list[Image] = list((await self.session.scalars(
+                select(Image).where(*held).order_by(Image.date_created, Image.id).limit(count)
+            )).all())
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            raise HTTPException(status_code=500, detail=f"Error prefetching images: {e}")
+        images: list[ImageRead] = [ImageRead.from_image(image) for image in images_in_db]
+        if len(images) < count:
+            images.extend(await self.claim_next_images(annotator, count - len(images)))
+        return images
+
+    async def release_image(self, id: str, annotator: str):
+        try:
+            await self.session.execute(
+                update(Image)
+                .where(Image.id == id, Image.claimed_by == annotator, Image.labelled == False)
+                .values(claimed_by=None, lease_expires_at=None)
+                .execution_options(synchronize_session=False)
+            )
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            raise HTTPException(status_code=500, detail=f"Error releasing image: {e}")
+    
     async def get_image(self, id: str) -> ImageRead:
         try:
-            image_in_db: Image = self.session.query(Image).filter(Image.id == id).first()
+            image_in_db: Image | None = await self.session.get(Image, id)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error getting image: {e}")
         else:
-            if image_in_db is None:
+            if image_in_db is None or image_in_db.deleted_at is not None:
                 return None
             return ImageRead.from_image(image_in_db)
         
     async def delete_image(self, id: str):
+        deleted: int = await self.delete_images(ImageDeleteRequest(ids=[id]))
+        if deleted == 0:
+            raise HTTPException(status_code=404, detail="Image not found")
+
+    async def delete_images(self, delete_request: ImageDeleteRequest) -> int:
+        # A single UPDATE marks every matching image deleted (ids and filters are combined with
+        # OR); files, blob references and rows are left to the garbage collector.
+        conditions: list = []
+        if delete_request.ids:
+            conditions.append(Image.id.in_(set(delete_request.ids)))
+        filters: ImageFilters | None = delete_request.filters
+        if filters is not None and filters.model_dump(exclude_none=True, exclude={"sort"}):
+            conditions.append(Image.id.in_(self.filter_images(select(Image.id), filters).order_by(None).scalar_subquery()))
+        if not conditions:
+            raise HTTPException(status_code=400, detail="Give image ids or at least one filter")
         try:
-            self.session.begin()
-            await self.delete_file(id)
-            image_in_db: Image = self.session.query(Image).filter(Image.id == id).first()
-            self.session.delete(image_in_db)
-            self.session.commit()
+            labelled: list[bool] = list((await self.session.scalars(
+                update(Image)
+                .where(or_(*conditions), Image.deleted_at.is_(None))
+                .values(deleted_at=datetime.now(timezone.utc), claimed_by=None, lease_expires_at=None)
+                .returning(Image.labelled)
+                .execution_options(synchronize_session=False)
+            )).all())
+            await self.stats_service.increment(Counter({
+                (STATS_IMAGES, "total"): -len(labelled), 
+                (STATS_IMAGES, "labelled"): -sum(labelled)
+            }))
+            await self.session.commit()
         except Exception as e:
-            self.session.rollback()
-            raise HTTPException(status_code=500, detail=f"Error deleting image: {e}")
+            await self.session.rollback()
+            raise HTTPException(status_code=500, detail=f"Error deleting images: {e}")
+        return len(labelled)
+    
+    async def acquire_blobs(self, keys: list[str]):
+        # Does not commit; identical uploads in one batch are folded into a single increment
+        upsert = dialect_insert(self.session)
+        statement = upsert(Blob).values([{"key": key, "ref_count": count} for key, count in Counter(keys).items()])
+        await self.session.execute(statement.on_conflict_do_update(
+            index_elements=["key"], set_={"ref_count": Blob.ref_count + statement.excluded.ref_count}
+        ))
+    
+    async def release_blobs(self, keys: list[str]):
+        # Does not commit. Unreferenced files are removed before the caller commits, so an upload
+        # re-acquiring the same key waits on the blob row and then republishes the file.
+        keys_by_count: dict[int, list[str]] = {}
+        for key, count in Counter(keys).items():
+            keys_by_count.setdefault(count, []).append(key)
+        for count, count_keys in keys_by_count.items():
+            await self.session.execute(
+                update(Blob).where(Blob.key.in_(count_keys)).values(ref_count=Blob.ref_count - count)
+            )
+        orphaned_keys: list[str] = list((await self.session.scalars(
+            delete(Blob).where(Blob.key.in_(set(keys)), Blob.ref_count <= 0).returning(Blob.key)
+        )).all())
+        await asyncio.gather(*(self.storage.delete(key) for key in orphaned_keys))
+        
+    def filter_images(self, statement, filters: ImageFilters):
+        statement = statement.where(Image.deleted_at.is_(None))
+        if filters.labelled is not None:
+            statement = statement.where(Image.labelled == filters.labelled)
+        if filters.min_width is not None:
+            statement = statement.where(Image.width >= filters.min_width)
+        if filters.min_height is not None:
+            statement = statement.where(Image.height >= filters.min_height)
+        if filters.format is not None:
+            statement = statement.where(Image.format == filters.format.upper())
+        if filters.mode is not None:
+            statement = statement.where(Image.mode == filters.mode)
+        if filters.gender is not None or filters.tag is not None:
+            labelled_image_ids = select(ImageLabel.image_id)
+            if filters.gender is not None:
+                labelled_image_ids = labelled_image_ids.where(ImageLabel.gender == filters.gender)
+            if filters.tag is not None:
+                labelled_image_ids = labelled_image_ids.where(ImageLabel.id.in_(
+                    select(ImageLabelTag.image_label_id).join(Tag).where(Tag.name == filters.tag)
+                ))
+            statement = statement.where(Image.id.in_(labelled_image_ids))
+        sort_column = getattr(Image, filters.sort)
+        if filters.sort != "date_created":
+            # Keyset pagination cannot step over NULLs, so unknown values are left out
+            statement = statement.where(sort_column.is_not(None))
+        return statement.order_by(sort_column, Image.id)
         
-    async def list_images(self) -> list[ImageRead]:
+    async def list_images(self, filters: ImageFilters, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None) -> ImagePage:
+        statement = self.filter_images(select(Image), filters).limit(limit + 1)
+        if cursor is not None:
+            statement = statement.where(after_cursor(getattr(Image, filters.sort), Image.id, cursor))
         try:
-            images_in_db: list[Image] = self.session.query(Image).all()
+            images_in_db: list[Image] = list((await self.session.scalars(statement)).all())
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error listing images: {e}")
-        else:
-            return [ImageRead.from_image(image) for image in images_in_db]
+        # One extra row is fetched to know whether another page exists
+        next_cursor: str | None = None
+        if len(images_in_db) > limit:
+            images_in_db = images_in_db[:limit]
+            next_cursor = encode_cursor(getattr(images_in_db[-1], filters.sort), images_in_db[-1].id)
+        return ImagePage(items=[ImageRead.from_image(image) for image in images_in_db], next_cursor=next_cursor)
+    
+    async def stream_images(self, filters: ImageFilters) -> AsyncIterator[str]:
+        statement = self.filter_images(select(Image), filters).execution_options(yield_per=STREAM_BATCH_SIZE)
+        try:
+            async for image in await self.session.stream_scalars(statement):
+                yield ImageRead.from_image(image).model_dump_json() + "\n"
+        finally:
+            # The response outlives the request dependency, so the stream owns the session
+            await self.session.close()
 
 
-    async def save_file(self, file: UploadFile) -> str:
-        # Generate a secure, unique filename to prevent path traversal and overwrites
+    async def save_file(self, file: UploadFile) -> SavedFile:
+        # Stage under a generated name to prevent path traversal; the file is only published
+        # under its content hash once the whole upload has been read
         file_extension = os.path.splitext(file.filename)[1]
-        secure_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join("data", secure_filename)
+        id: str = str(uuid.uuid4())
+        file_path = self.storage.staging_path(file_extension.lstrip("."))
 
+        if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+            await file.close()
+            raise HTTPException(status_code=413, detail=f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+        # Stream in fixed-size chunks so memory per upload is bounded by the chunk size,
+        # hashing on the way through instead of re-reading the file afterwards.
+        sha256 = hashlib.sha256()
+        size_bytes: int = 0
         try:
             async with aiofiles.open(file_path, "wb") as out_file:
-                content = await file.read()  # Read file content
-                await out_file.write(content)  # Write to disk
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    size_bytes += len(chunk)
+                    if size_bytes > MAX_UPLOAD_BYTES:
+                        raise HTTPException(status_code=413, detail=f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+                    sha256.update(chunk)
+                    await out_file.write(chunk)
+        except HTTPException:
+            self.remove_files([file_path])
+            raise
         except Exception as e:
+            self.remove_files([file_path])
             raise HTTPException(status_code=500, detail=f"Error saving file: {e}")
         finally:
             # Ensure the temporary file is closed
             await file.close()
-        return file_path
+        return SavedFile(
+            id=id, 
+            extension=file_extension.lstrip("."), 
+            path=file_path, 
+            sha256=sha256.hexdigest(), 
+            size_bytes=size_bytes
+        )
     
-    async def delete_file(self, id: str) -> str:
-        id = f"{id}.jpeg"
-        file_path = os.path.join("data", id)
-        try:
-            os.remove(file_path)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error deleting file: {e}")
-        return file_path
+    def remove_files(self, file_paths: list[str]):
+        for file_path in file_paths:
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
     
 
 class TagService:
-    def __init__(self, session: Session):
+    def __init__(self, session: AsyncSession, catalogue: TagCatalogue = tag_catalogue):
         self.session = session
+        self.catalogue = catalogue
 
-    def get_tags(self) -> list[Tag]:
-        return self.session.query(Tag).all()
+    async def get_tags(self) -> list[TagRead]:
+        _, tags = await self.catalogue.get_tags(self.session)
+        return tags
     
-    def get_tag(self, id: str) -> Tag | None:
-        return self.session.query(Tag).filter(Tag.id == id).first()
+    async def get_catalogue(self) -> tuple[int, list[TagRead]]:
+        return await self.catalogue.get_tags(self.session)
     
-    def get_tag_by_name(self, name: str) -> Tag | None:
-        return self.session.query(Tag).filter(Tag.name == name).first()
+    async def get_tag(self, id: str) -> Tag | None:
+        return await self.session.get(Tag, id)
     
-    def create_tag(self, name: str) -> Tag:
-        tag: Tag | None = self.get_tag_by_name(name)
-        if tag is not None:
-            return tag
-        id: str = str(uuid.uuid4())
-        tag = Tag(name=name, id=id)
-        self.session.add(tag)
-        self.session.commit()
-        return tag
-    
-    def delete_tag(self, id: str):
-        tag: Tag | None = self.get_tag(id)
-        if tag is None:
+    async def get_tag_by_name(self, name: str) -> TagRead | None:
+        tag_ids: dict[str, str] = await self.catalogue.get_ids(self.session, {name})
+        if name not in tag_ids:
+            return None
+        return TagRead(id=tag_ids[name], name=name)
+    
+    async def create_tag(self, name: str) -> TagRead:
+        tag_ids: dict[str, str] = await self.resolve_tag_ids({name})
+        await self.session.commit()
+        self.catalogue.invalidate()
+        return TagRead(id=tag_ids[name], name=name)
+    
+    async def delete_tag(self, id: str):
+        name: str | None = await self.session.scalar(delete(Tag).where(Tag.id == id).returning(Tag.name))
+        if name is None:
+            await self.session.rollback()
             return
-        self.session.delete(tag)
-        self.session.commit()
+        await self.catalogue.bump_version(self.session)
+        await self.session.execute(delete(LabellingStat).where(LabellingStat.scope == STATS_TAG, LabellingStat.key == name))
+        await self.session.commit()
+        self.catalogue.invalidate()
 
-    def get_image_label_tag(self, image_label_id: str, tag_id: str):
-        return self.session.query(ImageLabelTag).filter(ImageLabelTag.image_label_id == image_label_id, ImageLabelTag.tag_id == tag_id).first()
+    async def resolve_tag_ids(self, tag_names: set[str]) -> dict[str, str]:
+        # Does not commit: callers fold tag creation into their own transaction
+        if not tag_names:
+            return {}
+        tag_ids: dict[str, str] = await self.catalogue.get_ids(self.session, tag_names)
+        missing_names: set[str] = tag_names - tag_ids.keys()
+        if missing_names:
+            # Another request may create the same tag concurrently, so insert what is missing
+            # and read back the winning ids rather than trusting the ones generated here.
+            upsert = dialect_insert(self.session)
+            await self.session.execute(
+                upsert(Tag)
+                .values([{"id": str(uuid.uuid4()), "name": tag_name} for tag_name in missing_names])
+                .on_conflict_do_nothing(index_elements=["name"])
+            )
+            tag_ids.update((await self.session.execute(select(Tag.name, Tag.id).where(Tag.name.in_(missing_names)))).all())
+            await self.catalogue.bump_version(self.session)
+        return tag_ids
 
-    def create_image_label_tag(self, image_label_id: str, tag_id: str):
-        image_label_tag: ImageLabelTag | None = self.get_image_label_tag(image_label_id, tag_id)
+    async def get_image_label_tag(self, image_label_id: str, tag_id: str):
+        return (await self.session.scalars(
+            select(ImageLabelTag).where(ImageLabelTag.image_label_id == image_label_id, ImageLabelTag.tag_id == tag_id)
+        )).first()
+
+    async def create_image_label_tag(self, image_label_id: str, tag_id: str):
+        image_label_tag: ImageLabelTag | None = await self.get_image_label_tag(image_label_id, tag_id)
         if image_label_tag is not None:
             return image_label_tag
         image_label_tag = ImageLabelTag(image_label_id=image_label_id, tag_id=tag_id)
         self.session.add(image_label_tag)
-        self.session.commit()
+        await self.session.commit()
         return image_label_tag
 
 
 class ImageLabellingService:
-    def __init__(self, session: Session, image_service: ImageService, tag_service: TagService):
+    def __init__(
+            self, 
+            session: AsyncSession, 
+            image_service: ImageService, 
+            tag_service: TagService, 
+            metrics: LabellingMetrics = labelling_metrics,
+            stats_service: StatsService | None = None):
             self.session = session
             self.image_service = image_service
             self.tag_service = tag_service
+            self.metrics = metrics
+            self.stats_service = stats_service or StatsService(session)
     
-    async def label_image(self, image_id: str, label_request: ImageLabelRequest) -> ImageLabelResponse:
-        image: Image = await self.image_service.get_image(image_id)
-        if image is None:
-            raise HTTPException(status_code=404, detail="Image not found")
-        
-        # self.session.begin()
-        tag_ids: list[str] = []
-        for tag_name in label_request.tags:
-            tag: Tag = self.tag_service.create_tag(tag_name)
-            tag_ids.append(tag.id)
-        id: str = str(uuid.uuid4())
-        image_label: ImageLabel = ImageLabel(
-            image_id=image_id, gender=label_request.gender, description=label_request.description, id=id)
-        
-        image_label_tags: list[ImageLabelTag] = []
-        for tag_id in tag_ids:
-            image_label_tag: ImageLabelTag = self.tag_service.create_image_label_tag(id, tag_id)
-            image_label_tags.append(image_label_tag)
-        self.session.add(image_label)
-        self.session.commit()
-        
-        return ImageLabelResponse.from_image_label(image_label)
+    async def label_image(self, image_id: str, label_request: ImageLabelRequest, annotator: str | None = None) -> ImageLabelResponse:
+        item: ImageLabelBatchItem = ImageLabelBatchItem(image_id=image_id, **label_request.model_dump())
+        image_labels: list[ImageLabelResponse] = await self.label_images([item], annotator)
+        return image_labels[0]
+    
+    async def label_images(self, items: list[ImageLabelBatchItem], annotator: str | None = None) -> list[ImageLabelResponse]:
+        if not items:
+            return []
+        image_ids: set[str] = {item.image_id for item in items}
+        tag_names: set[str] = {tag_name for item in items for tag_name in item.tags}
+        try:
+            found_ids: set[str] = set((await self.session.scalars(
+                select(Image.id).where(Image.id.in_(image_ids), Image.deleted_at.is_(None))
+            )).all())
+            missing_ids: set[str] = image_ids - found_ids
+            if missing_ids:
+                raise HTTPException(status_code=404, detail=f"Images not found: {sorted(missing_ids)}")
+            tag_ids: dict[str, str] = await self.tag_service.resolve_tag_ids(tag_names)
+
+            date_created: datetime = datetime.now(timezone.utc)
+            stats: Counter = Counter({(STATS_LABELS, "total"): len(items), (STATS_DAY, day_key(date_created)): len(items)})
+            label_rows: list[dict] = []
+            label_tag_rows: list[dict] = []
+            image_labels: list[ImageLabelResponse] = []
+            for item in items:
+                id: str = str(uuid.uuid4())
+                item_tags: list[str] = list(dict.fromkeys(item.tags))
+                label_rows.append({
+                    "id": id, 
+                    "image_id": item.image_id, 
+                    "gender": item.gender, 
+                    "description": item.description, 
+                    "date_created": date_created
+                })
+                stats[(STATS_GENDER, item.gender)] += 1
+                stats.update((STATS_TAG, tag_name) for tag_name in item_tags)
+                label_tag_rows.extend(
+                    {"id": str(uuid.uuid4()), "image_label_id": id, "tag_id": tag_ids[tag_name]} for tag_name in item_tags
+                )
+                image_labels.append(ImageLabelResponse(
+                    id=id, image_id=item.image_id, gender=item.gender, description=item.description, tags=item_tags
+                ))
+            await self.session.execute(insert(ImageLabel), label_rows)
+            if label_tag_rows:
+                await self.session.execute(insert(ImageLabelTag), label_tag_rows)
+            # Only images flipping to labelled here count; a relabel adds labels but not images
+            result = await self.session.execute(
+                update(Image)
+                .where(Image.id.in_(image_ids), Image.labelled == False)
+                .values(labelled=True, claimed_by=None, lease_expires_at=None)
+                .execution_options(synchronize_session=False)
+            )
+            stats[(STATS_IMAGES, "labelled")] += result.rowcount
+            await self.stats_service.increment(stats)
+            await self.session.commit()
+        except HTTPException:
+            await self.session.rollback()
+            raise
+        except Exception as e:
+            await self.session.rollback()
+            raise HTTPException(status_code=500, detail=f"Error labelling images: {e}")
+        if annotator is not None:
+            self.metrics.record_labels(annotator, len(image_labels))
+        return image_labels
+
+    def get_metrics(self) -> dict:
+        return self.metrics.snapshot()
     
-    def get_image_label(self, id: str) -> ImageLabelResponse:
-        image_label: ImageLabel = self.session.query(ImageLabel).filter(ImageLabel.id == id).first()
+    async def get_image_label(self, id: str) -> ImageLabelResponse:
+        image_label: ImageLabel = (await self.session.scalars(
+            select(ImageLabel).options(*LABEL_TAGS_LOADER).where(ImageLabel.id == id)
+        )).first()
         if image_label is None:
             raise HTTPException(status_code=404, detail="Image label not found")
         return ImageLabelResponse.from_image_label(image_label)
     
-    def get_image_label_image_id(self, image_id: str):
-        image_label: ImageLabel = self.session.query(ImageLabel).filter(ImageLabel.image_id == image_id).first()
+    async def get_image_label_image_id(self, image_id: str):
+        image_label: ImageLabel = (await self.session.scalars(
+            select(ImageLabel).options(*LABEL_TAGS_LOADER).where(ImageLabel.image_id == image_id)
+        )).first()
         return image_label
     
-    def get_image_labels(self):
-        image_labels: list[ImageLabel] = self.session.query(ImageLabel).all()
-        return [ImageLabelResponse.from_image_label(image_label) for image_label in image_labels]
+    def filter_image_labels(self, statement, filters: ImageLabelFilters):
+        # Only labels whose image is still live: a soft-deleted or already purged image hides them
+        statement = statement.where(
+            select(Image.id).where(Image.id == ImageLabel.image_id, Image.deleted_at.is_(None)).exists()
+        )
+        if filters.image_id is not None:
+            statement = statement.where(ImageLabel.image_id == filters.image_id)
+        if filters.gender is not None:
+            statement = statement.where(ImageLabel.gender == filters.gender)
+        if filters.tag is not None:
+            statement = statement.where(ImageLabel.id.in_(
+                select(ImageLabelTag.image_label_id).join(Tag).where(Tag.name == filters.tag)
+            ))
+        return statement.order_by(ImageLabel.date_created, ImageLabel.id)
+    
+    async def get_image_labels(self, filters: ImageLabelFilters, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None) -> ImageLabelPage:
+        statement = self.filter_image_labels(select(ImageLabel).options(*LABEL_TAGS_LOADER), filters).limit(limit + 1)
+        if cursor is not None:
+            statement = statement.where(after_cursor(ImageLabel.date_created, ImageLabel.id, cursor))
+        image_labels: list[ImageLabel] = list((await self.session.scalars(statement)).all())
+        next_cursor: str | None = None
+        if len(image_labels) > limit:
+            image_labels = image_labels[:limit]
+            next_cursor = encode_cursor(image_labels[-1].date_created, image_labels[-1].id)
+        return ImageLabelPage(
+            items=[ImageLabelResponse.from_image_label(image_label) for image_label in image_labels], 
+            next_cursor=next_cursor
+        )
+    
+    async def stream_image_labels(self, filters: ImageLabelFilters) -> AsyncIterator[str]:
+        statement = self.filter_image_labels(select(ImageLabel).options(*LABEL_TAGS_LOADER), filters).execution_options(yield_per=STREAM_BATCH_SIZE)
+        try:
+            async for image_label in await self.session.stream_scalars(statement):
+                yield ImageLabelResponse.from_image_label(image_label).model_dump_json() + "\n"
+        finally:
+            await self.session.close()
     
 
 class DeduplicationService:
-     pass
+    def __init__(self, session: AsyncSession, index: DuplicateIndex = duplicate_index):
+        self.session = session
+        self.index = index
+
+    async def compute_hash(self, file_path: str) -> str | None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(process_pool, compute_dhash, file_path)
+    
+    async def compute_hashes(self, file_paths: list[str]) -> list[str | None]:
+        return list(await asyncio.gather(*(self.compute_hash(file_path) for file_path in file_paths)))
+
+    async def refresh(self):
+        # Keyed on hashed_at rather than date_created: backfilled hashes belong to old images
+        async with self.index.lock:
+            started: datetime = datetime.now(timezone.utc)
+            statement = select(Image.id, Image.dhash, Image.hashed_at).where(Image.dhash.is_not(None))
+            if self.index.watermark is not None:
+                statement = statement.where(Image.hashed_at > self.index.watermark - DEDUPLICATION_SETTLE_DELAY)
+            statement = statement.execution_options(yield_per=DEDUPLICATION_BATCH_SIZE)
+            watermark: datetime | None = self.index.watermark
+            async for id, dhash, hashed_at in await self.session.stream(statement):
+                if hashed_at is not None:
+                    # SQLite hands back naive datetimes; everything is stored in UTC
+                    hashed_at = hashed_at if hashed_at.tzinfo is not None else hashed_at.replace(tzinfo=timezone.utc)
+                    watermark = hashed_at if watermark is None else max(watermark, hashed_at)
+                if id in self.index.ids:
+                    continue
+                self.index.tree.add(int(dhash, 16), id)
+                self.index.ids.add(id)
+            # Rows hashed before hashed_at existed only come in with the first full scan
+            self.index.watermark = watermark or started
+
+    async def find_duplicates(self, dhash: str | None, exclude_id: str | None = None, max_distance: int = MAX_DUPLICATE_DISTANCE) -> list[str]:
+        return (await self.find_duplicates_many([(dhash, exclude_id)], max_distance))[0]
+
+    async def find_duplicates_many(
+        self, hashes: list[tuple[str | None, str | None]], max_distance: int = MAX_DUPLICATE_DISTANCE
+    ) -> list[list[str]]:
+        # One refresh and one live-id query for a whole batch of (dhash, exclude_id) pairs
+        if all(dhash is None for dhash, _ in hashes):
+            return [[] for _ in hashes]
+        await self.refresh()
+        candidates: list[list[str]] = [
+            [id for id, _ in self.index.tree.search(int(dhash, 16), max_distance) if id != exclude_id] 
+            if dhash is not None else []
+            for dhash, exclude_id in hashes
+        ]
+        ids: set[str] = {id for ids in candidates for id in ids}
+        if not ids:
+            return candidates
+        # The tree never forgets an image, so soft-deleted ones are dropped here
+        live_ids: set[str] = set((await self.session.scalars(
+            select(Image.id).where(Image.id.in_(ids), Image.deleted_at.is_(None))
+        )).all())
+        return [[id for id in ids if id in live_ids] for ids in candidates]
+
+    async def backfill(self, batch_size: int = DEDUPLICATION_BATCH_SIZE) -> int:
+        hashed: int = 0
+        last_id: str = ""
+        while True:
+            images: list[tuple[str, str, str | None]] = list((await self.session.execute(
+                select(Image.id, Image.extension, Image.storage_key)
+                .where(Image.dhash.is_(None), Image.deleted_at.is_(None), Image.id > last_id)
+                .order_by(Image.id)
+                .limit(batch_size)
+            )).all())
+            if not images:
+                return hashed
+            last_id = images[-1][0]
+            dhashes: list[str | None] = await self.compute_hashes([get_image_path(*image) for image in images])
+            hashed_at: datetime = datetime.now(timezone.utc)
+            rows: list[dict] = [
+                {"id": id, "dhash": dhash, "hashed_at": hashed_at} 
+                for (id, _, _), dhash in zip(images, dhashes) if dhash is not None
+            ]
+            if rows:
+                await self.session.execute(update(Image), rows)
+                await self.session.commit()
+            hashed += len(rows)
+
+class EmbeddingService:
+    def __init__(self, session: AsyncSession, index: EmbeddingIndex = embedding_index):
+        self.session = session
+        self.index = index
+
+    async def compute_embedding(self, file_path: str) -> list[float] | None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(process_pool, compute_embedding, file_path)
+
+    async def compute_embeddings(self, file_paths: list[str]) -> list[list[float] | None]:
+        return list(await asyncio.gather(*(self.compute_embedding(file_path) for file_path in file_paths)))
+
+    async def add(self, embeddings: list[list[float] | None]) -> list[int | None]:
+        # Appends the vectors that were computed and returns their rows, aligned with the input.
+        # A rolled-back upload leaves its row unreferenced, which searches simply skip.
+        vectors: list[list[float]] = [embedding for embedding in embeddings if embedding is not None]
+        if not vectors:
+            return [None] * len(embeddings)
+        row: int = await asyncio.to_thread(self.index.append, vectors)
+        rows: list[int | None] = []
+        for embedding in embeddings:
+            rows.append(None if embedding is None else row)
+            row += embedding is not None
+        return rows
+
+    async def get_vector(self, id: str) -> np.ndarray:
+        image: tuple[int | None, str, str | None] | None = (await self.session.execute(
+            select(Image.embedding_row, Image.extension, Image.storage_key).where(Image.id == id, Image.deleted_at.is_(None))
+        )).first()
+        if image is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        embedding_row, extension, storage_key = image
+        if embedding_row is None:
+            # Images from before the index existed are embedded on first request
+            embedding: list[float] | None = await self.compute_embedding(get_image_path(id, extension, storage_key))
+            if embedding is None:
+                raise HTTPException(status_code=422, detail="Image could not be embedded")
+            [embedding_row] = await self.add([embedding])
+            await self.session.execute(update(Image).where(Image.id == id).values(embedding_row=embedding_row))
+            await self.session.commit()
+        vector: np.ndarray | None = self.index.get(embedding_row)
+        if vector is None:
+            raise HTTPException(status_code=500, detail=f"Embedding row {embedding_row} is missing from the index")
+        return vector
+
+    async def suggest_tags(self, id: str, k: int = SUGGESTION_NEIGHBOURS) -> SuggestedTagsResponse:
+        # Tags of the k most similar labelled images, each weighted by the similarity of the
+        # images carrying it, as a share of the total similarity of all k neighbours.
+        vector: np.ndarray = await self.get_vector(id)
+        scores_by_row: dict[int, float] = dict(self.index.search(vector, k * SUGGESTION_OVERSAMPLE + 1))
+        neighbours: list[tuple[str, float]] = sorted(
+            (
+                (image_id, scores_by_row[embedding_row]) 
+                for image_id, embedding_row in await self.session.execute(
+                    select(Image.id, Image.embedding_row)
+                    .where(
+                        Image.embedding_row.in_(scores_by_row.keys()), 
+                        Image.labelled == True, 
+                        Image.deleted_at.is_(None), 
+                        Image.id != id
+                    )
+                )
+            ),
+            key=lambda neighbour: neighbour[1],
+            reverse=True
+        )[:k]
+        scores_by_id: dict[str, float] = {image_id: max(score, 0.0) for image_id, score in neighbours}
+        tag_scores: Counter = Counter()
+        if scores_by_id:
+            for image_id, name in await self.session.execute(
+                select(ImageLabel.image_id, Tag.name)
+                .join(ImageLabelTag, ImageLabelTag.image_label_id == ImageLabel.id)
+                .join(Tag, Tag.id == ImageLabelTag.tag_id)
+                .where(ImageLabel.image_id.in_(scores_by_id.keys()))
+                .distinct()
+            ):
+                tag_scores[name] += scores_by_id[image_id]
+        total: float = sum(scores_by_id.values()) or 1.0
+        return SuggestedTagsResponse(
+            image_id=id,
+            neighbours=[image_id for image_id, _ in neighbours],
+            tags=[SuggestedTag(name=name, score=score / total) for name, score in tag_scores.most_common(MAX_SUGGESTED_TAGS)]
+        )
+
+    async def backfill(self, batch_size: int = EMBEDDINGS_BATCH_SIZE) -> int:
+        embedded: int = 0
+        last_id: str = ""
+        while True:
+            images: list[tuple[str, str, str | None]] = list((await self.session.execute(
+                select(Image.id, Image.extension, Image.storage_key)
+                .where(Image.embedding_row.is_(None), Image.deleted_at.is_(None), Image.id > last_id)
+                .order_by(Image.id)
+                .limit(batch_size)
+            )).all())
+            if not images:
+                return embedded
+            last_id = images[-1][0]
+            embeddings: list[list[float] | None] = await self.compute_embeddings([get_image_path(*image) for image in images])
+            rows: list[dict] = [
+                {"id": id, "embedding_row": embedding_row} 
+                for (id, _, _), embedding_row in zip(images, await self.add(embeddings)) if embedding_row is not None
+            ]
+            if rows:
+                await self.session.execute(update(Image), rows)
+                await self.session.commit()
+            embedded += len(rows)
+
+
+class MetadataService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def compute_metadata(self, file_path: str, include_size: bool = False) -> dict | None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(process_pool, extract_metadata, file_path, include_size)
+
+    async def compute_metadatas(self, file_paths: list[str], include_size: bool = False) -> list[dict | None]:
+        return list(await asyncio.gather(*(self.compute_metadata(file_path, include_size) for file_path in file_paths)))
+
+    async def backfill(self, batch_size: int = METADATA_BATCH_SIZE) -> int:
+        extracted: int = 0
+        last_id: str = ""
+        while True:
+            images: list[tuple[str, str, str | None]] = list((await self.session.execute(
+                select(Image.id, Image.extension, Image.storage_key)
+                .where(Image.width.is_(None), Image.deleted_at.is_(None), Image.id > last_id)
+                .order_by(Image.id)
+                .limit(batch_size)
+            )).all())
+            if not images:
+                return extracted
+            last_id = images[-1][0]
+            metadatas: list[dict | None] = await self.compute_metadatas(
+                [get_image_path(*image) for image in images], include_size=True
+            )
+            rows: list[dict] = [
+                {"id": id, **metadata} for (id, _, _), metadata in zip(images, metadatas) if metadata is not None
+            ]
+            if rows:
+                await self.session.execute(update(Image), rows)
+                await self.session.commit()
+            extracted += len(rows)
+
+
+class DerivativeService:
+    # Per-process locks so concurrent requests for a missing variant generate it once;
+    # across processes the atomic rename in generate_derivative keeps the result consistent.
+    _locks: dict[str, asyncio.Lock] = {}
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def generate(self, id: str, source_path: str) -> dict | None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(process_pool, generate_derivatives, source_path, id)
+
+    async def get_variant_path(self, image: ImageRead, variant: str) -> str:
+        if variant not in VARIANTS:
+            raise HTTPException(status_code=404, detail=f"Unknown variant: {variant}")
+        variant_path: str = get_derivative_path(image.id, variant)
+        if os.path.exists(variant_path):
+            return variant_path
+        lock: asyncio.Lock = self._locks.setdefault(variant_path, asyncio.Lock())
+        try:
+            async with lock:
+                if not os.path.exists(variant_path):
+                    loop = asyncio.get_running_loop()
+                    try:
+                        dimensions: dict = await loop.run_in_executor(
+                            process_pool, generate_derivative, get_image_path(image.id, image.extension, image.storage_key), image.id, variant
+                        )
+                    except Exception as e:
+                        raise HTTPException(status_code=500, detail=f"Error generating {variant} variant: {e}")
+                    await self.record_variant(image.id, variant, dimensions)
+        finally:
+            self._locks.pop(variant_path, None)
+        return variant_path
+
+    async def record_variant(self, id: str, variant: str, dimensions: dict):
+        image_in_db: Image | None = await self.session.get(Image, id)
+        if image_in_db is None:
+            return
+        image_in_db.variants = {**(image_in_db.variants or {}), variant: dimensions}
+        await self.session.commit()
+
+    async def backfill(self, batch_size: int = DERIVATIVES_BATCH_SIZE) -> int:
+        generated: int = 0
+        last_id: str = ""
+        while True:
+            images: list[tuple[str, str, str | None]] = list((await self.session.execute(
+                select(Image.id, Image.extension, Image.storage_key)
+                .where(Image.variants.is_(None), Image.deleted_at.is_(None), Image.id > last_id)
+                .order_by(Image.id)
+                .limit(batch_size)
+            )).all())
+            if not images:
+                return generated
+            last_id = images[-1][0]
+            variants: list[dict | None] = await asyncio.gather(
+                *(self.generate(image[0], get_image_path(*image)) for image in images)
+            )
+            rows: list[dict] = [
+                {"id": id, "variants": image_variants} 
+                for (id, _, _), image_variants in zip(images, variants) if image_variants is not None
+            ]
+            if rows:
+                await self.session.execute(update(Image), rows)
+                await self.session.commit()
+            generated += len(rows)
+
 
 class HarmfulContentDetectionService:
-     pass
\ No newline at end of file
+    # Screening runs beside the request path: uploads only enqueue, a single worker task
+    # gathers micro-batches (up to batch_size images or batch_window seconds, whichever
+    # comes first), scores them in the process pool and writes the scores back.
+    def __init__(
+            self, 
+            session_factory=AsyncSessionLocal, 
+            classifier: str = HARMFUL_CONTENT_CLASSIFIER, 
+            threshold: float = HARMFUL_CONTENT_THRESHOLD,
+            batch_size: int = SCREENING_BATCH_SIZE, 
+            batch_window: float = SCREENING_BATCH_WINDOW_SECONDS):
+        self.session_factory = session_factory
+        self.classifier = classifier
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.metrics = ScreeningMetrics()
+        self.queue: asyncio.Queue | None = None
+        self.tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self.run()), asyncio.create_task(self.enqueue_unscreened())]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def enqueue(self, image_id: str, file_path: str):
+        if self.queue is None:
+            return
+        self.queue.put_nowait((image_id, file_path, time.monotonic()))
+
+    def get_metrics(self) -> dict:
+        return self.metrics.snapshot(self.queue.qsize() if self.queue is not None else 0)
+
+    async def enqueue_unscreened(self):
+        # Images uploaded while no worker was running (or queued when one crashed) have no
+        # score yet; feed them in slowly so the backlog never floods the queue.
+        last_id: str = ""
+        while True:
+            while self.queue.qsize() >= self.batch_size * 4:
+                await asyncio.sleep(self.batch_window)
+            images: list[tuple[str, str, str | None]] = await self.get_unscreened(last_id, self.batch_size)
+            if not images:
+                return
+            last_id = images[-1][0]
+            for image in images:
+                self.enqueue(image[0], get_image_path(*image))
+
+    async def get_unscreened(self, last_id: str, limit: int) -> list[tuple[str, str, str | None]]:
+        async with self.session_factory() as session:
+            return list((await session.execute(
+                select(Image.id, Image.extension, Image.storage_key)
+                .where(Image.harm_score.is_(None), Image.deleted_at.is_(None), Image.id > last_id)
+                .order_by(Image.id)
+                .limit(limit)
+            )).all())
+
+    async def next_batch(self) -> list[tuple[str, str, float]]:
+        batch: list[tuple[str, str, float]] = [await self.queue.get()]
+        deadline: float = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            timeout: float = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: list[tuple[str, str, float]] = await self.next_batch()
+            try:
+                scores: list[float] = await loop.run_in_executor(
+                    process_pool, score_images, self.classifier, [file_path for _, file_path, _ in batch]
+                )
+                rows: list[dict] = [
+                    {"id": image_id, "harm_score": score, "flagged": score >= self.threshold} 
+                    for (image_id, _, _), score in zip(batch, scores)
+                ]
+                await self.save_scores(rows)
+            except Exception as e:
+                logger.exception(f"Error screening batch of {len(batch)} images: {e}")
+                self.metrics.record_failure()
+                continue
+            now: float = time.monotonic()
+            self.metrics.record_batch(
+                [now - enqueued_at for _, _, enqueued_at in batch], 
+                sum(1 for row in rows if row["flagged"])
+            )
+
+    async def save_scores(self, rows: list[dict]):
+        async with self.session_factory() as session:
+            await session.execute(update(Image), rows)
+            await session.commit()
+
+
+class GarbageCollectionService:
+    # Purges soft-deleted images in batches: derivative and legacy files are removed on a
+    # thread pool, blob references released (removing files nobody else points at), then the
+    # image rows and their labels are deleted and the label counters decremented, in one
+    # commit. Every step tolerates files that are already gone and the rows stay until the
+    # commit, so a crash at any point is fixed by simply running again.
+    # Batches are taken with SKIP LOCKED so each worker process can run its own collector.
+    def __init__(
+            self, 
+            session_factory=AsyncSessionLocal, 
+            storage: StorageBackend = storage,
+            batch_size: int = GC_BATCH_SIZE, 
+            workers: int = GC_WORKERS,
+            interval: float = GC_INTERVAL_SECONDS, 
+            grace_period: timedelta = GC_GRACE_PERIOD):
+        self.session_factory = session_factory
+        self.storage = storage
+        self.batch_size = batch_size
+        self.interval = interval
+        self.grace_period = grace_period
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=workers)
+        self.task: asyncio.Task | None = None
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        self.executor.shutdown()
+
+    async def run(self):
+        while True:
+            try:
+                await self.collect()
+            except Exception as e:
+                logger.exception(f"Error collecting deleted images: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def collect(self) -> int:
+        collected: int = 0
+        while purged := await self.collect_batch():
+            collected += purged
+        return collected
+
+    async def collect_batch(self) -> int:
+        loop = asyncio.get_running_loop()
+        async with self.session_factory() as session:
+            image_service: ImageService = ImageService(
+                session, DeduplicationService(session), DerivativeService(session), storage=self.storage
+            )
+            images: list[tuple[str, str, str | None]] = list((await session.execute(
+                select(Image.id, Image.extension, Image.storage_key)
+                .where(Image.deleted_at < datetime.now(timezone.utc) - self.grace_period)
+                .order_by(Image.deleted_at)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )).all())
+            if not images:
+                return 0
+            try:
+                await asyncio.gather(*(
+                    loop.run_in_executor(
+                        self.executor, 
+                        image_service.remove_files, 
+                        get_derivative_paths(id) + ([get_image_path(id, extension)] if storage_key is None else [])
+                    )
+                    for id, extension, storage_key in images
+                ))
+                storage_keys: list[str] = [storage_key for _, _, storage_key in images if storage_key is not None]
+                if storage_keys:
+                    await image_service.release_blobs(storage_keys)
+                ids: list[str] = [id for id, _, _ in images]
+                await self.delete_labels(session, image_service.stats_service, ids)
+                await session.execute(delete(Image).where(Image.id.in_(ids)))
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+        return len(images)
+
+    async def delete_labels(self, session: AsyncSession, stats_service: StatsService, ids: list[str]):
+        # Does not commit. The image counters already moved when the images were soft-deleted;
+        # the label, gender, tag and day counters move here, when the labels themselves go.
+        label_ids = select(ImageLabel.id).where(ImageLabel.image_id.in_(ids))
+        stats: Counter = Counter()
+        for gender, date_created in await session.execute(
+            select(ImageLabel.gender, ImageLabel.date_created).where(ImageLabel.image_id.in_(ids))
+        ):
+            stats[(STATS_LABELS, "total")] -= 1
+            stats[(STATS_GENDER, gender)] -= 1
+            stats[(STATS_DAY, day_key(date_created))] -= 1
+        if not stats:
+            return
+        for name, count in await session.execute(
+            select(Tag.name, func.count())
+            .join(ImageLabelTag, ImageLabelTag.tag_id == Tag.id)
+            .where(ImageLabelTag.image_label_id.in_(label_ids))
+            .group_by(Tag.name)
+        ):
+            stats[(STATS_TAG, name)] -= count
+        await session.execute(delete(ImageLabelTag).where(ImageLabelTag.image_label_id.in_(label_ids)))
+        await session.execute(delete(ImageLabel).where(ImageLabel.image_id.in_(ids)))
+        await stats_service.increment(stats)
+
+
+class ExportService:
+    # One export per name at a time within this process
+    _locks: dict[str, asyncio.Lock] = {}
+
+    def __init__(
+            self, 
+            session_factory=AsyncSessionLocal, 
+            max_shard_bytes: int = DEFAULT_MAX_SHARD_BYTES, 
+            workers: int = EXPORT_WORKERS):
+        self.session_factory = session_factory
+        self.max_shard_bytes = max_shard_bytes
+        self.workers = workers
+
+    def get_manifest(self, name: str) -> dict | None:
+        return load_manifest(name)
+
+    def is_running(self, name: str) -> bool:
+        lock: asyncio.Lock | None = self._locks.get(name)
+        return lock is not None and lock.locked()
+
+    def check_format(self, name: str, format: str):
+        if format not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unknown export format: {format}")
+        manifest: dict | None = load_manifest(name)
+        if manifest is not None and manifest["format"] != format:
+            raise HTTPException(status_code=409, detail=f"Export {name} is in {manifest['format']} format")
+
+    async def export(self, name: str, format: str) -> dict:
+        self.check_format(name, format)
+        lock: asyncio.Lock = self._locks.setdefault(name, asyncio.Lock())
+        if lock.locked():
+            raise HTTPException(status_code=409, detail=f"Export {name} is already running")
+        async with lock:
+            return await self.run_export(name, format)
+
+    async def run_export(self, name: str, format: str) -> dict:
+        # Labels are streamed in (date_created, id) order and cut into shards of roughly
+        # max_shard_bytes of image data. Shards are written by a pool of threads but recorded
+        # in the manifest strictly in order, so its watermark is always a safe resume point
+        # and the next run only exports labels created after it.
+        os.makedirs(get_export_dir(name), exist_ok=True)
+        manifest: dict = load_manifest(name) or new_manifest(format, self.max_shard_bytes)
+        remove_partial_shards(name)
+        statement = (
+            select(ImageLabel, Image.extension, Image.storage_key, Image.width, Image.height, Image.format, Image.mode)
+            .join(Image, Image.id == ImageLabel.image_id)
+            .options(*LABEL_TAGS_LOADER)
+            .where(Image.deleted_at.is_(None))
+            .where(ImageLabel.date_created < datetime.now(timezone.utc) - EXPORT_SETTLE_DELAY)
+            .order_by(ImageLabel.date_created, ImageLabel.id)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        if manifest["watermark"] is not None:
+            statement = statement.where(after_cursor(ImageLabel.date_created, ImageLabel.id, manifest["watermark"]))
+
+        loop = asyncio.get_running_loop()
+        in_flight: deque[tuple[asyncio.Future, str]] = deque()
+        records: list[dict] = []
+        shard_bytes: int = 0
+        watermark: str | None = manifest["watermark"]
+
+        def submit_shard():
+            index: int = len(manifest["shards"]) + len(in_flight)
+            in_flight.append((loop.run_in_executor(executor, write_shard, name, index, format, records), watermark))
+
+        async def record_oldest_shard():
+            future, shard_watermark = in_flight.popleft()
+            shard: dict = await future
+            manifest["shards"].append(shard)
+            manifest["rows"] += shard["rows"]
+            manifest["watermark"] = shard_watermark
+            save_manifest(name, manifest)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            async with self.session_factory() as session:
+                result = await session.stream(statement)
+                async for partition in result.partitions():
+                    images: list[bytes | None] = await asyncio.gather(*(
+                        loop.run_in_executor(executor, read_image_bytes, get_image_path(image_label.image_id, extension, storage_key))
+                        for image_label, extension, storage_key, *_ in partition
+                    ))
+                    for (image_label, extension, _, width, height, image_format, mode), image in zip(partition, images):
+                        if image is None:
+                            logger.warning(f"Export {name}: file for image {image_label.image_id} is missing, skipping")
+                            manifest["skipped"] += 1
+                            continue
+                        records.append({
+                            **ImageLabelResponse.from_image_label(image_label).model_dump(),
+                            "date_created": image_label.date_created.isoformat(),
+                            "extension": extension,
+                            "width": width,
+                            "height": height,
+                            "format": image_format,
+                            "mode": mode,
+                            "image": image,
+                        })
+                        shard_bytes += len(image)
+                        watermark = encode_cursor(image_label.date_created, image_label.id)
+                        if shard_bytes >= self.max_shard_bytes:
+                            submit_shard()
+                            records, shard_bytes = [], 0
+                            while len(in_flight) >= self.workers:
+                                await record_oldest_shard()
+            if records:
+                submit_shard()
+            while in_flight:
+                await record_oldest_shard()
+        save_manifest(name, manifest)
+        return manifest
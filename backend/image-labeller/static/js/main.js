@@ -1,10 +1,23 @@
-const API_URL = "http://0.0.0.0:8000/images/label/";
+// Relative so the annotator cookie travels with every call, whatever host served the page
+const API_URL = "/images/label/";
+const PREFETCH_URL = "/images/prefetch";
+const SUGGESTED_TAGS_URL = (imageId) => "/images/" + imageId + "/suggested_tags";
 const API_KEY = "1234";
+// Images kept ready in the browser, and the queue length at which more are requested
+const PREFETCH_COUNT = 5;
+const PREFETCH_LOW_WATER = 2;
 
 const imageTagsInput = document.getElementById('imageTagsInput');
 const imageTagsList = document.getElementById('imageTagsList');
-const imageTags = document.querySelectorAll('.image-tag');
 const tagsList = document.querySelector('.image-container__image-tags');
+const imageResult = document.getElementById('imageResult');
+const imageResultSource = document.getElementById('imageResultSource');
+const suggestedTagsList = document.getElementById('suggestedTags');
+
+// Prefetched images waiting to be shown, and ids submitted but not yet confirmed
+let imageQueue = [];
+const pendingImageIds = new Set();
+let prefetching = null;
 
 // Show dropdown list when the input field is focused
 imageTagsInput.addEventListener('focus', () => {
@@ -16,12 +29,12 @@ imageTagsInput.addEventListener('focus', () => {
 //   imageTagsList.classList.add('hidden');
 // });
 
-// Update input value on selection and hide list
-imageTags.forEach(imageTag => {
-  imageTag.addEventListener('click', (e) => {
+// Update input value on selection and hide list; delegated so re-rendered tags keep working
+imageTagsList.addEventListener('click', (e) => {
+  if (e.target.classList.contains('image-tag')) {
     imageTagsInput.value = e.target.textContent;
     imageTagsList.classList.add('hidden');
-  });
+  }
 });
 
 // Filter options as the user types
@@ -29,7 +42,7 @@ imageTagsInput.addEventListener('input', (e) => {
   const filter = e.target.value.toLowerCase();
   let hasVisibleOptions = false;
 
-  imageTags.forEach(imageTag => {
+  document.querySelectorAll('.image-tag').forEach(imageTag => {
     const text = imageTag.textContent.toLowerCase();
     if (text.includes(filter)) {
       imageTag.classList.remove('hidden');
@@ -68,8 +81,14 @@ function closeTagModal(){
 function addTag(){
     const selectedTag = document.getElementById('imageTagsInput').value;
     console.log(selectedTag);
+    appendTag(selectedTag);
+    const tagModal = document.querySelector('.tag-modal');
+    tagModal.classList.remove('show');
+}
+
+function appendTag(selectedTag){
     let currentTags = []
-    const imageTags = document.querySelectorAll(".image-tags__tag")
+    const imageTags = tagsList.querySelectorAll(".image-tags__tag")
     imageTags.forEach((imageTag) => {
         currentTags.push(imageTag.textContent.toLowerCase().trim());
     })
@@ -80,10 +99,40 @@ function addTag(){
         const tagsList = document.querySelector('.image-container__image-tags');
         tagsList.appendChild(newTag);
     }
-    const tagModal = document.querySelector('.tag-modal');
-    tagModal.classList.remove('show');
 }
 
+function loadSuggestedTags(imageId){
+  suggestedTagsList.replaceChildren();
+  if (!imageId) {
+    return;
+  }
+  fetch(SUGGESTED_TAGS_URL(imageId), {headers: {'X-API-KEY': API_KEY}})
+  .then(response => response.json())
+  .then(data => {
+    // The annotator may have moved on while suggestions were computed
+    if (data.image_id !== currentImageId() || !data.tags) {
+      return;
+    }
+    suggestedTagsList.replaceChildren(...data.tags.map((tag) => {
+      const suggestedTag = document.createElement('div');
+      suggestedTag.classList.add('image-tags__tag', 'image-tags__tag--suggested');
+      suggestedTag.textContent = tag.name;
+      suggestedTag.title = Math.round(tag.score * 100) + '% of similar images';
+      return suggestedTag;
+    }));
+  })
+  .catch((error) => {
+    console.error('Error:', error);
+  });
+}
+
+suggestedTagsList.addEventListener('click', (e) => {
+  if (e.target.classList.contains('image-tags__tag--suggested')) {
+    appendTag(e.target.textContent);
+    e.target.remove();
+  }
+})
+
 //delete tag
 tagsList.addEventListener('click', (e) => {
     if (e.target.classList.contains('image-tags__tag')) {
@@ -91,19 +140,101 @@ tagsList.addEventListener('click', (e) => {
     }
 })
 
+function renderTags(version, tags){
+  if (String(version) === imageTagsList.dataset.tagsVersion) {
+    return;
+  }
+  imageTagsList.replaceChildren(...tags.concat(["None"]).map((tag) => {
+    const imageTag = document.createElement('li');
+    imageTag.classList.add('image-tag');
+    imageTag.textContent = tag;
+    return imageTag;
+  }));
+  imageTagsList.dataset.tagsVersion = version;
+}
+
+function currentImageId(){
+  return imageResult.getAttribute('data-image-id');
+}
+
+function prefetch(){
+  // One request in flight at a time; callers share it
+  if (prefetching) {
+    return prefetching;
+  }
+  prefetching = fetch(PREFETCH_URL + '?count=' + PREFETCH_COUNT, {
+    method: 'POST',
+    headers: {'X-API-KEY': API_KEY},
+  })
+  .then(response => response.json())
+  .then(data => {
+    const queuedIds = new Set(imageQueue.map(image => image.id));
+    data.images.forEach((image) => {
+      // Held leases come back too: skip the image on screen and those already submitted
+      if (image.id === currentImageId() || pendingImageIds.has(image.id) || queuedIds.has(image.id)) {
+        return;
+      }
+      image.preloaded = new Image();
+      image.preloaded.src = image.image_url;
+      imageQueue.push(image);
+    });
+    renderTags(data.tags_version, data.tags);
+  })
+  .catch((error) => {
+    console.error('Error:', error);
+  })
+  .finally(() => {
+    prefetching = null;
+  });
+  return prefetching;
+}
+
+function showImage(image){
+  imageResultSource.srcset = image ? image.image_url : '';
+  imageResult.src = image ? image.fallback_url : '';
+  imageResult.setAttribute('data-image-id', image ? image.id : '');
+  loadSuggestedTags(image ? image.id : null);
+}
+
+function resetForm(){
+  document.getElementById('prompt').value = '';
+  tagsList.replaceChildren();
+}
+
+async function showNextImage(){
+  if (imageQueue.length === 0) {
+    await prefetch();
+  }
+  const image = imageQueue.shift();
+  showImage(image);
+  if (!image) {
+    alert('No more images to label!');
+    return;
+  }
+  if (imageQueue.length <= PREFETCH_LOW_WATER) {
+    prefetch();
+  }
+}
+
 function submit(){
   const prompt = document.getElementById('prompt').value;
   if (prompt === '') {
     alert('Please enter a valid image description!');
     return;
   }
+  const imageId = currentImageId();
+  if (!imageId) {
+    alert('No image to label!');
+    return;
+  }
   const gender = document.getElementById('dropdownGender').value;
-  const imageId = document.querySelector('.image-container__image-result').getAttribute('data-image-id');
-  const rawTags = document.querySelectorAll('.image-tags__tag');
+  const rawTags = tagsList.querySelectorAll('.image-tags__tag');
   let tags = [];
   rawTags.forEach((rawTag) => {
     tags.push(rawTag.textContent.trim());
   })
+  // The label is saved in the background while the next (already loaded) image is shown
+  pendingImageIds.add(imageId);
   fetch(API_URL + imageId, {
     method: 'POST',
     headers: {
@@ -112,12 +243,24 @@ function submit(){
     },
     body: JSON.stringify({description: prompt, gender: gender, tags: tags}),
   })
-  .then(response => response.json())
+  .then(response => {
+    if (!response.ok) {
+      throw new Error('Labelling ' + imageId + ' failed with status ' + response.status);
+    }
+    return response.json();
+  })
   .then(data => {
     console.log('Success:', data);
-    window.location.reload();
   })
   .catch((error) => {
     console.error('Error:', error);
+    alert('Could not save the label for the previous image, it will be offered again later.');
+  })
+  .finally(() => {
+    pendingImageIds.delete(imageId);
   });
-}
\ No newline at end of file
+  resetForm();
+  showNextImage();
+}
+
+prefetch();
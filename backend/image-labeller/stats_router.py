@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from services import StatsService
+from fastapi import Depends
+from schemas import StatsResponse
+from helpers import get_stats_service
+
+router = APIRouter(
+    tags=["Statistics"],
+)
+
+@router.get("/stats", response_model=StatsResponse)
+async def get_stats(stats_service: StatsService = Depends(get_stats_service)):
+    # Reads the running counters only, so the cost does not grow with the number of labels
+    return await stats_service.get_stats()
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import uuid
+from abc import ABC, abstractmethod
+
+
+def make_key(sha256: str, extension: str) -> str:
+    # Two levels of 256-way sharding keep every directory small even at millions of files
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}.{extension}"
+
+
+class StorageBackend(ABC):
+    # Content-addressed blob store. Uploads are staged to a local temporary file, hashed,
+    # then published under their key; publishing an existing key just drops the staged copy.
+
+    @abstractmethod
+    def staging_path(self, extension: str) -> str:
+        ...
+
+    @abstractmethod
+    async def put(self, staged_path: str, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def local_path(self, key: str) -> str:
+        # Path CPU workers can open; a remote backend would return a local cache entry
+        ...
+
+    @abstractmethod
+    def url_path(self, key: str) -> str:
+        ...
+
+
+class LocalDiskStorage(StorageBackend):
+    def __init__(self, root: str = "data"):
+        self.root = root
+        self.staging_dir = os.path.join(root, ".staging")
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def staging_path(self, extension: str) -> str:
+        return os.path.join(self.staging_dir, f"{uuid.uuid4()}.{extension}")
+
+    async def put(self, staged_path: str, key: str) -> bool:
+        return await asyncio.to_thread(self.put_sync, staged_path, key)
+
+    def put_sync(self, staged_path: str, key: str) -> bool:
+        target_path: str = self.local_path(key)
+        if os.path.exists(target_path):
+            os.remove(staged_path)
+            return False
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        os.replace(staged_path, target_path)
+        return True
+
+    async def delete(self, key: str):
+        try:
+            await asyncio.to_thread(os.remove, self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.local_path(key))
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def url_path(self, key: str) -> str:
+        return key
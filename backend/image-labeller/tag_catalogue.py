@@ -0,0 +1,64 @@
+import asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import Tag, CatalogueVersion, dialect_insert
+from schemas import TagRead
+
+
+TAGS_CATALOGUE: str = "tags"
+
+
+class TagCatalogue:
+    def __init__(self, name: str = TAGS_CATALOGUE):
+        self.name = name
+        self._lock = asyncio.Lock()
+        # (version, tags, name -> id); swapped as a whole so readers never see a half update
+        self._snapshot: tuple[int, list[TagRead], dict[str, str]] | None = None
+
+    async def get_version(self, session: AsyncSession) -> int:
+        version: int | None = await session.scalar(
+            select(CatalogueVersion.version).where(CatalogueVersion.name == self.name)
+        )
+        return version or 0
+
+    async def refresh(self, session: AsyncSession) -> tuple[int, list[TagRead], dict[str, str]]:
+        # The version is read before the tags, so the cached version can only ever lag
+        # the cached contents; a write in between is picked up on the next refresh.
+        version: int = await self.get_version(session)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot[0] == version:
+            return snapshot
+        async with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot[0] != version:
+                tags: list[TagRead] = [
+                    TagRead(id=id, name=name) 
+                    for id, name in await session.execute(select(Tag.id, Tag.name).order_by(Tag.name))
+                ]
+                snapshot = (version, tags, {tag.name: tag.id for tag in tags})
+                self._snapshot = snapshot
+        return snapshot
+
+    async def get_tags(self, session: AsyncSession) -> tuple[int, list[TagRead]]:
+        version, tags, _ = await self.refresh(session)
+        return version, tags
+
+    async def get_ids(self, session: AsyncSession, names: set[str]) -> dict[str, str]:
+        _, _, ids_by_name = await self.refresh(session)
+        return {name: ids_by_name[name] for name in names if name in ids_by_name}
+
+    async def bump_version(self, session: AsyncSession):
+        # Runs inside the caller's transaction so the bump commits (or rolls back) with the write
+        upsert = dialect_insert(session)
+        await session.execute(
+            upsert(CatalogueVersion)
+            .values(name=self.name, version=1)
+            .on_conflict_do_update(index_elements=["name"], set_={"version": CatalogueVersion.version + 1})
+        )
+
+    def invalidate(self):
+        # Plain assignment is atomic on the event loop; the next refresh reloads
+        self._snapshot = None
+
+
+tag_catalogue: TagCatalogue = TagCatalogue()
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Request, Response, status
+from services import TagService
+from fastapi import Depends
+from schemas import TagCatalogueResponse
+from helpers import get_tag_service
+
+router = APIRouter(
+    tags=["Tag Operations"],
+)
+
+@router.get("/tags", response_model=TagCatalogueResponse)
+async def get_tags(request: Request, response: Response, tag_service: TagService = Depends(get_tag_service)):
+    version, tags = await tag_service.get_catalogue()
+    etag: str = f'"tags-{version}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    # Clients may keep the payload but must revalidate it; unchanged catalogues cost a 304
+    response.headers["Cache-Control"] = "no-cache"
+    return TagCatalogueResponse(version=version, tags=tags)